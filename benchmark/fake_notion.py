@@ -0,0 +1,737 @@
+"""本地模拟的Notion API，用于离线测试和性能测试
+
+实现了本项目用到的接口：databases.query/retrieve/create/update、
+pages.create/retrieve/update、blocks.children.list/append、blocks.retrieve/update/delete，
+支持分页、常用的查询条件、filter_properties，以及延迟和429注入。
+
+    python -m benchmark.fake_notion --port 8790 --latency 0.05 --rate 3
+
+启动后设置 NOTION_BASE_URL=http://127.0.0.1:8790，NOTION_PAGE为打印的页面地址。
+"""
+import argparse
+import collections
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+MAX_PAGE_SIZE = 100
+HEATMAP_URL = "https://heatmap.malinkang.com/?image=fake"
+DEFAULT_ANNOTATIONS = {
+    "bold": False,
+    "italic": False,
+    "strikethrough": False,
+    "underline": False,
+    "code": False,
+    "color": "default",
+}
+PROPERTY_TYPES = (
+    "title",
+    "rich_text",
+    "number",
+    "select",
+    "status",
+    "multi_select",
+    "date",
+    "relation",
+    "url",
+    "files",
+    "checkbox",
+    "email",
+    "phone_number",
+)
+LIST_TYPES = ("title", "rich_text", "relation", "multi_select", "files")
+CALENDAR_RELATIONS = {"年": "relation", "月": "relation", "周": "relation", "日": "relation"}
+# 和模板一致的数据库，写入时遇到不存在的属性会自动添加
+TEMPLATE_DATABASES = {
+    "书架": {
+        "书名": "title",
+        "BookId": "rich_text",
+        "ISBN": "rich_text",
+        "链接": "url",
+        "作者": "relation",
+        "Sort": "number",
+        "评分": "number",
+        "封面": "files",
+        "分类": "relation",
+        "阅读状态": "status",
+        "阅读时长": "number",
+        "阅读进度": "number",
+        "阅读天数": "number",
+        "时间": "date",
+        "开始阅读时间": "date",
+        "最后阅读时间": "date",
+        "简介": "rich_text",
+        "书架分类": "select",
+        "我的评分": "select",
+        "豆瓣链接": "url",
+        "豆瓣短评": "rich_text",
+        **CALENDAR_RELATIONS,
+    },
+    "划线": {
+        "Name": "title",
+        "bookId": "rich_text",
+        "range": "rich_text",
+        "bookmarkId": "rich_text",
+        "blockId": "rich_text",
+        "chapterUid": "number",
+        "bookVersion": "number",
+        "colorStyle": "number",
+        "type": "number",
+        "style": "number",
+        "书籍": "relation",
+        "Date": "date",
+        **CALENDAR_RELATIONS,
+    },
+    "笔记": {
+        "Name": "title",
+        "bookId": "rich_text",
+        "reviewId": "rich_text",
+        "blockId": "rich_text",
+        "range": "rich_text",
+        "abstract": "rich_text",
+        "chapterUid": "number",
+        "bookVersion": "number",
+        "type": "number",
+        "star": "number",
+        "书籍": "relation",
+        "Date": "date",
+        **CALENDAR_RELATIONS,
+    },
+    "章节": {
+        "Name": "title",
+        "blockId": "rich_text",
+        "chapterUid": "number",
+        "chapterIdx": "number",
+        "readAhead": "number",
+        "updateTime": "number",
+        "level": "number",
+        "书籍": "relation",
+    },
+    "分类": {"标题": "title"},
+    "作者": {"标题": "title"},
+}
+# 年月周日放在一个折叠块里，和模板一样需要递归查找
+CALENDAR_DATABASES = {
+    "年": {"标题": "title", "日期": "date"},
+    "月": {"标题": "title", "日期": "date"},
+    "周": {"标题": "title", "日期": "date"},
+    "日": {
+        "标题": "title",
+        "日期": "date",
+        "时长": "number",
+        "时间戳": "number",
+        "年": "relation",
+        "月": "relation",
+        "周": "relation",
+    },
+}
+ROUTES = [
+    ("POST", r"/v1/databases/([^/]+)/query", "databases.query"),
+    ("GET", r"/v1/databases/([^/]+)", "databases.retrieve"),
+    ("PATCH", r"/v1/databases/([^/]+)", "databases.update"),
+    ("POST", r"/v1/databases", "databases.create"),
+    ("POST", r"/v1/pages", "pages.create"),
+    ("GET", r"/v1/pages/([^/]+)", "pages.retrieve"),
+    ("PATCH", r"/v1/pages/([^/]+)", "pages.update"),
+    ("GET", r"/v1/blocks/([^/]+)/children", "blocks.children.list"),
+    ("PATCH", r"/v1/blocks/([^/]+)/children", "blocks.children.append"),
+    ("GET", r"/v1/blocks/([^/]+)", "blocks.retrieve"),
+    ("PATCH", r"/v1/blocks/([^/]+)", "blocks.update"),
+    ("DELETE", r"/v1/blocks/([^/]+)", "blocks.delete"),
+]
+
+
+class NotionError(Exception):
+    def __init__(self, status, code, message):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+
+
+def key(id):
+    return id.replace("-", "") if id else id
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace(
+        "+00:00", "Z"
+    )
+
+
+def to_rich_text(items):
+    result = []
+    for item in items or []:
+        item = dict(item)
+        item.setdefault("type", "text")
+        if item["type"] == "text":
+            item["plain_text"] = item.get("text", {}).get("content", "")
+        item.setdefault("plain_text", "")
+        item.setdefault("annotations", DEFAULT_ANNOTATIONS)
+        item.setdefault("href", None)
+        result.append(item)
+    return result
+
+
+def infer_type(value):
+    for type in PROPERTY_TYPES:
+        if type in value:
+            return type
+    raise NotionError(400, "validation_error", f"无法识别的属性: {value}")
+
+
+def plain_value(property):
+    """属性的比较值"""
+    type = property.get("type")
+    content = property.get(type)
+    if type in ("title", "rich_text"):
+        return "".join(x.get("plain_text", "") for x in content)
+    if type == "relation":
+        return [key(x.get("id")) for x in content]
+    if type in ("select", "status"):
+        return content.get("name") if content else None
+    if type == "date":
+        return content.get("start") if content else None
+    return content
+
+
+def match(page, filter):
+    """计算查询条件"""
+    if not filter:
+        return True
+    if "and" in filter:
+        return all(match(page, x) for x in filter["and"])
+    if "or" in filter:
+        return any(match(page, x) for x in filter["or"])
+    if "timestamp" in filter:
+        value = page.get(filter["timestamp"])
+        condition = filter[filter["timestamp"]]
+        return compare(value, condition)
+    property = page["properties"].get(filter.get("property"))
+    if property is None:
+        raise NotionError(
+            400, "validation_error", f"Could not find property {filter.get('property')}"
+        )
+    value = plain_value(property)
+    for type in ("title", "rich_text", "number", "relation", "select", "status", "checkbox"):
+        if type in filter:
+            condition = filter[type]
+            if type == "relation":
+                condition = {k: key(v) if isinstance(v, str) else v for k, v in condition.items()}
+            return compare(value, condition)
+    raise NotionError(400, "validation_error", f"不支持的查询条件: {filter}")
+
+
+def compare(value, condition):
+    for operator, expected in condition.items():
+        if operator == "is_empty":
+            return value in (None, "", [])
+        if operator == "is_not_empty":
+            return value not in (None, "", [])
+        if operator == "equals":
+            return value == expected
+        if operator == "does_not_equal":
+            return value != expected
+        if operator == "contains":
+            return value is not None and expected in value
+        if operator == "does_not_contain":
+            return value is None or expected not in value
+        if operator in ("greater_than", "after"):
+            return value is not None and value > expected
+        if operator in ("less_than", "before"):
+            return value is not None and value < expected
+        if operator in ("greater_than_or_equal_to", "on_or_after"):
+            return value is not None and value >= expected
+        if operator in ("less_than_or_equal_to", "on_or_before"):
+            return value is not None and value <= expected
+    raise NotionError(400, "validation_error", f"不支持的查询条件: {condition}")
+
+
+class FakeNotion:
+    """保存在内存中的Notion工作区"""
+
+    def __init__(self, latency=0.0, rate=None, rate_limit_probability=0.0, retry_after=1, seed=0):
+        self.latency = latency
+        self.rate = rate
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.objects = {}
+        self.children = collections.defaultdict(list)
+        self.rows = collections.defaultdict(list)
+        self.property_counter = itertools.count(1)
+        self.stats = collections.Counter()
+        self.rate_limited = 0
+        self.tokens = rate or 0
+        self.last_refill = time.monotonic()
+        self.root_id = self.create_template()
+
+    # 模板
+
+    def create_template(self):
+        root = {
+            "object": "page",
+            "id": str(uuid.uuid4()),
+            "parent": {"type": "workspace", "workspace": True},
+            "properties": {"title": {"id": "title", "type": "title", "title": to_rich_text([{"text": {"content": "微信读书"}}])}},
+            "archived": False,
+            "in_trash": False,
+            "created_time": now(),
+            "last_edited_time": now(),
+        }
+        self.objects[key(root["id"])] = root
+        parent = {"type": "page_id", "page_id": root["id"]}
+        self.append_children(root["id"], [{"type": "embed", "embed": {"url": HEATMAP_URL}}])
+        for name, schema in TEMPLATE_DATABASES.items():
+            self.create_database(parent, name, schema)
+        toggle = self.append_children(
+            root["id"],
+            [{"type": "toggle", "toggle": {"rich_text": [{"text": {"content": "日历"}}]}}],
+        )[0]
+        toggle_parent = {"type": "block_id", "block_id": toggle["id"]}
+        for name, schema in CALENDAR_DATABASES.items():
+            self.create_database(toggle_parent, name, schema)
+        return root["id"]
+
+    @property
+    def page_url(self):
+        return f"https://www.notion.so/weread-{key(self.root_id)}"
+
+    def create_database(self, parent, name, schema):
+        properties = {}
+        for property_name, type in schema.items():
+            properties[property_name] = {type: {}}
+        return self.databases_create(
+            None,
+            {
+                "parent": parent,
+                "title": [{"type": "text", "text": {"content": name}}],
+                "properties": properties,
+            },
+            {},
+        )
+
+    # 工具方法
+
+    def get(self, id, object=None):
+        item = self.objects.get(key(id))
+        if item is None or (object and item["object"] != object):
+            raise NotionError(404, "object_not_found", f"Could not find {object or 'block'} with ID: {id}.")
+        return item
+
+    def make_schema_property(self, name, value):
+        type = infer_type(value)
+        id = "title" if type == "title" else f"p{next(self.property_counter)}"
+        return {"id": id, "name": name, "type": type, type: value.get(type) or {}}
+
+    def to_property(self, database, name, value):
+        schema = database["properties"].get(name)
+        if schema is None:
+            # 模拟的数据库比较宽松，自动添加不存在的属性
+            schema = self.make_schema_property(name, {infer_type(value): {}})
+            database["properties"][name] = schema
+        type = schema["type"]
+        content = value.get(type, value.get(infer_type(value)))
+        if type in ("title", "rich_text"):
+            content = to_rich_text(content)
+        elif type == "relation":
+            content = [{"id": x["id"]} for x in content or []]
+        result = {"id": schema["id"], "type": type, type: content}
+        if type == "relation":
+            result["has_more"] = False
+        return result
+
+    def empty_property(self, schema):
+        type = schema["type"]
+        result = {"id": schema["id"], "type": type, type: [] if type in LIST_TYPES else None}
+        if type == "relation":
+            result["has_more"] = False
+        return result
+
+    def render_page(self, page, property_ids=None):
+        """返回页面，补全数据库中有但是页面没有的属性"""
+        page = dict(page)
+        parent = page.get("parent", {})
+        if parent.get("type") == "database_id":
+            database = self.get(parent["database_id"], "database")
+            properties = {}
+            for name, schema in database["properties"].items():
+                if property_ids is not None and schema["id"] not in property_ids:
+                    continue
+                properties[name] = page["properties"].get(name) or self.empty_property(schema)
+            page["properties"] = properties
+        return page
+
+    def make_block(self, data, parent):
+        type = data.get("type") or infer_block_type(data)
+        content = dict(data.get(type) or {})
+        nested = content.pop("children", None)
+        if "rich_text" in content:
+            content["rich_text"] = to_rich_text(content["rich_text"])
+        if type == "callout" and content.get("icon"):
+            content["icon"] = {"type": "emoji", **content["icon"]}
+        block = {
+            "object": "block",
+            "id": str(uuid.uuid4()),
+            "parent": parent,
+            "type": type,
+            type: content,
+            "has_children": False,
+            "archived": False,
+            "in_trash": False,
+            "created_time": now(),
+            "last_edited_time": now(),
+        }
+        self.objects[key(block["id"])] = block
+        if nested:
+            self.append_children(block["id"], nested)
+        return block
+
+    def get_parent(self, id):
+        item = self.get(id)
+        if item["object"] == "page":
+            return {"type": "page_id", "page_id": item["id"]}
+        return {"type": "block_id", "block_id": item["id"]}
+
+    def append_children(self, id, children, after=None):
+        parent = self.get(id)
+        blocks = [self.make_block(x, self.get_parent(id)) for x in children]
+        siblings = self.children[key(id)]
+        index = len(siblings)
+        if after:
+            if key(after) not in siblings:
+                raise NotionError(400, "validation_error", f"Block {after} is not a child of {id}.")
+            index = siblings.index(key(after)) + 1
+        siblings[index:index] = [key(x["id"]) for x in blocks]
+        parent["has_children"] = True
+        parent["last_edited_time"] = now()
+        return blocks
+
+    def archive(self, item):
+        item["archived"] = True
+        item["in_trash"] = True
+        item["last_edited_time"] = now()
+        parent = item.get("parent", {})
+        parent_id = parent.get(parent.get("type"))
+        if isinstance(parent_id, str) and key(item["id"]) in self.children.get(key(parent_id), []):
+            self.children[key(parent_id)].remove(key(item["id"]))
+
+    def paginate(self, items, body):
+        start = int(body.get("start_cursor") or 0)
+        size = min(int(body.get("page_size") or MAX_PAGE_SIZE), MAX_PAGE_SIZE)
+        page = items[start : start + size]
+        has_more = start + size < len(items)
+        return {
+            "object": "list",
+            "results": page,
+            "next_cursor": str(start + size) if has_more else None,
+            "has_more": has_more,
+        }
+
+    # 接口
+
+    def databases_create(self, id, body, query):
+        parent = body.get("parent")
+        parent_id = parent.get(parent.get("type"))
+        self.get(parent_id)
+        database = {
+            "object": "database",
+            "id": str(uuid.uuid4()),
+            "parent": parent,
+            "title": to_rich_text(body.get("title")),
+            "icon": body.get("icon"),
+            "properties": {},
+            "archived": False,
+            "created_time": now(),
+            "last_edited_time": now(),
+        }
+        for name, value in body.get("properties", {}).items():
+            database["properties"][name] = self.make_schema_property(name, value)
+        self.objects[key(database["id"])] = database
+        title = "".join(x["plain_text"] for x in database["title"])
+        block = {
+            "object": "block",
+            "id": database["id"],
+            "parent": parent,
+            "type": "child_database",
+            "child_database": {"title": title},
+            "has_children": False,
+            "archived": False,
+        }
+        self.children[key(parent_id)].append(key(database["id"]))
+        self.objects[key(parent_id)]["has_children"] = True
+        self.objects[f"block:{key(database['id'])}"] = block
+        return database
+
+    def databases_retrieve(self, id, body, query):
+        return self.get(id, "database")
+
+    def databases_update(self, id, body, query):
+        database = self.get(id, "database")
+        for name, value in body.get("properties", {}).items():
+            if value is None:
+                database["properties"].pop(name, None)
+            elif name in database["properties"] and infer_type(value) == database["properties"][name]["type"]:
+                continue
+            else:
+                database["properties"][name] = self.make_schema_property(name, value)
+        if body.get("title"):
+            database["title"] = to_rich_text(body["title"])
+        database["last_edited_time"] = now()
+        return database
+
+    def databases_query(self, id, body, query):
+        # 数据库不存在时返回404
+        self.get(id, "database")
+        pages = [self.objects[x] for x in self.rows[key(id)]]
+        pages = [self.render_page(x) for x in pages if not x["archived"]]
+        filter = body.get("filter")
+        pages = [x for x in pages if match(x, filter)]
+        for sort in reversed(body.get("sorts") or []):
+            if "timestamp" in sort:
+                sort_key = lambda x, name=sort["timestamp"]: x.get(name) or ""
+            else:
+                sort_key = lambda x, name=sort["property"]: sortable(plain_value(x["properties"][name]))
+            pages.sort(key=sort_key, reverse=sort.get("direction") == "descending")
+        response = self.paginate(pages, body)
+        property_ids = query.get("filter_properties")
+        if property_ids:
+            property_ids = {unquote(x) for x in property_ids}
+            response["results"] = [self.render_page(x, property_ids) for x in response["results"]]
+        response["type"] = "page_or_database"
+        response["page_or_database"] = {}
+        return response
+
+    def pages_create(self, id, body, query):
+        parent = body.get("parent")
+        database_id = parent.get("database_id")
+        page = {
+            "object": "page",
+            "id": str(uuid.uuid4()),
+            "parent": {"type": "database_id", "database_id": self.get(database_id, "database")["id"]},
+            "properties": {},
+            "icon": body.get("icon"),
+            "cover": body.get("cover"),
+            "archived": False,
+            "in_trash": False,
+            "created_time": now(),
+            "last_edited_time": now(),
+        }
+        database = self.get(database_id, "database")
+        for name, value in body.get("properties", {}).items():
+            page["properties"][name] = self.to_property(database, name, value)
+        page["url"] = f"https://www.notion.so/{key(page['id'])}"
+        self.objects[key(page["id"])] = page
+        self.rows[key(database_id)].append(key(page["id"]))
+        return self.render_page(page)
+
+    def pages_retrieve(self, id, body, query):
+        return self.render_page(self.get(id, "page"))
+
+    def pages_update(self, id, body, query):
+        page = self.get(id, "page")
+        if page["archived"] and not body.get("archived") is False:
+            raise NotionError(400, "validation_error", "Can't edit block that is archived.")
+        if page.get("parent", {}).get("type") == "database_id":
+            database = self.get(page["parent"]["database_id"], "database")
+            for name, value in body.get("properties", {}).items():
+                page["properties"][name] = self.to_property(database, name, value)
+        for name in ("icon", "cover"):
+            if name in body:
+                page[name] = body[name]
+        if body.get("archived"):
+            self.archive(page)
+        page["last_edited_time"] = now()
+        return self.render_page(page)
+
+    def blocks_children_list(self, id, body, query):
+        self.get(id)
+        children = []
+        for child in self.children.get(key(id), []):
+            item = self.objects.get(f"block:{child}") or self.objects[child]
+            children.append(item)
+        return self.paginate(children, {k: v[0] for k, v in query.items()})
+
+    def blocks_children_append(self, id, body, query):
+        children = body.get("children") or []
+        if len(children) > MAX_PAGE_SIZE:
+            raise NotionError(400, "validation_error", "body.children.length should be ≤ `100`")
+        blocks = self.append_children(id, children, body.get("after"))
+        return {"object": "list", "results": blocks, "next_cursor": None, "has_more": False}
+
+    def blocks_retrieve(self, id, body, query):
+        return self.objects.get(f"block:{key(id)}") or self.get(id)
+
+    def blocks_update(self, id, body, query):
+        block = self.get(id, "block")
+        if block["archived"]:
+            raise NotionError(400, "validation_error", "Can't edit block that is archived.")
+        type = block["type"]
+        if type in body:
+            content = dict(block[type])
+            content.update(body[type])
+            if "rich_text" in body[type]:
+                content["rich_text"] = to_rich_text(body[type]["rich_text"])
+            if type == "callout" and body[type].get("icon"):
+                content["icon"] = {"type": "emoji", **body[type]["icon"]}
+            block[type] = content
+        block["last_edited_time"] = now()
+        return block
+
+    def blocks_delete(self, id, body, query):
+        item = self.get(id)
+        if item["archived"]:
+            raise NotionError(400, "validation_error", "Can't edit block that is archived.")
+        self.archive(item)
+        return item
+
+    # 请求处理
+
+    def check_rate_limit(self):
+        """按概率或者按速率返回429"""
+        if self.rate_limit_probability and self.random.random() < self.rate_limit_probability:
+            return True
+        if self.rate:
+            current = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (current - self.last_refill) * self.rate)
+            self.last_refill = current
+            if self.tokens < 1:
+                return True
+            self.tokens -= 1
+        return False
+
+    def handle(self, method, path, body, query):
+        """返回 (状态码, 响应, 额外的响应头)"""
+        for route_method, pattern, name in ROUTES:
+            found = re.fullmatch(pattern, path)
+            if route_method == method and found:
+                break
+        else:
+            return 400, error_body(400, "invalid_request_url", f"Invalid request URL: {method} {path}"), {}
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.stats[name] += 1
+            if self.check_rate_limit():
+                self.rate_limited += 1
+                return (
+                    429,
+                    error_body(429, "rate_limited", "You have been rate limited."),
+                    {"Retry-After": str(self.retry_after)},
+                )
+            try:
+                method = getattr(self, name.replace(".", "_"))
+                id = found.group(1) if found.groups() else None
+                return 200, method(id, body, query), {}
+            except NotionError as error:
+                return error.status, error_body(error.status, error.code, error.message), {}
+
+    def get_stats(self):
+        with self.lock:
+            return {"requests": dict(self.stats), "rate_limited": self.rate_limited}
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats.clear()
+            self.rate_limited = 0
+
+
+def infer_block_type(data):
+    for name in data:
+        if name not in ("object", "type"):
+            return name
+    raise NotionError(400, "validation_error", f"无法识别的块: {data}")
+
+
+def sortable(value):
+    return (value is None, value if not isinstance(value, list) else len(value))
+
+
+def error_body(status, code, message):
+    return {"object": "error", "status": status, "code": code, "message": message}
+
+
+def make_handler(notion):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, data, headers=None):
+            content = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(content)
+
+        def dispatch(self):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            if url.path == "/__stats":
+                if self.command == "DELETE":
+                    notion.reset_stats()
+                return self.send_json(200, notion.get_stats())
+            if url.path == "/__info":
+                return self.send_json(200, {"page_id": notion.root_id, "page_url": notion.page_url})
+            status, data, headers = notion.handle(
+                self.command, url.path, body, parse_qs(url.query)
+            )
+            self.send_json(status, data, headers)
+
+        do_GET = do_POST = do_PATCH = do_DELETE = dispatch
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=0, **options):
+    """在后台线程中启动服务，返回 (server, notion)，port为0时自动选择端口"""
+    notion = FakeNotion(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(notion))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, notion
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的Notion API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的延迟（秒）")
+    parser.add_argument("--rate", type=float, default=None, help="每秒允许的请求数，超过时返回429")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="随机返回429的概率")
+    parser.add_argument("--retry-after", type=float, default=1, help="429响应中的Retry-After（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server, notion = serve(
+        args.host,
+        args.port,
+        latency=args.latency,
+        rate=args.rate,
+        rate_limit_probability=args.rate_limit_probability,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    host, port = server.server_address
+    print(f"NOTION_BASE_URL=http://{host}:{port}")
+    print(f"NOTION_PAGE={notion.page_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,478 @@
+"""本地模拟的微信读书接口，数据由固定种子的生成器生成
+
+实现了weread_api.py用到的接口：notebook、shelf/sync、book/info、bookmarklist、
+chapterInfos、getProgress、review/list和readdata/summary，
+支持延迟、错误码和Cookie过期注入。
+
+    python -m benchmark.fake_weread --port 8791 --books 2000 --bookmarks 30
+
+启动后设置 WEREAD_BASE_URL=http://127.0.0.1:8791，WEREAD_COOKIE为任意值。
+POST /__change 可以模拟新增划线和笔记，/__stats 返回每个接口的请求数。
+"""
+import argparse
+import collections
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# 生成的阅读记录以这一天为最后一天，保证同一个种子生成相同的数据
+DEFAULT_END_DATE = 1735574400  # 2024-12-31 00:00:00 +08:00
+DAY_SECONDS = 86400
+REVIEW_CHAPTER_UID = 1000000
+# 模拟的Cookie过期错误码，和AUTH_ERRCODES一致
+COOKIE_EXPIRED_ERRCODE = -2012
+CATEGORIES = ["文学", "小说", "历史", "哲学", "经济理财", "计算机", "心理", "艺术"]
+ARCHIVES = ["技术", "闲书", "待读"]
+WORDS = "阅读是一种生活方式书籍让人看到更远的世界时间会证明一切知识就是力量"
+ROUTES = {
+    ("GET", "/"): "home",
+    ("GET", "/api/user/notebook"): "notebook",
+    ("GET", "/web/shelf/sync"): "shelf_sync",
+    ("GET", "/api/book/info"): "book_info",
+    ("GET", "/web/book/bookmarklist"): "bookmark_list",
+    ("POST", "/web/book/chapterInfos"): "chapter_infos",
+    ("GET", "/web/book/getProgress"): "progress",
+    ("GET", "/web/review/list"): "review_list",
+    ("GET", "/readdata/summary"): "readdata_summary",
+}
+
+
+class FakeWeReadError(Exception):
+    def __init__(self, status, errcode, errmsg):
+        super().__init__(errmsg)
+        self.status = status
+        self.errcode = errcode
+        self.errmsg = errmsg
+
+
+def make_text(rng, min_length, max_length):
+    length = rng.randint(min_length, max_length)
+    return "".join(rng.choice(WORDS) for _ in range(length))
+
+
+def generate_library(
+    seed=0,
+    books=100,
+    chapters=20,
+    bookmarks=20,
+    reviews=5,
+    days=365,
+    end_date=DEFAULT_END_DATE,
+):
+    """生成书架，同一组参数总是生成相同的数据
+
+    books为书籍数量，chapters、bookmarks和reviews是每本书的章节、划线和笔记数量，
+    days为有阅读记录的天数。
+    """
+    rng = random.Random(seed)
+    library = {"books": {}, "order": [], "archive": {}, "read_times": {}}
+    start_date = end_date - days * DAY_SECONDS
+    for index in range(books):
+        bookId = str(3300000000 + index)
+        begin = start_date + rng.randint(0, max(days - 1, 0)) * DAY_SECONDS
+        last = min(end_date, begin + rng.randint(0, 60) * DAY_SECONDS)
+        marked_status = rng.choice([1, 2, 4])
+        info = {
+            "bookId": bookId,
+            "title": f"书籍{index}·{make_text(rng, 2, 6)}",
+            "author": " ".join(f"作者{rng.randint(0, books // 3 + 1)}" for _ in range(rng.randint(1, 2))),
+            "cover": f"https://cdn.weread.qq.com/weread/cover/{index % 100}/s_{bookId}.jpg",
+            "intro": make_text(rng, 20, 80),
+            "isbn": str(9787000000000 + index),
+            "categories": [{"categoryId": 1, "title": rng.choice(CATEGORIES)}],
+            "newRating": rng.randint(600, 1000),
+            "newRatingDetail": {"myRating": rng.choice(["", "poor", "fair", "good"])},
+        }
+        chapter_list = [
+            {
+                "chapterUid": uid,
+                "chapterIdx": uid,
+                "updateTime": begin,
+                "readAhead": 0,
+                "title": f"第{uid}章 {make_text(rng, 2, 8)}",
+                "level": 1 if uid % 5 else 2,
+            }
+            for uid in range(1, chapters + 1)
+        ]
+        book = {
+            "info": info,
+            "sort": begin,
+            "reading_time": rng.randint(0, 36000),
+            "progress": 100 if marked_status == 4 else rng.randint(0, 99),
+            "marked_status": marked_status,
+            "begin": begin,
+            "last": last,
+            "chapters": chapter_list,
+            "bookmarks": [],
+            "reviews": [],
+            "removed_bookmarks": [],
+            "removed_reviews": [],
+            "synckey": 1,
+        }
+        for _ in range(bookmarks):
+            add_bookmark(rng, book)
+        for _ in range(reviews):
+            add_review(rng, book)
+        library["books"][bookId] = book
+        library["order"].append(bookId)
+        if rng.random() < 0.3:
+            library["archive"].setdefault(rng.choice(ARCHIVES), []).append(bookId)
+    for day in range(days):
+        timestamp = end_date - day * DAY_SECONDS
+        library["read_times"][str(timestamp)] = rng.randint(0, 7200)
+    return library
+
+
+def add_bookmark(rng, book):
+    index = len(book["bookmarks"]) + len(book["removed_bookmarks"])
+    chapterUid = rng.randint(1, max(len(book["chapters"]), 1))
+    start = rng.randint(0, 5000)
+    book["bookmarks"].append(
+        {
+            "bookId": book["info"]["bookId"],
+            "bookmarkId": f"{book['info']['bookId']}_{chapterUid}_{index}",
+            "chapterUid": chapterUid,
+            "range": f"{start}-{start + rng.randint(5, 60)}",
+            "markText": make_text(rng, 10, 120),
+            "style": rng.randint(0, 2),
+            "colorStyle": rng.randint(1, 5),
+            "type": 1,
+            "bookVersion": 1,
+            "createTime": book["begin"] + index * 60,
+            "synckey": book["synckey"],
+        }
+    )
+
+
+def add_review(rng, book):
+    index = len(book["reviews"]) + len(book["removed_reviews"])
+    bookId = book["info"]["bookId"]
+    # 每本书的第一条是书评，其余是章节中的想法
+    if index == 0:
+        review = {"type": 4, "star": rng.choice([20, 60, 100])}
+    else:
+        start = rng.randint(0, 5000)
+        review = {
+            "type": 1,
+            "chapterUid": rng.randint(1, max(len(book["chapters"]), 1)),
+            "range": f"{start}-{start + rng.randint(5, 60)}",
+            "abstract": make_text(rng, 10, 60),
+        }
+    review.update(
+        {
+            "bookId": bookId,
+            "reviewId": f"{bookId}_review_{index}",
+            "content": make_text(rng, 10, 200),
+            "createTime": book["begin"] + index * 60,
+            "bookVersion": 1,
+            "synckey": book["synckey"],
+        }
+    )
+    book["reviews"].append(review)
+
+
+class FakeWeRead:
+    """保存在内存中的微信读书账号"""
+
+    def __init__(
+        self,
+        library=None,
+        latency=0.0,
+        error_probability=0.0,
+        errcode=-1,
+        cookie=None,
+        expire_after=None,
+        seed=0,
+    ):
+        self.library = library or generate_library(seed)
+        self.latency = latency
+        self.error_probability = error_probability
+        self.errcode = errcode
+        self.cookie = cookie
+        self.expire_after = expire_after
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.stats = collections.Counter()
+        self.requests = 0
+        self.errors = 0
+
+    def get_book(self, query):
+        bookId = query.get("bookId", [None])[0]
+        book = self.library["books"].get(bookId)
+        if book is None:
+            raise FakeWeReadError(404, -2003, f"book {bookId} not found")
+        return book
+
+    # 接口
+
+    def home(self, query, body):
+        return "<html><title>微信读书</title></html>"
+
+    def notebook(self, query, body):
+        books = []
+        for bookId in self.library["order"]:
+            book = self.library["books"][bookId]
+            info = book["info"]
+            books.append(
+                {
+                    "bookId": bookId,
+                    "book": {k: info[k] for k in ("bookId", "title", "author", "cover")},
+                    "reviewCount": len(book["reviews"]),
+                    "noteCount": len(book["bookmarks"]),
+                    "sort": book["sort"],
+                }
+            )
+        return {
+            "synckey": max((b["synckey"] for b in self.library["books"].values()), default=0),
+            "totalBookCount": len(books),
+            "books": books,
+            **self.shelf_extras(),
+        }
+
+    def shelf_extras(self):
+        return {
+            "bookProgress": [
+                {"bookId": bookId, "readingTime": book["reading_time"], "progress": book["progress"]}
+                for bookId, book in self.library["books"].items()
+            ],
+            "archive": [
+                {"archiveId": index + 1, "name": name, "bookIds": bookIds}
+                for index, (name, bookIds) in enumerate(self.library["archive"].items())
+            ],
+        }
+
+    def shelf_sync(self, query, body):
+        books = [
+            {k: self.library["books"][bookId]["info"][k] for k in ("bookId", "title", "author", "cover")}
+            for bookId in self.library["order"]
+        ]
+        return {"books": books, **self.shelf_extras()}
+
+    def book_info(self, query, body):
+        return self.get_book(query)["info"]
+
+    def progress(self, query, body):
+        book = self.get_book(query)
+        begin, last = book["begin"], book["last"]
+        data = [
+            {"readDate": day, "readTime": 600 + (day // DAY_SECONDS) % 1800}
+            for day in range(begin, last + 1, DAY_SECONDS * 7)
+        ]
+        detail = {
+            "totalReadDay": len(data),
+            "beginReadingDate": begin,
+            "lastReadingDate": last,
+            "readingBookDate": last,
+            "data": data,
+        }
+        if book["marked_status"] == 4:
+            detail["finishedDate"] = last
+        return {
+            "bookId": book["info"]["bookId"],
+            "readingProgress": book["progress"],
+            "readingTime": book["reading_time"],
+            "markedStatus": book["marked_status"],
+            "readDetail": detail,
+            "bookInfo": {"bookId": book["info"]["bookId"]},
+        }
+
+    def bookmark_list(self, query, body):
+        book = self.get_book(query)
+        synckey = int(query.get("synckey", [0])[0] or 0)
+        updated = [x for x in book["bookmarks"] if x["synckey"] > synckey]
+        removed = [x["bookmarkId"] for x in book["removed_bookmarks"] if synckey and x["synckey"] > synckey]
+        return {
+            "synckey": book["synckey"],
+            "updated": [{k: v for k, v in x.items() if k != "synckey"} for x in updated],
+            "removed": removed,
+            "chapters": [{"chapterUid": x["chapterUid"], "title": x["title"]} for x in book["chapters"]],
+            "book": book["info"],
+        }
+
+    def review_list(self, query, body):
+        book = self.get_book(query)
+        synckey = int(query.get("syncKey", [0])[0] or 0)
+        maxIdx = int(query.get("maxIdx", [0])[0] or 0)
+        count = int(query.get("count", [0])[0] or 0)
+        items = [
+            {"reviewId": x["reviewId"], "idx": index + 1, "review": {k: v for k, v in x.items() if k != "synckey"}}
+            for index, x in enumerate(book["reviews"])
+            if x["synckey"] > synckey
+        ]
+        items = [x for x in items if x["idx"] > maxIdx]
+        has_more = bool(count) and len(items) > count
+        if count:
+            items = items[:count]
+        removed = [x["reviewId"] for x in book["removed_reviews"] if synckey and x["synckey"] > synckey]
+        return {
+            # 和微信读书一样，没有笔记的书籍返回的syncKey为0
+            "synckey": book["synckey"] if book["reviews"] else 0,
+            "totalCount": len(book["reviews"]),
+            "reviews": items,
+            "removed": removed,
+            "hasMore": has_more,
+        }
+
+    def chapter_infos(self, query, body):
+        data = []
+        for bookId in body.get("bookIds", []):
+            book = self.library["books"].get(str(bookId))
+            if book:
+                data.append({"bookId": str(bookId), "synckey": book["synckey"], "updated": book["chapters"]})
+        return {"data": data}
+
+    def readdata_summary(self, query, body):
+        return {"synckey": 1, "readTimes": self.library["read_times"]}
+
+    # 模拟数据变化
+
+    def change(self, books=1, bookmarks=1, reviews=1, removed=0, read_time=0):
+        """模拟在前books本书中新增划线和笔记，删除removed条划线，并且增加今天的阅读时长"""
+        with self.lock:
+            for bookId in self.library["order"][:books]:
+                book = self.library["books"][bookId]
+                book["synckey"] += 1
+                book["sort"] += 1
+                book["reading_time"] += 60
+                for _ in range(bookmarks):
+                    add_bookmark(self.random, book)
+                for _ in range(reviews):
+                    add_review(self.random, book)
+                for _ in range(min(removed, len(book["bookmarks"]))):
+                    bookmark = book["bookmarks"].pop(0)
+                    bookmark["synckey"] = book["synckey"]
+                    book["removed_bookmarks"].append(bookmark)
+            if read_time:
+                last = max(self.library["read_times"], key=int, default=str(DEFAULT_END_DATE))
+                self.library["read_times"][last] += read_time
+            return {"books": books}
+
+    # 请求处理
+
+    def check(self, cookie):
+        """检查Cookie并按配置注入错误"""
+        self.requests += 1
+        if self.cookie is not None and self.cookie not in (cookie or ""):
+            raise FakeWeReadError(401, COOKIE_EXPIRED_ERRCODE, "用户登录超时")
+        if self.expire_after is not None and self.requests > self.expire_after:
+            raise FakeWeReadError(401, COOKIE_EXPIRED_ERRCODE, "用户登录超时")
+        if self.error_probability and self.random.random() < self.error_probability:
+            self.errors += 1
+            raise FakeWeReadError(500, self.errcode, "系统繁忙")
+
+    def handle(self, method, path, query, body, cookie):
+        """返回 (状态码, 响应)"""
+        name = ROUTES.get((method, path))
+        if name is None:
+            return 404, {"errcode": -2003, "errmsg": f"{method} {path} not found"}
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.stats[name] += 1
+            try:
+                self.check(cookie)
+                return 200, getattr(self, name)(query, body)
+            except FakeWeReadError as error:
+                return error.status, {"errcode": error.errcode, "errmsg": error.errmsg}
+
+    def get_stats(self):
+        with self.lock:
+            return {"requests": dict(self.stats), "errors": self.errors}
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats.clear()
+            self.errors = 0
+
+
+def make_handler(weread):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_data(self, status, data):
+            if isinstance(data, str):
+                content, content_type = data.encode("utf-8"), "text/html; charset=utf-8"
+            else:
+                content = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                content_type = "application/json"
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def dispatch(self):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length)) if length else {}
+            if url.path == "/__stats":
+                if self.command == "DELETE":
+                    weread.reset_stats()
+                return self.send_data(200, weread.get_stats())
+            if url.path == "/__change":
+                return self.send_data(200, weread.change(**body))
+            status, data = weread.handle(
+                self.command, url.path, parse_qs(url.query), body, self.headers.get("Cookie")
+            )
+            self.send_data(status, data)
+
+        do_GET = do_POST = do_DELETE = dispatch
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=0, library=None, **options):
+    """在后台线程中启动服务，返回 (server, weread)，port为0时自动选择端口"""
+    weread = FakeWeRead(library, **options)
+    server = ThreadingHTTPServer((host, port), make_handler(weread))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, weread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的微信读书接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8791)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--books", type=int, default=100, help="书籍数量")
+    parser.add_argument("--chapters", type=int, default=20, help="每本书的章节数量")
+    parser.add_argument("--bookmarks", type=int, default=20, help="每本书的划线数量")
+    parser.add_argument("--reviews", type=int, default=5, help="每本书的笔记数量")
+    parser.add_argument("--days", type=int, default=365, help="有阅读记录的天数")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的延迟（秒）")
+    parser.add_argument("--error-probability", type=float, default=0.0, help="随机返回错误码的概率")
+    parser.add_argument("--errcode", type=int, default=-1, help="随机返回的错误码")
+    parser.add_argument("--cookie", default=None, help="只接受包含这个值的Cookie")
+    parser.add_argument("--expire-after", type=int, default=None, help="超过这个请求数后Cookie过期")
+    args = parser.parse_args()
+    library = generate_library(
+        args.seed, args.books, args.chapters, args.bookmarks, args.reviews, args.days
+    )
+    server, weread = serve(
+        args.host,
+        args.port,
+        library,
+        latency=args.latency,
+        error_probability=args.error_probability,
+        errcode=args.errcode,
+        cookie=args.cookie,
+        expire_after=args.expire_after,
+        seed=args.seed,
+    )
+    host, port = server.server_address
+    print(f"WEREAD_BASE_URL=http://{host}:{port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""端到端同步性能测试
+
+在本地启动模拟的微信读书和Notion接口，按书籍数量和每本书的划线数量扫描，
+依次在子进程中运行book、weread和read_time，每个规模运行三种场景：
+
+    cold    全新的Notion和本地缓存
+    warm    没有任何变化再运行一次
+    change  在一本书中新增一条划线和一条笔记后再运行一次
+
+每次运行记录耗时、每个接口的请求数、子进程的峰值内存和每个同步项目的请求数，
+结果以JSON格式输出，方便比较不同版本。
+
+    python -m benchmark.run --sweep quick --output bench.json
+    python -m benchmark.run --books 100,1000 --bookmarks 20 --latency 0.02
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark import fake_notion, fake_weread
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STEPS = ("book", "weread", "read_time")
+SCENARIOS = ("cold", "warm", "change")
+# 按书籍数量扫描时每本书的划线数，和按划线数扫描时的书籍数
+SWEEPS = {
+    "quick": {"books": [10, 50], "bookmarks": [10, 100], "fixed_books": 5, "fixed_bookmarks": 10},
+    "full": {
+        "books": [10, 100, 1000, 5000],
+        "bookmarks": [10, 100, 1000, 10000],
+        "fixed_books": 10,
+        "fixed_bookmarks": 10,
+    },
+}
+# change场景中修改的数量
+CHANGE = {"books": 1, "bookmarks": 1, "reviews": 1, "read_time": 600}
+
+
+def get_cases(args):
+    """返回要运行的 (书籍数, 每本书的划线数) 列表"""
+    if args.books or args.bookmarks:
+        books = parse_sizes(args.books) or [SWEEPS[args.sweep]["fixed_books"]]
+        bookmarks = parse_sizes(args.bookmarks) or [SWEEPS[args.sweep]["fixed_bookmarks"]]
+        return list(itertools.product(books, bookmarks))
+    sweep = SWEEPS[args.sweep]
+    cases = [(x, sweep["fixed_bookmarks"]) for x in sweep["books"]]
+    cases += [(sweep["fixed_books"], x) for x in sweep["bookmarks"]]
+    # 两个方向的扫描可能有重复的规模
+    return list(dict.fromkeys(cases))
+
+
+def parse_sizes(value):
+    return [int(x) for x in value.split(",") if x.strip()] if value else []
+
+
+def run_step(step, env, cwd, timeout):
+    """在子进程中运行一个同步步骤，返回 (退出码, 耗时, 峰值内存KB)"""
+    log_path = os.path.join(cwd, f"{step}.log")
+    with open(log_path, "a") as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", f"weread2notionpro.{step}"],
+            env=env,
+            cwd=cwd,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        deadline = start + timeout
+        while True:
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                break
+            if time.perf_counter() > deadline:
+                process.kill()
+                pid, status, usage = os.wait4(process.pid, 0)
+                break
+            time.sleep(0.05)
+        wall_time = time.perf_counter() - start
+    # wait4已经回收了子进程，避免Popen再次等待
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, wall_time, usage.ru_maxrss
+
+
+def get_item_count(books, bookmarks, reviews, scenario):
+    """同步项目的数量，change场景只计算变化的划线和笔记"""
+    if scenario == "change":
+        return CHANGE["books"] * (CHANGE["bookmarks"] + CHANGE["reviews"])
+    return books * (1 + bookmarks + reviews)
+
+
+def run_case(books, bookmarks, args):
+    """运行一个规模的三种场景，返回每个步骤的结果"""
+    library = fake_weread.generate_library(
+        args.seed, books, args.chapters, bookmarks, args.reviews, args.days
+    )
+    notion_server, notion = fake_notion.serve(
+        latency=args.latency,
+        rate_limit_probability=args.rate_limit_probability,
+        seed=args.seed,
+    )
+    weread_server, weread = fake_weread.serve(
+        library=library, latency=args.latency, seed=args.seed
+    )
+    results = []
+    with tempfile.TemporaryDirectory(prefix="weread2notion-bench-") as workdir:
+        env = dict(
+            os.environ,
+            PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+            NOTION_TOKEN="benchmark",
+            NOTION_PAGE=notion.page_url,
+            NOTION_BASE_URL="http://%s:%d" % notion_server.server_address,
+            NOTION_RATE=str(args.notion_rate),
+            WEREAD_BASE_URL="http://%s:%d" % weread_server.server_address,
+            WEREAD_COOKIE="wr_skey=benchmark",
+            WEREAD_RATE=str(args.weread_rate),
+            WEREAD_MAX_RATE=str(args.weread_rate),
+            WEREAD2NOTION_DATA_DIR=os.path.join(workdir, "data"),
+        )
+        for name in ("CC_URL", "CC_ID", "CC_PASSWORD", "WEREAD_COOKIE_CACHE_KEY"):
+            env.pop(name, None)
+        for scenario in args.scenarios:
+            if scenario == "change":
+                weread.change(**CHANGE)
+            for step in args.steps:
+                notion.reset_stats()
+                weread.reset_stats()
+                returncode, wall_time, peak_rss = run_step(step, env, workdir, args.timeout)
+                notion_stats = notion.get_stats()
+                weread_stats = weread.get_stats()
+                total_calls = sum(notion_stats["requests"].values()) + sum(
+                    weread_stats["requests"].values()
+                )
+                items = get_item_count(books, bookmarks, args.reviews, scenario)
+                result = {
+                    "books": books,
+                    "bookmarks": bookmarks,
+                    "reviews": args.reviews,
+                    "scenario": scenario,
+                    "step": step,
+                    "returncode": returncode,
+                    "wall_time": round(wall_time, 3),
+                    "peak_rss_kb": peak_rss,
+                    "notion_calls": notion_stats["requests"],
+                    "notion_rate_limited": notion_stats["rate_limited"],
+                    "weread_calls": weread_stats["requests"],
+                    "total_calls": total_calls,
+                    "items": items,
+                    "calls_per_item": round(total_calls / items, 3) if items else None,
+                }
+                results.append(result)
+                print(
+                    f"books={books} bookmarks={bookmarks} {scenario} {step}: "
+                    f"退出码{returncode}，耗时{wall_time:.2f}秒，请求{total_calls}次，"
+                    f"峰值内存{peak_rss // 1024}MB",
+                    file=sys.stderr,
+                )
+                if returncode != 0:
+                    with open(os.path.join(workdir, f"{step}.log")) as log:
+                        print(log.read()[-2000:], file=sys.stderr)
+    notion_server.shutdown()
+    weread_server.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端同步性能测试")
+    parser.add_argument("--sweep", choices=sorted(SWEEPS), default="quick", help="预设的扫描范围")
+    parser.add_argument("--books", help="书籍数量，逗号分隔，设置后不使用预设")
+    parser.add_argument("--bookmarks", help="每本书的划线数量，逗号分隔，设置后不使用预设")
+    parser.add_argument("--reviews", type=int, default=5, help="每本书的笔记数量")
+    parser.add_argument("--chapters", type=int, default=20, help="每本书的章节数量")
+    parser.add_argument("--days", type=int, default=365, help="有阅读记录的天数")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="要运行的场景")
+    parser.add_argument("--steps", default=",".join(STEPS), help="要运行的同步步骤")
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟接口每个请求的延迟（秒）")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="Notion随机返回429的概率")
+    parser.add_argument("--notion-rate", type=float, default=100, help="Notion每秒请求数")
+    parser.add_argument("--weread-rate", type=float, default=100, help="微信读书每秒请求数")
+    parser.add_argument("--timeout", type=float, default=3600, help="每个步骤的超时时间（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="结果JSON的保存路径，默认输出到标准输出")
+    args = parser.parse_args()
+    args.scenarios = [x for x in args.scenarios.split(",") if x in SCENARIOS]
+    args.steps = [x for x in args.steps.split(",") if x in STEPS]
+    results = []
+    for books, bookmarks in get_cases(args):
+        results.extend(run_case(books, bookmarks, args))
+    report = {
+        "config": {
+            k: v for k, v in vars(args).items() if k not in ("output", "books", "bookmarks")
+        },
+        "results": results,
+    }
+    content = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(content)
+    else:
+        print(content)
+    if any(x["returncode"] != 0 for x in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
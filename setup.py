@@ -2,7 +2,7 @@ from setuptools import setup, find_packages
 
 setup(
     version="0.2.5",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmark"]),
     install_requires=[
         "requests",
         "pendulum",
@@ -10,6 +10,7 @@ setup(
         "notion-client",
         "github-heatmap",
         "github-heatmap",
+        "cryptography",
     ],
     entry_points={
         "console_scripts": [
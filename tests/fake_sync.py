@@ -0,0 +1,113 @@
+"""在本地模拟的微信读书和Notion接口上运行同步的测试基类"""
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from benchmark import fake_notion, fake_weread
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeSyncTestCase(unittest.TestCase):
+    BOOKS = 2
+    BOOKMARKS = 20
+    REVIEWS = 2
+    NOTION_LATENCY = 0.0
+
+    def setUp(self):
+        library = fake_weread.generate_library(
+            books=self.BOOKS,
+            chapters=5,
+            bookmarks=self.BOOKMARKS,
+            reviews=self.REVIEWS,
+            days=5,
+        )
+        self.weread_server, self.weread = fake_weread.serve(library=library)
+        self.notion_servers = []
+        self.workdir = tempfile.TemporaryDirectory()
+        self.data_dir = os.path.join(self.workdir.name, "data")
+        self.env = dict(
+            os.environ,
+            PYTHONPATH=ROOT,
+            NOTION_TOKEN="test",
+            NOTION_RATE="100",
+            NOTION_WRITE_WORKERS="1",
+            WEREAD_BASE_URL="http://%s:%d" % self.weread_server.server_address,
+            WEREAD_COOKIE="wr_skey=test",
+            WEREAD_RATE="100",
+            WEREAD_MAX_RATE="100",
+            WEREAD2NOTION_DATA_DIR=self.data_dir,
+        )
+        for name in ("CC_URL", "CC_ID", "CC_PASSWORD", "WEREAD_COOKIE_CACHE_KEY"):
+            self.env.pop(name, None)
+        self.use_new_notion()
+
+    def tearDown(self):
+        for server in self.notion_servers:
+            server.shutdown()
+        self.weread_server.shutdown()
+        self.workdir.cleanup()
+
+    def use_new_notion(self):
+        """切换到一个新的Notion模板，本地数据目录保持不变"""
+        server, self.notion = fake_notion.serve(latency=self.NOTION_LATENCY)
+        self.notion_servers.append(server)
+        self.env["NOTION_PAGE"] = self.notion.page_url
+        self.env["NOTION_BASE_URL"] = "http://%s:%d" % server.server_address
+
+    def start_step(self, step, **kwargs):
+        return subprocess.Popen(
+            [sys.executable, "-m", f"weread2notionpro.{step}"],
+            env=self.env,
+            cwd=self.workdir.name,
+            **kwargs,
+        )
+
+    def run_step(self, step, *args):
+        result = subprocess.run(
+            [sys.executable, "-m", f"weread2notionpro.{step}", *args],
+            env=self.env,
+            cwd=self.workdir.name,
+            capture_output=True,
+            text=True,
+            timeout=600,
+        )
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        return result.stdout
+
+    def get_database(self, name):
+        notion = self.notion
+        with notion.lock:
+            return next(
+                x
+                for x in notion.objects.values()
+                if x["object"] == "database" and x["title"][0]["plain_text"] == name
+            )
+
+    def count_rows(self, name):
+        """数据库中没有被删除的记录数"""
+        notion = self.notion
+        database = self.get_database(name)
+        with notion.lock:
+            rows = notion.rows[fake_notion.key(database["id"])]
+            return sum(not notion.objects[x]["archived"] for x in rows)
+
+    def count_blocks(self, page_id):
+        """页面中没有被删除的顶层块数"""
+        notion = self.notion
+        with notion.lock:
+            return len(notion.children.get(fake_notion.key(page_id), []))
+
+    def get_book_page(self, bookId):
+        notion = self.notion
+        with notion.lock:
+            return next(
+                x
+                for x in notion.objects.values()
+                if x["object"] == "page"
+                and not x["archived"]
+                and x["properties"].get("BookId", {}).get("rich_text")
+                and x["properties"]["BookId"]["rich_text"][0]["plain_text"] == bookId
+            )
@@ -0,0 +1,92 @@
+"""ResponseCache的单元测试"""
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from weread2notionpro.cache import ResponseCache, get_account_key
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.workdir.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def create_cache(self, **kwargs):
+        options = dict(path=self.path, enabled=True, account="account")
+        options.update(kwargs)
+        return ResponseCache(**options)
+
+    def test_get_and_set(self):
+        cache = self.create_cache()
+        cache.set("book_info", {"bookId": "1"}, {"title": "测试"})
+        self.assertEqual(cache.get("book_info", {"bookId": "1"}), {"title": "测试"})
+        self.assertIsNone(cache.get("book_info", {"bookId": "2"}))
+
+    def test_zero_ttl_is_not_cached(self):
+        cache = self.create_cache()
+        cache.set("bookmark_list", {"bookId": "1"}, {"updated": []})
+        self.assertIsNone(cache.get("bookmark_list", {"bookId": "1"}))
+
+    def test_expired(self):
+        cache = self.create_cache(ttl_policy={"read_info": 10})
+        now = time.time()
+        with mock.patch("time.time", return_value=now):
+            cache.set("read_info", {"bookId": "1"}, {"readingTime": 60})
+        with mock.patch("time.time", return_value=now + 5):
+            self.assertEqual(cache.get("read_info", {"bookId": "1"}), {"readingTime": 60})
+        with mock.patch("time.time", return_value=now + 11):
+            self.assertIsNone(cache.get("read_info", {"bookId": "1"}))
+
+    def test_ttl_from_environment(self):
+        with mock.patch.dict(os.environ, {"WEREAD_CACHE_TTL": "book_info=0, read_info=5"}):
+            cache = self.create_cache()
+        self.assertEqual(cache.get_ttl("book_info"), 0)
+        self.assertEqual(cache.get_ttl("read_info"), 5)
+
+    def test_least_recently_used_is_evicted(self):
+        value = {"content": "x" * 400}
+        cache = self.create_cache(max_size_mb=1000 / 1024 / 1024)
+        now = time.time()
+        with mock.patch("time.time", return_value=now):
+            cache.set("book_info", {"bookId": "1"}, value)
+        with mock.patch("time.time", return_value=now + 1):
+            cache.set("book_info", {"bookId": "2"}, value)
+        with mock.patch("time.time", return_value=now + 2):
+            # 读取后1变成最近使用的
+            self.assertIsNotNone(cache.get("book_info", {"bookId": "1"}))
+        with mock.patch("time.time", return_value=now + 3):
+            cache.set("book_info", {"bookId": "3"}, value)
+        self.assertIsNotNone(cache.get("book_info", {"bookId": "1"}))
+        self.assertIsNone(cache.get("book_info", {"bookId": "2"}))
+        self.assertIsNotNone(cache.get("book_info", {"bookId": "3"}))
+
+    def test_accounts_do_not_share_entries(self):
+        first = self.create_cache(account=get_account_key("wr_vid=1; wr_skey=a"))
+        first.set("book_info", {"bookId": "1"}, {"title": "测试"})
+        same = self.create_cache(account=get_account_key("wr_skey=b; wr_vid=1"))
+        other = self.create_cache(account=get_account_key("wr_vid=2; wr_skey=a"))
+        self.assertEqual(same.get("book_info", {"bookId": "1"}), {"title": "测试"})
+        self.assertIsNone(other.get("book_info", {"bookId": "1"}))
+
+    def test_error_payload_is_not_cached(self):
+        cache = self.create_cache()
+        cache.set("book_info", {"bookId": "1"}, {"errcode": -1, "errmsg": "busy"})
+        cache.set("chapter_info", {"bookId": "1"}, {"errCode": -2012})
+        cache.set("read_info", {"bookId": "1"}, {"errcode": 0, "readingTime": 1})
+        self.assertIsNone(cache.get("book_info", {"bookId": "1"}))
+        self.assertIsNone(cache.get("chapter_info", {"bookId": "1"}))
+        self.assertIsNotNone(cache.get("read_info", {"bookId": "1"}))
+
+    def test_disabled(self):
+        cache = self.create_cache(enabled=False)
+        cache.set("book_info", {"bookId": "1"}, {"title": "测试"})
+        self.assertIsNone(cache.get("book_info", {"bookId": "1"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
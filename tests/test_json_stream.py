@@ -0,0 +1,72 @@
+"""流式JSON解析的单元测试"""
+import json
+import unittest
+
+from weread2notionpro.utils import JsonStreamReader, iter_json_items
+
+DOCUMENT = {
+    "synckey": 1700000000,
+    "books": [
+        {"bookId": "1", "title": "测试书籍", "progress": 12.5, "sort": 3},
+        {"bookId": "2", "price": -0.25, "rating": 1e-3, "finished": True},
+        1.5,
+        -12,
+        3e10,
+        2.5E+3,
+        None,
+        False,
+        "字符串",
+        [],
+        {},
+    ],
+    "bookProgress": [],
+    "archive": [{"name": "归档", "bookIds": ["1", "2"]}],
+    "total": 12.75,
+}
+
+
+def split_at(data, position):
+    return [data[:position], data[position:]]
+
+
+class JsonStreamReaderTest(unittest.TestCase):
+    def test_split_at_every_byte(self):
+        data = json.dumps(DOCUMENT, ensure_ascii=False).encode("utf-8")
+        expected = [("books", x) for x in DOCUMENT["books"]]
+        expected += [("archive", x) for x in DOCUMENT["archive"]]
+        for position in range(len(data) + 1):
+            with self.subTest(position=position):
+                items = list(iter_json_items(split_at(data, position), ("books", "archive")))
+                self.assertEqual(items, expected)
+
+    def test_numbers_split_at_every_byte(self):
+        for text in ('{"a": 12.5}', '{"books": [1.5]}', '{"a": 1e5, "b": -2.5E-3}'):
+            data = text.encode("utf-8")
+            for position in range(len(data) + 1):
+                with self.subTest(text=text, position=position):
+                    reader = JsonStreamReader(split_at(data, position))
+                    self.assertEqual(reader.read_value(), json.loads(text))
+
+    def test_single_byte_chunks(self):
+        data = json.dumps(DOCUMENT, ensure_ascii=False).encode("utf-8")
+        chunks = [data[i : i + 1] for i in range(len(data))]
+        items = list(iter_json_items(chunks, ("books",)))
+        self.assertEqual(items, [("books", x) for x in DOCUMENT["books"]])
+
+    def test_truncated_number(self):
+        for chunks in ([b'{"a": 12.', b"5}"], [b'{"books": [1.', b"5]}"]):
+            with self.subTest(chunks=chunks):
+                self.assertEqual(
+                    JsonStreamReader(chunks).read_value(), json.loads(b"".join(chunks))
+                )
+
+    def test_number_at_end_of_stream(self):
+        self.assertEqual(JsonStreamReader([b"1", b"2"]).read_value(), 12)
+
+    def test_invalid_json(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_items([b'{"books": [1,', b" }"], ("books",)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+"""notion_mirror中match_filter的单元测试"""
+import unittest
+
+from weread2notionpro.notion_mirror import match_filter
+
+
+def rich_text(value):
+    return {"type": "rich_text", "rich_text": [{"plain_text": value}]}
+
+
+PAGE = {
+    "properties": {
+        "标题": {"type": "title", "title": [{"plain_text": "测试"}, {"plain_text": "书籍"}]},
+        "BookId": rich_text("123"),
+        "Sort": {"type": "number", "number": 10},
+        "书籍": {"type": "relation", "relation": [{"id": "aaaa-bbbb"}]},
+        "阅读状态": {"type": "status", "status": {"name": "在读"}},
+        "书架分类": {"type": "select", "select": None},
+        "同步书签": {"type": "checkbox", "checkbox": True},
+    }
+}
+
+
+class MatchFilterTest(unittest.TestCase):
+    def assertMatch(self, filter, expected=True):
+        self.assertEqual(match_filter(PAGE, filter), expected, filter)
+
+    def test_text(self):
+        self.assertMatch({"property": "BookId", "rich_text": {"equals": "123"}})
+        self.assertMatch({"property": "BookId", "rich_text": {"equals": "12"}}, False)
+        self.assertMatch({"property": "标题", "title": {"equals": "测试书籍"}})
+        self.assertMatch({"property": "标题", "title": {"contains": "书"}})
+        self.assertMatch({"property": "标题", "title": {"does_not_contain": "书"}}, False)
+
+    def test_number(self):
+        self.assertMatch({"property": "Sort", "number": {"greater_than": 5}})
+        self.assertMatch({"property": "Sort", "number": {"less_than": 5}}, False)
+        self.assertMatch({"property": "Sort", "number": {"does_not_equal": 10}}, False)
+
+    def test_relation_ignores_dashes(self):
+        self.assertMatch({"property": "书籍", "relation": {"contains": "aaaabbbb"}})
+        self.assertMatch({"property": "书籍", "relation": {"contains": "aaaa-bbbb"}})
+        self.assertMatch({"property": "书籍", "relation": {"contains": "cccc"}}, False)
+
+    def test_select_status_and_checkbox(self):
+        self.assertMatch({"property": "阅读状态", "status": {"equals": "在读"}})
+        self.assertMatch({"property": "书架分类", "select": {"is_empty": True}})
+        self.assertMatch({"property": "书架分类", "select": {"is_not_empty": True}}, False)
+        self.assertMatch({"property": "同步书签", "checkbox": {"equals": True}})
+
+    def test_compound(self):
+        self.assertMatch(
+            {
+                "and": [
+                    {"property": "BookId", "rich_text": {"equals": "123"}},
+                    {
+                        "or": [
+                            {"property": "Sort", "number": {"equals": 1}},
+                            {"property": "阅读状态", "status": {"equals": "在读"}},
+                        ]
+                    },
+                ]
+            }
+        )
+        self.assertMatch(
+            {
+                "and": [
+                    {"property": "BookId", "rich_text": {"equals": "123"}},
+                    {"property": "Sort", "number": {"equals": 1}},
+                ]
+            },
+            False,
+        )
+
+    def test_unsupported(self):
+        for filter in (
+            {"property": "不存在", "rich_text": {"equals": "1"}},
+            {"property": "BookId", "date": {"equals": "2024-01-01"}},
+            {"property": "BookId", "rich_text": {"starts_with": "1"}},
+        ):
+            with self.subTest(filter=filter):
+                with self.assertRaises(ValueError):
+                    match_filter(PAGE, filter)
+
+
+if __name__ == "__main__":
+    unittest.main()
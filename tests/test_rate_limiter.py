@@ -0,0 +1,66 @@
+"""AIMDLimiter的单元测试"""
+import unittest
+
+from weread2notionpro.rate_limiter import AIMDLimiter
+
+
+class AIMDLimiterTest(unittest.TestCase):
+    def create_limiter(self, **kwargs):
+        options = dict(
+            max_concurrency=8, initial_concurrency=4, initial_rate=10.0, max_rate=20.0
+        )
+        options.update(kwargs)
+        return AIMDLimiter(**options)
+
+    def test_success_increases_additively(self):
+        limiter = self.create_limiter()
+        limiter.acquire()
+        limiter.release(True)
+        self.assertAlmostEqual(limiter.concurrency, 4.25)
+        self.assertAlmostEqual(limiter.rate, 10 + 0.5 / 4.25)
+        self.assertEqual(limiter.state()["successes"], 1)
+
+    def test_failure_decreases_multiplicatively(self):
+        limiter = self.create_limiter()
+        limiter.acquire()
+        limiter.release(False)
+        self.assertEqual(limiter.concurrency, 2)
+        self.assertEqual(limiter.rate, 5)
+        self.assertEqual(limiter.state()["failures"], 1)
+
+    def test_bounds(self):
+        limiter = self.create_limiter(max_concurrency=2, min_rate=1.0, max_rate=11.0)
+        for _ in range(50):
+            # 不经过acquire，避免按速率等待
+            limiter.in_flight += 1
+            limiter.release(True)
+        self.assertEqual(limiter.concurrency, 2)
+        self.assertEqual(limiter.rate, 11)
+        for _ in range(50):
+            # 不经过acquire，避免按速率等待
+            limiter.in_flight += 1
+            limiter.release(False)
+        self.assertEqual(limiter.concurrency, 1)
+        self.assertEqual(limiter.rate, 1)
+
+    def test_initial_values_are_clamped(self):
+        limiter = AIMDLimiter(max_concurrency=2, initial_concurrency=10, initial_rate=100, max_rate=5)
+        self.assertEqual(limiter.concurrency, 2)
+        self.assertEqual(limiter.rate, 5)
+
+    def test_slot_marks_failures(self):
+        limiter = self.create_limiter()
+        with limiter.slot():
+            pass
+        with limiter.slot() as slot:
+            slot.fail()
+        with self.assertRaises(RuntimeError):
+            with limiter.slot():
+                raise RuntimeError("timeout")
+        state = limiter.state()
+        self.assertEqual((state["successes"], state["failures"]), (1, 2))
+        self.assertEqual(state["in_flight"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""plan_block_operations的单元测试"""
+import unittest
+
+from weread2notionpro.reconcile import plan_block_operations
+from weread2notionpro.utils import get_block, get_block_hash, get_heading
+
+
+def make_block(text):
+    return get_block(text, "callout", True, 0, 1, None)
+
+
+def make_item(id, block):
+    return {"id": id, "type": block["type"], "hash": get_block_hash(block)}
+
+
+class PlanBlockOperationsTest(unittest.TestCase):
+    def setUp(self):
+        self.heading = get_heading(2, "第一章")
+        self.first = make_block("第一条划线")
+        self.second = make_block("第二条划线")
+        self.blocks = [
+            {"id": "toc", "type": "table_of_contents", "hash": None},
+            make_item("a-1", self.heading),
+            make_item("b-2", self.first),
+            make_item("c-3", self.second),
+        ]
+
+    def test_unchanged(self):
+        desired = [
+            ({"blockId": "a-1"}, self.heading),
+            ({"blockId": "b-2"}, self.first),
+            ({"blockId": "c-3"}, None),
+        ]
+        self.assertEqual(plan_block_operations(desired, self.blocks, "toc"), [])
+
+    def test_new_blocks_follow_previous_existing_block(self):
+        new = make_block("新划线")
+        last = make_block("最后的划线")
+        desired = [
+            ({"blockId": "a-1"}, self.heading),
+            ({"bookmarkId": "x"}, new),
+            ({"blockId": "b-2"}, self.first),
+            ({"blockId": "c-3"}, self.second),
+            ({"bookmarkId": "y"}, last),
+        ]
+        operations = plan_block_operations(desired, self.blocks, "toc")
+        self.assertEqual(
+            operations,
+            [
+                ("append", "a-1", [({"bookmarkId": "x"}, new)]),
+                ("append", "c-3", [({"bookmarkId": "y"}, last)]),
+            ],
+        )
+
+    def test_first_new_block_goes_after_anchor(self):
+        new = make_block("新划线")
+        desired = [({"bookmarkId": "x"}, new), ({"blockId": "a-1"}, self.heading)]
+        operations = plan_block_operations(desired, self.blocks, "toc")
+        self.assertEqual(operations, [("append", "toc", [({"bookmarkId": "x"}, new)])])
+
+    def test_changed_content_is_updated(self):
+        edited = make_block("修改后的划线")
+        desired = [({"blockId": "b-2"}, edited)]
+        operations = plan_block_operations(desired, self.blocks, "toc")
+        self.assertEqual(operations, [("update", "b-2", edited)])
+
+    def test_changed_type_is_not_updated(self):
+        desired = [({"blockId": "b-2"}, get_heading(2, "第二章"))]
+        self.assertEqual(plan_block_operations(desired, self.blocks, "toc"), [])
+
+    def test_missing_block_is_recreated(self):
+        content = {"blockId": "d-4", "bookmarkId": "z"}
+        block = make_block("被删除的块")
+        operations = plan_block_operations(
+            [({"blockId": "a1"}, None), (content, block)], self.blocks, "toc"
+        )
+        self.assertEqual(operations, [("append", "a1", [(content, block)])])
+        self.assertNotIn("blockId", content)
+        self.assertTrue(content["recreated"])
+
+    def test_stale_blocks_are_deleted(self):
+        desired = [({"blockId": "a-1"}, None), ({"blockId": "c-3"}, None)]
+        operations = plan_block_operations(
+            desired, self.blocks, "toc", stale=["b-2", "c-3", "unknown"]
+        )
+        self.assertEqual(operations, [("delete", "b-2")])
+
+
+if __name__ == "__main__":
+    unittest.main()
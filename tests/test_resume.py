@@ -0,0 +1,81 @@
+"""同步被终止后继续运行，Notion中的记录不应该重复"""
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import time
+import unittest
+
+from tests.fake_sync import FakeSyncTestCase
+
+BOOKS = 3
+BOOKMARKS = 60
+REVIEWS = 2
+
+
+class ResumeTest(FakeSyncTestCase):
+    BOOKS = BOOKS
+    BOOKMARKS = BOOKMARKS
+    REVIEWS = REVIEWS
+    NOTION_LATENCY = 0.02
+
+    def assert_row_counts(self):
+        self.assertEqual(self.count_rows("划线"), BOOKS * BOOKMARKS)
+        self.assertEqual(self.count_rows("笔记"), BOOKS * REVIEWS)
+
+    def test_resume_after_sigterm(self):
+        self.run_step("book")
+        process = self.start_step(
+            "weread",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        # 第一本书的块追加完成后记录还在后台队列中，这时终止
+        for line in process.stdout:
+            if line.startswith("新增"):
+                time.sleep(0.3)
+                process.send_signal(signal.SIGTERM)
+                break
+        process.communicate(timeout=60)
+        self.assertEqual(process.returncode, 128 + signal.SIGTERM)
+        self.assertLess(self.count_rows("划线"), BOOKS * BOOKMARKS)
+        self.run_step("weread")
+        self.assert_row_counts()
+
+    def test_resume_row_written_before_kill(self):
+        """记录已经写入Notion但是进程在删除本地队列前被终止"""
+        self.run_step("book")
+        self.run_step("weread")
+        self.assert_row_counts()
+        # 模拟终止前的状态：本地镜像中没有这条记录，本地队列中还有这条记录
+        bookId = next(iter(self.weread.library["books"]))
+        bookmark = self.weread.library["books"][bookId]["bookmarks"][0]
+        mirror = sqlite3.connect(os.path.join(self.data_dir, "notion_mirror.sqlite"))
+        page_ids = [
+            x[0]
+            for x in mirror.execute(
+                "SELECT page_id FROM keys WHERE value = ?", (bookmark["bookmarkId"],)
+            )
+        ]
+        self.assertTrue(page_ids)
+        for page_id in page_ids:
+            mirror.execute("DELETE FROM pages WHERE page_id = ?", (page_id,))
+            mirror.execute("DELETE FROM keys WHERE page_id = ?", (page_id,))
+        mirror.commit()
+        mirror.close()
+        book_page = self.get_book_page(bookId)
+        queue = sqlite3.connect(os.path.join(self.data_dir, "write_queue.sqlite"))
+        queue.execute(
+            "INSERT INTO rows (page_id, payload) VALUES (?, ?)",
+            (book_page["id"], json.dumps(bookmark, ensure_ascii=False)),
+        )
+        queue.commit()
+        queue.close()
+        self.run_step("weread")
+        self.assert_row_counts()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""增量同步和全量同步的端到端测试"""
+import unittest
+
+from tests.fake_sync import FakeSyncTestCase
+
+
+class MixedIncrementalTest(FakeSyncTestCase):
+    """没有笔记的书籍保存的笔记syncKey为0，只有划线是增量结果"""
+
+    REVIEWS = 0
+
+    def test_new_bookmark_keeps_existing_rows(self):
+        self.run_step("book")
+        self.run_step("weread")
+        self.assertEqual(self.count_rows("划线"), self.BOOKS * self.BOOKMARKS)
+        self.weread.change(books=1, bookmarks=1, reviews=0)
+        self.run_step("weread")
+        self.assertEqual(self.count_rows("划线"), self.BOOKS * self.BOOKMARKS + 1)
+        bookId = self.weread.library["order"][0]
+        page = self.get_book_page(bookId)
+        # 目录和每条划线各一个块，章节标题不计入
+        self.assertGreaterEqual(self.count_blocks(page["id"]), self.BOOKMARKS + 1)
+
+
+class NewTemplateTest(FakeSyncTestCase):
+    """换成新的Notion模板后，保存的syncKey不能让新模板只写入增量"""
+
+    def test_new_template_gets_full_sync(self):
+        self.run_step("book")
+        self.run_step("weread")
+        self.use_new_notion()
+        self.run_step("book")
+        self.run_step("weread")
+        self.assertEqual(self.count_rows("划线"), self.BOOKS * self.BOOKMARKS)
+        self.assertEqual(self.count_rows("笔记"), self.BOOKS * self.REVIEWS)
+
+
+class EditedAbstractTest(FakeSyncTestCase):
+    """只修改了笔记的摘要时，笔记块下面的摘要也要更新"""
+
+    def get_quotes(self):
+        notion = self.notion
+        with notion.lock:
+            return [
+                x["quote"]["rich_text"][0]["plain_text"]
+                for x in notion.objects.values()
+                if x.get("type") == "quote" and not x["archived"]
+            ]
+
+    def test_edited_abstract_replaces_quote(self):
+        self.run_step("book")
+        self.run_step("weread")
+        bookId = self.weread.library["order"][0]
+        with self.weread.lock:
+            book = self.weread.library["books"][bookId]
+            book["synckey"] += 1
+            book["sort"] += 1
+            review = next(x for x in book["reviews"] if x.get("abstract"))
+            old_abstract = review["abstract"]
+            review["abstract"] = "修改后的摘要"
+            review["synckey"] = book["synckey"]
+        self.run_step("weread")
+        quotes = self.get_quotes()
+        self.assertIn("修改后的摘要", quotes)
+        self.assertNotIn(old_abstract, quotes)
+        self.assertEqual(self.count_rows("笔记"), self.BOOKS * self.REVIEWS)
+
+
+if __name__ == "__main__":
+    unittest.main()
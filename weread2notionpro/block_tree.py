@@ -0,0 +1,118 @@
+import collections
+import threading
+
+from weread2notionpro.notion_mirror import normalize_id
+from weread2notionpro.notion_scheduler import PRIORITY_BLOCKS
+from weread2notionpro.utils import get_block_hash
+
+
+class BlockTree:
+    """一本书页面中顶层块的本地镜像
+
+    按顺序保存顶层块的ID、类型和内容哈希，以及子块所属的顶层块。
+    第一次使用时分页读取页面的所有子块，之后追加和删除块时同步更新，
+    确定插入位置和查找目录都不需要再请求Notion。
+    """
+
+    def __init__(self, notion_helper, page_id):
+        self.notion_helper = notion_helper
+        self.page_id = page_id
+        self.lock = threading.RLock()
+        # 按页面中的顺序保存顶层块，键为去掉横线的块ID
+        self._nodes = None
+        # 子块ID到顶层块ID，以及顶层块ID到它的子块ID
+        self.parents = {}
+        self.children = {}
+
+    @property
+    def nodes(self):
+        with self.lock:
+            if self._nodes is None:
+                children = self.notion_helper.list_children(
+                    self.page_id, PRIORITY_BLOCKS
+                )
+                self._nodes = collections.OrderedDict(
+                    (normalize_id(x.get("id")), self.to_item(x)) for x in children
+                )
+            return self._nodes
+
+    @property
+    def blocks(self):
+        """顶层块列表，每一项为 {id, type, hash}"""
+        with self.lock:
+            return list(self.nodes.values())
+
+    def to_item(self, block):
+        return {
+            "id": block.get("id"),
+            "type": block.get("type"),
+            "hash": get_block_hash(block),
+        }
+
+    def find(self, block_id):
+        """顶层块，不存在时返回None"""
+        return self.nodes.get(normalize_id(block_id))
+
+    def contains(self, block_id):
+        return self.find(block_id) is not None or normalize_id(block_id) in self.parents
+
+    def get_table_of_contents(self):
+        """页面第一个块是目录时返回目录的ID"""
+        first = next(iter(self.nodes.values()), None)
+        if first and first["type"] == "table_of_contents":
+            return first["id"]
+        return None
+
+    def resolve_anchor(self, after):
+        """插入位置是子块时改为它所属的顶层块，未知的块返回None"""
+        if self.find(after) is not None:
+            return after
+        return self.parents.get(normalize_id(after))
+
+    def insert_after(self, after, results, children):
+        """记录追加的块，results为Notion返回的结果，前len(children)个是新块"""
+        with self.lock:
+            if self._nodes is None:
+                # 还没有读取过，下次读取时会包含这些块
+                return
+            nodes = self._nodes
+            anchor = normalize_id(after) if after else None
+            # 插入位置后面的块，新块加入后再移到末尾
+            tail = []
+            if anchor in nodes:
+                keys = iter(nodes)
+                for key in keys:
+                    if key == anchor:
+                        break
+                tail = list(keys)
+            for result, child in zip(results, children):
+                item = self.to_item(child)
+                item["id"] = result.get("id")
+                nodes[normalize_id(item["id"])] = item
+            for key in tail:
+                nodes.move_to_end(key)
+
+    def add_children(self, parent_id, results):
+        """记录顶层块下面的子块，比如笔记的摘要"""
+        with self.lock:
+            for result in results:
+                child = normalize_id(result.get("id"))
+                self.parents[child] = parent_id
+                self.children.setdefault(normalize_id(parent_id), set()).add(child)
+
+    def update(self, block_id, block):
+        with self.lock:
+            item = self.find(block_id) if self._nodes is not None else None
+            if item is not None:
+                item["hash"] = get_block_hash(block)
+
+    def remove(self, block_id):
+        with self.lock:
+            block_id = normalize_id(block_id)
+            if self._nodes is not None:
+                self._nodes.pop(block_id, None)
+            for child in self.children.pop(block_id, ()):
+                self.parents.pop(child, None)
+            parent = self.parents.pop(block_id, None)
+            if parent is not None:
+                self.children.get(normalize_id(parent), set()).discard(block_id)
@@ -1,9 +1,14 @@
+import sys
+
 import pendulum
 
 from weread2notionpro import utils
+from weread2notionpro.cache import apply_cache_args
+from weread2notionpro.circuit_breaker import exit_on_cookie_expired
 from weread2notionpro.config import book_properties_type_dict, tz
-from weread2notionpro.notion_helper import NotionHelper
-from weread2notionpro.weread_api import WeReadApi
+from weread2notionpro.notion_helper import READ_FIELDS, NotionHelper
+from weread2notionpro.notion_scheduler import PRIORITY_ROWS
+from weread2notionpro.weread_api import AsyncWeReadApi, WeReadApi
 
 TAG_ICON_URL = "https://www.notion.so/icons/tag_gray.svg"
 USER_ICON_URL = "https://www.notion.so/icons/user-circle-filled_gray.svg"
@@ -11,21 +16,46 @@ BOOK_ICON_URL = "https://www.notion.so/icons/book_gray.svg"
 rating = {"poor": "⭐️", "fair": "⭐️⭐️⭐️", "good": "⭐️⭐️⭐️⭐️⭐️"}
 
 
-def insert_book_to_notion(books, index, bookId):
-    """插入Book到Notion"""
+def iter_books_to_sync(bookIds, not_need_sync):
+    """逐个返回需要同步的书籍ID，跳过重复的和不需要同步的书籍"""
+    seen = set(not_need_sync)
+    for bookId in bookIds:
+        if bookId not in seen:
+            seen.add(bookId)
+            yield bookId
+
+
+def get_book_time(data):
+    """书籍的时间，和insert_book_to_notion中的取值一致，用于提前解析日期关联"""
+    readInfo = data.get("get_read_info")
+    if not isinstance(readInfo, dict):
+        return None
+    info = dict(readInfo)
+    info.update(readInfo.get("readDetail", {}))
+    info.update(readInfo.get("bookInfo", {}))
+    timestamp = utils.get_book_timestamp(info)
+    if timestamp:
+        return pendulum.from_timestamp(timestamp, tz="Asia/Shanghai")
+
+
+def insert_book_to_notion(total, index, bookId, data=None):
+    """插入Book到Notion，data为预先并发获取的书籍详情和阅读进度"""
+    if data is None:
+        data = async_weread_api.fetch_books_sync([bookId], BOOK_DATA_METHODS)[bookId]
     book = {}
     if bookId in archive_dict:
         book["书架分类"] = archive_dict.get(bookId)
     if bookId in notion_books:
         book.update(notion_books.get(bookId))
-    try:
-        bookInfo = weread_api.get_bookinfo(bookId)
-        if bookInfo != None:
-            book.update(bookInfo)
-    except Exception as e:
-        print(f"获取书籍信息失败 bookId={bookId}: {e}")
+    bookInfo = data.get("get_bookinfo")
+    if isinstance(bookInfo, Exception):
+        print(f"获取书籍信息失败 bookId={bookId}: {bookInfo}")
         # 继续处理，不中断整个流程
-    readInfo = weread_api.get_read_info(bookId)
+    elif bookInfo != None:
+        book.update(bookInfo)
+    readInfo = data.get("get_read_info")
+    if isinstance(readInfo, Exception):
+        raise readInfo
     # 研究了下这个状态不知道什么情况有的虽然读了状态还是1 markedStatus = 1 想读 4 读完 其他为在读
     readInfo.update(readInfo.get("readDetail", {}))
     readInfo.update(readInfo.get("bookInfo", {}))
@@ -47,11 +77,7 @@ def insert_book_to_notion(books, index, bookId):
         book["我的评分"] = rating.get(book.get("newRatingDetail").get("myRating"))
     elif status == "已读":
         book["我的评分"] = "未评分"
-    book["时间"] = (
-        book.get("finishedDate")
-        or book.get("lastReadingDate")
-        or book.get("readingBookDate")
-    )
+    book["时间"] = utils.get_book_timestamp(book)
     book["开始阅读时间"] = book.get("beginReadingDate")
     book["最后阅读时间"] = book.get("lastReadingDate")
     cover = book.get("cover")
@@ -91,7 +117,7 @@ def insert_book_to_notion(books, index, bookId):
             pendulum.from_timestamp(book.get("时间"), tz="Asia/Shanghai"),
         )
 
-    print(f"正在插入《{book.get('title')}》,一共{len(books)}本，当前是第{index+1}本。")
+    print(f"正在插入《{book.get('title')}》,一共{total}本，当前是第{index+1}本。")
     parent = {"database_id": notion_helper.book_database_id, "type": "database_id"}
     result = None
     if bookId in notion_books:
@@ -116,10 +142,13 @@ def insert_book_to_notion(books, index, bookId):
 def insert_read_data(page_id, readTimes):
     readTimes = dict(sorted(readTimes.items()))
     filter = {"property": "书架", "relation": {"contains": page_id}}
-    results = notion_helper.query_all_by_book(notion_helper.read_database_id, filter)
+    results = notion_helper.query_all_by_book(
+        notion_helper.read_database_id, filter, list(READ_FIELDS.values())
+    )
     for result in results:
-        timestamp = result.get("properties").get("时间戳").get("number")
-        duration = result.get("properties").get("时长").get("number")
+        fields = utils.decode_properties(result, READ_FIELDS)
+        timestamp = fields.get("timestamp")
+        duration = fields.get("duration")
         id = result.get("id")
         if timestamp in readTimes:
             value = readTimes.pop(timestamp)
@@ -150,45 +179,67 @@ def insert_to_notion(page_id, timestamp, duration, book_database_id):
         "书架": utils.get_relation([book_database_id]),
     }
     if page_id != None:
-        notion_helper.client.pages.update(page_id=page_id, properties=properties)
+        notion_helper.call(
+            "pages.update", PRIORITY_ROWS, page_id=page_id, properties=properties
+        )
     else:
-        notion_helper.client.pages.create(
+        notion_helper.call(
+            "pages.create",
+            PRIORITY_ROWS,
             parent=parent,
             icon=utils.get_icon("https://www.notion.so/icons/target_red.svg"),
             properties=properties,
         )
 
 
+BOOK_DATA_METHODS = ["get_bookinfo", "get_read_info"]
 weread_api = WeReadApi()
+async_weread_api = AsyncWeReadApi(weread_api)
 notion_helper = NotionHelper()
 archive_dict = {}
 notion_books = {}
 
 
+@exit_on_cookie_expired
 def main():
     global notion_books
     global archive_dict
-    bookshelf_books = weread_api.get_bookshelf()
+    # 在main中处理命令行参数，通过console_scripts运行时同样生效
+    if len(sys.argv) > 1 and sys.argv[1] == "--help":
+        print("微信读书书籍同步工具")
+        print("用法: python -m weread2notionpro.book [--no-cache] [--clear-cache]")
+        print("功能: 同步微信读书的书籍信息到Notion")
+        print("  --no-cache     不读取也不写入本地接口缓存")
+        print("  --clear-cache  运行前清空本地接口缓存")
+        sys.exit(0)
+    apply_cache_args(weread_api.cache, sys.argv[1:])
+    # 流式读取书架，只保留书籍ID、阅读时长和分类，不保存完整的书籍数据
+    # 书架和笔记本列表是同一个接口，读取一次即可
+    shelf_book_ids = []
+    bookProgress = None
+    archives_found = False
+    for key, item in weread_api.iter_bookshelf():
+        if key == "books" and "bookId" in item:
+            shelf_book_ids.append(item["bookId"])
+        elif key == "bookProgress":
+            if bookProgress is None:
+                bookProgress = {}
+            bookProgress[item.get("bookId")] = {"readingTime": item.get("readingTime")}
+        elif key == "archive":
+            archives_found = True
+            name = item.get("name")
+            archive_dict.update({bookId: name for bookId in item.get("bookIds")})
     notion_books = notion_helper.get_all_book()
 
     # 处理bookProgress - 如果不存在则创建空字典
-    bookProgress = bookshelf_books.get("bookProgress")
     if bookProgress is None:
         print("警告: 未找到bookProgress数据，使用空数据继续")
         bookProgress = {}
-    else:
-        bookProgress = {book.get("bookId"): book for book in bookProgress}
 
     # 处理archive - 如果不存在则跳过
-    archives = bookshelf_books.get("archive")
-    if archives is None:
+    if not archives_found:
         print("警告: 未找到archive数据，跳过书架分类")
-    else:
-        for archive in archives:
-            name = archive.get("name")
-            bookIds = archive.get("bookIds")
-            archive_dict.update({bookId: name for bookId in bookIds})
-    not_need_sync = []
+    not_need_sync = set()
     for key, value in notion_books.items():
         if (
             (
@@ -202,22 +253,23 @@ def main():
                 or (value.get("status") == "已读" and value.get("myRating"))
             )
         ):
-            not_need_sync.append(key)
-    notebooks = weread_api.get_notebooklist()
-    notebooks = [d["bookId"] for d in notebooks if "bookId" in d]
-    books = bookshelf_books.get("books")
-    books = [d["bookId"] for d in books if "bookId" in d]
-    books = list((set(notebooks) | set(books)) - set(not_need_sync))
-    for index, bookId in enumerate(books):
-        insert_book_to_notion(books, index, bookId)
+            not_need_sync.add(key)
+    total = len(set(shelf_book_ids) - not_need_sync)
+    books = iter_books_to_sync(shelf_book_ids, not_need_sync)
+    # 分批并发获取书籍数据，再依次写入Notion
+    batch_size = async_weread_api.concurrency * 4
+    index = 0
+    for batch in utils.iter_batches(books, batch_size):
+        book_data = async_weread_api.fetch_books_sync(batch, BOOK_DATA_METHODS)
+        notion_helper.calendar.resolve(
+            get_book_time(data) for data in book_data.values()
+        )
+        for bookId in batch:
+            insert_book_to_notion(total, index, bookId, book_data.get(bookId))
+            index += 1
+    notion_helper.flush()
+    print(f"微信读书限流状态: {weread_api.limiter.state()}")
 
 
 if __name__ == "__main__":
-    import sys
-
-    if len(sys.argv) > 1 and sys.argv[1] == "--help":
-        print("微信读书书籍同步工具")
-        print("用法: python -m weread2notionpro.book")
-        print("功能: 同步微信读书的书籍信息到Notion")
-        sys.exit(0)
     main()
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from weread2notionpro.utils import get_data_path
+
+# 各接口的缓存有效期（秒），0表示不缓存
+# 书籍详情和章节几乎不变，阅读进度只短时间缓存，划线和笔记不缓存
+DEFAULT_TTL_POLICY = {
+    "book_info": 7 * 24 * 3600,
+    "chapter_info": 24 * 3600,
+    "read_info": 10 * 60,
+    "bookmark_list": 0,
+    "review_list": 0,
+}
+# 缓存文件的大小上限（MB），超出后按最近最少使用淘汰
+DEFAULT_MAX_SIZE_MB = 100
+
+
+def get_account_key(cookie):
+    """Cookie对应账号的哈希，优先使用Cookie中的wr_vid，没有时使用整个Cookie"""
+    match = re.search(r"(?:^|;)\s*wr_vid=([^;]+)", cookie or "")
+    identity = match.group(1).strip() if match else (cookie or "")
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:16]
+
+
+def has_errcode(value):
+    """接口返回的是错误信息，比如200响应中的限流错误码"""
+    if not isinstance(value, dict):
+        return False
+    return bool(value.get("errcode") or value.get("errCode"))
+
+
+class ResponseCache:
+    """微信读书接口的本地缓存，以账号、接口名和参数作为键
+
+    account为get_account_key返回的账号哈希，缓存目录被多个账号共用时不会读到其他账号的数据。
+
+    每个接口可以单独设置有效期，通过环境变量WEREAD_CACHE_TTL覆盖，
+    格式为 book_info=604800,read_info=600。
+    设置环境变量WEREAD_CACHE=0或者命令行参数--no-cache可以跳过缓存。
+    """
+
+    def __init__(
+        self, path=None, ttl_policy=None, max_size_mb=None, enabled=None, account=None
+    ):
+        self.account = account or ""
+        if enabled is None:
+            enabled = os.getenv("WEREAD_CACHE", "1").lower() not in ("0", "false", "off")
+        self.enabled = enabled
+        self.ttl_policy = dict(DEFAULT_TTL_POLICY)
+        self.ttl_policy.update(self.parse_ttl_policy(os.getenv("WEREAD_CACHE_TTL")))
+        if ttl_policy:
+            self.ttl_policy.update(ttl_policy)
+        if max_size_mb is None:
+            max_size_mb = float(os.getenv("WEREAD_CACHE_MAX_MB") or DEFAULT_MAX_SIZE_MB)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.path = path
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def parse_ttl_policy(self, value):
+        """解析 book_info=604800,read_info=600 格式的有效期配置"""
+        policy = {}
+        if not value:
+            return policy
+        for item in value.split(","):
+            if "=" in item:
+                endpoint, ttl = item.split("=", 1)
+                policy[endpoint.strip()] = int(ttl)
+        return policy
+
+    def connect(self):
+        if self.conn is None:
+            if self.path is None:
+                self.path = get_data_path("weread_cache.sqlite")
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    endpoint TEXT,
+                    value TEXT,
+                    size INTEGER,
+                    expires_at REAL,
+                    accessed_at REAL
+                )"""
+            )
+            self.conn.commit()
+        return self.conn
+
+    def make_key(self, endpoint, params):
+        params = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        key = f"{self.account}:{endpoint}:{params}"
+        return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+    def get_ttl(self, endpoint):
+        return self.ttl_policy.get(endpoint, 0)
+
+    def get(self, endpoint, params):
+        """读取缓存，不存在或者已过期时返回None"""
+        if not self.enabled or self.get_ttl(endpoint) <= 0:
+            return None
+        key = self.make_key(endpoint, params)
+        now = time.time()
+        with self.lock:
+            conn = self.connect()
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+        return json.loads(row[0])
+
+    def set(self, endpoint, params, value):
+        """写入缓存，并在超出大小上限时淘汰最久未使用的数据，错误信息不缓存"""
+        ttl = self.get_ttl(endpoint)
+        if not self.enabled or ttl <= 0 or value is None or has_errcode(value):
+            return
+        key = self.make_key(endpoint, params)
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            conn = self.connect()
+            conn.execute(
+                "REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, data, len(data), now + ttl, now),
+            )
+            self.evict(conn)
+            conn.commit()
+
+    def evict(self, conn):
+        """删除过期数据，总大小超出上限时按最近最少使用淘汰"""
+        conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = conn.execute("SELECT key, size FROM cache ORDER BY accessed_at").fetchall()
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            total -= size
+
+    def clear(self):
+        """清空缓存"""
+        with self.lock:
+            conn = self.connect()
+            conn.execute("DELETE FROM cache")
+            conn.commit()
+        print("已清空微信读书接口缓存")
+
+
+def apply_cache_args(cache, args):
+    """处理命令行参数 --no-cache 和 --clear-cache"""
+    if "--clear-cache" in args:
+        cache.clear()
+    if "--no-cache" in args:
+        cache.enabled = False
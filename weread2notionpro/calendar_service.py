@@ -0,0 +1,76 @@
+import threading
+
+from weread2notionpro.utils import get_relation
+
+CALENDAR_PROPERTIES = ("年", "月", "周", "日")
+
+
+class CalendarService:
+    """批量解析年、月、周、日的关联页面
+
+    先把一次运行中用到的日期一起解析，年、月、周去重后各查一次，
+    之后每个日期的关联直接从预先计算好的字典中取。
+    """
+
+    def __init__(self, notion_helper):
+        self.notion_helper = notion_helper
+        self.lock = threading.RLock()
+        self.bundles = {}
+
+    def get_key(self, date):
+        return date.strftime("%Y-%m-%d")
+
+    def resolve(self, dates, names=CALENDAR_PROPERTIES):
+        """解析所有日期的关联，缺少的页面会被创建
+
+        names中不包含日时不会解析日页面，比如阅读时间本身就写在日数据库中。
+        """
+        with self.lock:
+            missing = {}
+            for date in dates:
+                if date is None:
+                    continue
+                bundle = self.bundles.get(self.get_key(date), {})
+                if any(name not in bundle for name in names):
+                    missing.setdefault(self.get_key(date), date)
+            if not missing:
+                return
+            helper = self.notion_helper
+            years, months, weeks = {}, {}, {}
+            for date in missing.values():
+                years.setdefault(date.strftime("%Y"), date)
+                months.setdefault(date.strftime("%Y-%m"), date)
+                weeks.setdefault(tuple(date.isocalendar())[:2], date)
+            year_ids = {k: helper.get_year_relation_id(d) for k, d in years.items()}
+            month_ids = {k: helper.get_month_relation_id(d) for k, d in months.items()}
+            week_ids = {k: helper.get_week_relation_id(d) for k, d in weeks.items()}
+            for key, date in missing.items():
+                bundle = self.bundles.setdefault(key, {})
+                bundle["年"] = year_ids[date.strftime("%Y")]
+                bundle["月"] = month_ids[date.strftime("%Y-%m")]
+                bundle["周"] = week_ids[tuple(date.isocalendar())[:2]]
+                if "日" in names:
+                    # 日页面的年、月、周关联已经在上面解析过，这里只会命中缓存
+                    bundle["日"] = helper.get_day_relation_id(date)
+            print(f"已解析{len(missing)}个日期的年月周日关联")
+
+    def get(self, date, names=CALENDAR_PROPERTIES):
+        """返回一个日期的关联页面ID，比如 {年, 月, 周, 日}"""
+        bundle = self.bundles.get(self.get_key(date), {})
+        if any(name not in bundle for name in names):
+            self.resolve([date], names)
+            bundle = self.bundles.get(self.get_key(date))
+        return bundle
+
+    def apply(self, properties, date, names=CALENDAR_PROPERTIES):
+        """把日期的关联写入properties"""
+        bundle = self.get(date, names)
+        for name in names:
+            properties[name] = get_relation([bundle[name]])
+        return properties
+
+    def discard(self, page_id):
+        """关联页面失效后删除用到它的日期"""
+        with self.lock:
+            for key in [k for k, v in self.bundles.items() if page_id in v.values()]:
+                self.bundles.pop(key)
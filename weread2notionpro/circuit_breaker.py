@@ -0,0 +1,79 @@
+import functools
+import sys
+import threading
+
+# Cookie过期时的退出码，方便调度程序区分需要重新登录和临时错误
+EXIT_COOKIE_EXPIRED = 78
+COOKIE_GUIDE = "https://mp.weixin.qq.com/s/B_mqLUZv7M1rmXRsMlBf7A"
+
+
+class CookieExpiredError(Exception):
+    """微信读书Cookie过期，需要重新设置"""
+
+
+class CookieRefreshedError(Exception):
+    """Cookie已经重新获取，请求可以重试"""
+
+
+class CookieCircuitBreaker:
+    """Cookie过期熔断器
+
+    收到过期错误码，或者连续多次401/403后熔断，之后所有请求直接失败，不再重试。
+    recover返回True表示已经换了新的Cookie，这时不熔断，抛出可重试的CookieRefreshedError。
+    """
+
+    def __init__(self, max_auth_failures=3, recover=None):
+        self.max_auth_failures = max_auth_failures
+        self.recover = recover
+        self.auth_failures = 0
+        self.reason = None
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.reason is not None
+
+    def trip(self, reason):
+        if self.reason is None and self.recover is not None and self.recover():
+            self.auth_failures = 0
+            raise CookieRefreshedError(f"{reason}，已重新获取Cookie")
+        with self.lock:
+            if self.reason is None:
+                self.reason = reason
+                print(f"::error::微信读书Cookie过期了，请参考文档重新设置。{COOKIE_GUIDE}")
+        raise CookieExpiredError(self.reason)
+
+    def check(self):
+        """已经熔断时抛出CookieExpiredError"""
+        if self.reason is not None:
+            raise CookieExpiredError(self.reason)
+
+    def record_status(self, status_code):
+        """记录响应状态码，连续多次401/403时熔断"""
+        if status_code in (401, 403):
+            with self.lock:
+                self.auth_failures += 1
+                auth_failures = self.auth_failures
+            if auth_failures >= self.max_auth_failures:
+                self.trip(f"连续{auth_failures}次返回{status_code}")
+        else:
+            self.auth_failures = 0
+
+
+def is_retryable(error):
+    """Cookie过期的错误不需要重试"""
+    return not isinstance(error, CookieExpiredError)
+
+
+def exit_on_cookie_expired(func):
+    """Cookie过期时以EXIT_COOKIE_EXPIRED退出"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except CookieExpiredError as error:
+            print(f"同步终止，微信读书Cookie已失效: {error}")
+            sys.exit(EXIT_COOKIE_EXPIRED)
+
+    return wrapper
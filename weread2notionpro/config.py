@@ -1,3 +1,4 @@
+import os
 
 RICH_TEXT = "rich_text"
 URL = "url"
@@ -31,4 +32,6 @@ book_properties_type_dict = {
     "我的评分":SELECT,
     "豆瓣链接":URL,
 }
-tz='Asia/Shanghai' 
\ No newline at end of file
+tz='Asia/Shanghai'
+# 本地缓存和同步状态的保存目录
+DATA_DIR = os.getenv("WEREAD2NOTION_DATA_DIR") or ".weread2notion"
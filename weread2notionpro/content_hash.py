@@ -0,0 +1,69 @@
+import hashlib
+import json
+import sqlite3
+import threading
+
+from weread2notionpro.utils import get_data_path
+
+# 影响块内容和数据库记录的字段
+HASH_FIELDS = {
+    "bookmarkId": ("markText", "colorStyle", "style", "range", "chapterUid", "type"),
+    "reviewId": ("content", "abstract", "star", "range", "chapterUid", "type"),
+}
+
+
+def get_note_key(value):
+    """划线和笔记的ID，章节返回None"""
+    for id_key in HASH_FIELDS:
+        if id_key in value:
+            return f"{id_key}:{value.get(id_key)}"
+    return None
+
+
+def get_content_hash(value):
+    for id_key, fields in HASH_FIELDS.items():
+        if id_key in value:
+            data = [value.get(field) for field in fields]
+            content = json.dumps(data, ensure_ascii=False, sort_keys=True)
+            return hashlib.md5(content.encode("utf-8")).hexdigest()
+    return None
+
+
+class ContentHashStore:
+    """保存已经同步的划线和笔记的内容哈希，用来发现在微信读书中修改过的内容"""
+
+    def __init__(self, path=None):
+        self.path = path if path else get_data_path("content_hash.sqlite")
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes (key TEXT PRIMARY KEY, hash TEXT)"
+        )
+        self.conn.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT hash FROM hashes WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, hash):
+        with self.lock:
+            self.conn.execute("REPLACE INTO hashes VALUES (?, ?)", (key, hash))
+            self.conn.commit()
+
+    def is_changed(self, value):
+        """内容是否变化，第一次见到的内容只记录哈希并返回None"""
+        key = get_note_key(value)
+        hash = get_content_hash(value)
+        stored = self.get(key)
+        if stored is None:
+            self.set(key, hash)
+            return None
+        return stored != hash
+
+    def save(self, value):
+        key = get_note_key(value)
+        if key:
+            self.set(key, get_content_hash(value))
@@ -0,0 +1,65 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from weread2notionpro.utils import get_data_path
+
+# Cookie缓存的有效期（秒），可通过环境变量WEREAD_COOKIE_CACHE_TTL配置
+DEFAULT_COOKIE_CACHE_TTL = 12 * 3600
+
+
+class CookieCache:
+    """加密保存在本地的微信读书Cookie，避免每次运行都请求CookieCloud
+
+    密钥由CookieCloud的ID和密码派生，也可以通过环境变量WEREAD_COOKIE_CACHE_KEY指定。
+    """
+
+    def __init__(self, secret, path=None, ttl=None):
+        salt = b"weread2notionpro-cookie-cache"
+        key = hashlib.pbkdf2_hmac("sha256", secret.encode("utf-8"), salt, 100000)
+        self.fernet = Fernet(base64.urlsafe_b64encode(key))
+        self.path = path if path else get_data_path("cookie_cache.bin")
+        if ttl is None:
+            ttl = int(os.getenv("WEREAD_COOKIE_CACHE_TTL") or DEFAULT_COOKIE_CACHE_TTL)
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.saved_cookie = None
+
+    def load(self, allow_expired=False):
+        """读取缓存的Cookie，不存在、无法解密或者已过期时返回None"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                data = json.loads(self.fernet.decrypt(f.read()))
+        except (InvalidToken, ValueError, OSError) as error:
+            print(f"读取Cookie缓存失败: {error}")
+            return None
+        if not allow_expired and time.time() - data.get("saved_at", 0) > self.ttl:
+            return None
+        self.saved_cookie = data.get("cookie")
+        return self.saved_cookie
+
+    def save(self, cookie):
+        """加密写入Cookie，内容没有变化时跳过"""
+        if not cookie or cookie == self.saved_cookie:
+            return
+        data = json.dumps({"cookie": cookie, "saved_at": time.time()})
+        with self.lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(self.fernet.encrypt(data.encode("utf-8")))
+            os.replace(tmp_path, self.path)
+            self.saved_cookie = cookie
+
+    def invalidate(self):
+        """删除缓存的Cookie"""
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.saved_cookie = None
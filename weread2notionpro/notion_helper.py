@@ -1,15 +1,29 @@
+import hashlib
+import json
 import logging
 import os
 import re
 import time
+from urllib.parse import unquote
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-from notion_client import Client
+from notion_client import APIResponseError
 import pendulum
 from retrying import retry
 from datetime import timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
+from weread2notionpro.block_tree import BlockTree
+from weread2notionpro.calendar_service import CalendarService
+from weread2notionpro.notion_mirror import NotionMirror, get_filter_properties
+from weread2notionpro.relation_cache import RelationCache
+from weread2notionpro.notion_scheduler import (
+    PRIORITY_BLOCKS,
+    PRIORITY_DEFAULT,
+    PRIORITY_ROWS,
+    NotionScheduler,
+)
 from weread2notionpro.utils  import (
     format_date,
     get_date,
@@ -23,12 +37,37 @@ from weread2notionpro.utils  import (
     get_title,
     timestamp_to_date,
     get_property_value,
+    decode_properties,
+    get_data_path,
+    load_json,
+    save_json,
 )
 
 TAG_ICON_URL = "https://www.notion.so/icons/tag_gray.svg"
 USER_ICON_URL = "https://www.notion.so/icons/user-circle-filled_gray.svg"
 TARGET_ICON_URL = "https://www.notion.so/icons/target_red.svg"
 BOOKMARK_ICON_URL = "https://www.notion.so/icons/bookmark_gray.svg"
+# 限速和429由NotionScheduler处理，其他错误短暂退避后重试
+RETRY_OPTIONS = dict(
+    stop_max_attempt_number=3,
+    wait_exponential_multiplier=500,
+    wait_exponential_max=4000,
+)
+# get_all_book需要的书籍属性
+BOOK_FIELDS = {
+    "readingTime": "阅读时长",
+    "category": "书架分类",
+    "Sort": "Sort",
+    "douban_url": "豆瓣链接",
+    "myRating": "我的评分",
+    "comment": "豆瓣短评",
+    "status": "阅读状态",
+}
+# 阅读记录数据库需要的属性，book和read_time共用
+READ_FIELDS = {"timestamp": "时间戳", "duration": "时长"}
+# 修改update_book_database、create_database等数据库结构时加1，下次运行会重新检查
+SCHEMA_VERSION = 1
+DEFAULT_SETTING_TTL = 6 * 3600
 
 
 class NotionHelper:
@@ -52,13 +91,47 @@ class NotionHelper:
     block_type = "callout"
     sync_bookmark = True
     def __init__(self):
-        self.client = Client(auth=os.getenv("NOTION_TOKEN"), log_level=logging.ERROR)
+        # 设置NOTION_BASE_URL可以连接到本地模拟的Notion API
+        client_options = {}
+        if os.getenv("NOTION_BASE_URL"):
+            client_options["base_url"] = os.getenv("NOTION_BASE_URL").rstrip("/")
+        self.scheduler = NotionScheduler(
+            auth=os.getenv("NOTION_TOKEN"), log_level=logging.ERROR, **client_options
+        )
+        self.mirror = None
+        if os.getenv("NOTION_MIRROR", "1").lower() not in ("0", "false", "off"):
+            self.mirror = NotionMirror()
         self.__cache = {}
+        self.relation_cache = RelationCache()
+        # 本次运行中每个关联页面的创建参数，页面失效后用来重新创建
+        self.relation_args = {}
+        self.calendar = CalendarService(self)
+        self.block_trees = {}
+        # 不等待结果的后台请求，flush时等待完成
+        self.background_futures = []
         self.page_id = self.extract_page_id(os.getenv("NOTION_PAGE"))
-        self.search_database(self.page_id)
         for key in self.database_name_dict.keys():
             if os.getenv(key) != None and os.getenv(key) != "":
                 self.database_name_dict[key] = os.getenv(key)
+        self.database_cache_path = get_data_path("notion_databases.json")
+        self.databases_revalidated = False
+        self.search_database(self.page_id)
+        self.set_database_ids()
+        self.schema_state_path = get_data_path("notion_schema.json")
+        self.setting_ttl = int(os.getenv("NOTION_SETTING_TTL") or DEFAULT_SETTING_TTL)
+        self.schema_checked = False
+        self.property_ids = {}
+        if self.get_schema_state().get("fingerprint") != self.get_schema_fingerprint():
+            self.migrate_schema()
+        if self.read_database_id is None:
+            self.create_database()
+        if self.setting_database_id is None:
+            self.create_setting_database()
+        if self.setting_database_id:
+            self.insert_to_setting_database()
+
+    def set_database_ids(self):
+        """根据数据库名称设置各个数据库的ID"""
         self.book_database_id = self.database_id_dict.get(
             self.database_name_dict.get("BOOK_DATABASE_NAME")
         )
@@ -91,17 +164,57 @@ class NotionHelper:
         )
         self.read_database_id = self.database_id_dict.get(
             self.database_name_dict.get("READ_DATABASE_NAME")
-        )  
+        )
         self.setting_database_id = self.database_id_dict.get(
             self.database_name_dict.get("SETTING_DATABASE_NAME")
         )
+
+    def get_schema_state(self):
+        return load_json(self.schema_state_path, {}).get(self.page_id, {})
+
+    def update_schema_state(self, **kwargs):
+        state = load_json(self.schema_state_path, {})
+        state.setdefault(self.page_id, {}).update(kwargs)
+        save_json(self.schema_state_path, state)
+
+    def get_schema_fingerprint(self):
+        """数据库结构的指纹，数据库ID、名称或者SCHEMA_VERSION变化时才需要重新检查"""
+        data = {
+            "version": SCHEMA_VERSION,
+            "names": self.database_name_dict,
+            "databases": self.database_id_dict,
+        }
+        content = json.dumps(data, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def migrate_schema(self):
+        """检查并更新数据库结构，完成后保存指纹"""
+        self.schema_checked = True
         self.update_book_database()
         if self.read_database_id is None:
             self.create_database()
         if self.setting_database_id is None:
             self.create_setting_database()
-        if self.setting_database_id:
-            self.insert_to_setting_database()
+        self.property_ids = {}
+        self.update_schema_state(
+            fingerprint=self.get_schema_fingerprint(), property_ids={}
+        )
+
+    def call(self, path, priority=PRIORITY_DEFAULT, **kwargs):
+        """通过调度器请求Notion，path为客户端的方法，比如pages.create"""
+        try:
+            response = self.scheduler.call(path, priority, **kwargs)
+        except APIResponseError as error:
+            if not self.recover_from_error(path, error, kwargs):
+                raise
+            response = self.scheduler.call(path, priority, **kwargs)
+        if self.mirror:
+            # 自己写入的页面直接更新到本地镜像，不用再从Notion读回来
+            if path in ("pages.create", "pages.update"):
+                self.mirror.upsert(response)
+            elif path == "blocks.delete":
+                self.mirror.delete(kwargs.get("block_id"))
+        return response
 
     def extract_page_id(self, notion_url):
         # 正则表达式匹配 32 个字符的 Notion page_id
@@ -114,25 +227,125 @@ class NotionHelper:
         else:
             raise Exception(f"获取NotionID失败，请检查输入的Url是否正确")
 
+    def recover_from_error(self, path, error, kwargs):
+        """请求失败时检查缓存的数据库和关联页面是否失效，返回是否可以重试"""
+        if error.status == 404 and self.replace_stale_database(kwargs):
+            return True
+        if path not in ("pages.create", "pages.update"):
+            return False
+        if self.replace_stale_relations(kwargs.get("properties")):
+            return True
+        if error.code == "validation_error" and not self.schema_checked:
+            # 数据库结构可能在Notion中被修改了，重新检查一次
+            print("写入失败，重新检查数据库结构")
+            self.migrate_schema()
+            return True
+        return False
+
     def search_database(self, block_id):
-        children = self.client.blocks.children.list(block_id=block_id)["results"]
-        # 遍历子块
-        for child in children:
-            # 检查子块的类型
-            if child["type"] == "child_database":
-                self.database_id_dict[child.get("child_database").get("title")] = (
-                    child.get("id")
-                )
-            elif child["type"] == "embed" and child.get("embed").get("url"):
-                if child.get("embed").get("url").startswith("https://heatmap.malinkang.com/"):
-                    self.heatmap_block_id = child.get("id")
-            # 如果子块有子块，递归调用函数
-            if "has_children" in child and child["has_children"]:
-                self.search_database(child["id"])
+        """查找页面下的数据库和热力图，结果缓存在本地，ID失效时再重新查找
+
+        只有所有配置的数据库名称都在缓存中时才使用缓存，
+        数据库新增或者改名后会重新查找。
+        """
+        cache = load_json(self.database_cache_path, {})
+        cached = cache.get(block_id)
+        names = set(self.database_name_dict.values())
+        if cached and names.issubset(cached.get("databases")):
+            self.database_id_dict.update(cached.get("databases"))
+            self.heatmap_block_id = cached.get("heatmap_block_id")
+            return
+        self.walk_blocks(block_id)
+        self.save_database_cache()
+
+    def save_database_cache(self):
+        cache = load_json(self.database_cache_path, {})
+        cache[self.page_id] = {
+            "databases": self.database_id_dict,
+            "heatmap_block_id": self.heatmap_block_id,
+        }
+        save_json(self.database_cache_path, cache)
+
+    def list_children(self, block_id, priority=PRIORITY_DEFAULT):
+        """分页获取所有子块"""
+        results = []
+        start_cursor = None
+        while True:
+            kwargs = {"start_cursor": start_cursor} if start_cursor else {}
+            response = self.call(
+                "blocks.children.list",
+                priority,
+                block_id=block_id,
+                page_size=100,
+                **kwargs,
+            )
+            results.extend(response.get("results"))
+            if not response.get("has_more"):
+                return results
+            start_cursor = response.get("next_cursor")
+
+    def walk_blocks(self, block_id):
+        """并发遍历页面的子块，找到所有配置的数据库和热力图后提前结束"""
+        names = set(self.database_name_dict.values())
+
+        def found_all():
+            return names.issubset(self.database_id_dict) and self.heatmap_block_id
+
+        executor = ThreadPoolExecutor(max_workers=self.scheduler.max_concurrency)
+        pending = {executor.submit(self.list_children, block_id)}
+        try:
+            while pending and not found_all():
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for child in future.result():
+                        # 检查子块的类型
+                        if child["type"] == "child_database":
+                            self.database_id_dict[
+                                child.get("child_database").get("title")
+                            ] = child.get("id")
+                        elif child["type"] == "embed" and child.get("embed").get("url"):
+                            if child.get("embed").get("url").startswith(
+                                "https://heatmap.malinkang.com/"
+                            ):
+                                self.heatmap_block_id = child.get("id")
+                        # 子块有子块时继续遍历，兄弟节点的子树并发遍历
+                        if child.get("has_children"):
+                            pending.add(
+                                executor.submit(self.list_children, child["id"])
+                            )
+        finally:
+            # 找到所有数据库后不再遍历还没有开始的子块
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def replace_stale_database(self, kwargs):
+        """缓存的数据库ID失效时重新查找，每次运行只重新查找一次"""
+        if self.databases_revalidated:
+            return False
+        names = {id: name for name, id in self.database_id_dict.items()}
+        parent = kwargs.get("parent") or {}
+        containers = [x for x in (kwargs, parent) if x.get("database_id") in names]
+        if not containers:
+            return False
+        print("缓存的数据库ID已失效，重新查找数据库")
+        self.databases_revalidated = True
+        self.database_id_dict.clear()
+        self.heatmap_block_id = None
+        self.walk_blocks(self.page_id)
+        self.save_database_cache()
+        self.set_database_ids()
+        replaced = False
+        for container in containers:
+            id = self.database_id_dict.get(names.get(container["database_id"]))
+            if id and id != container["database_id"]:
+                container["database_id"] = id
+                replaced = True
+        return replaced
 
     def update_book_database(self):
         """更新数据库"""
-        response = self.client.databases.retrieve(database_id=self.book_database_id)
+        response = self.call("databases.retrieve", database_id=self.book_database_id)
         id = response.get("id")
         properties = response.get("properties")
         update_properties = {}
@@ -163,7 +376,7 @@ class NotionHelper:
             update_properties["豆瓣短评"] = {"rich_text": {}}
         """NeoDB先不添加了，现在受众还不广，可能有的小伙伴不知道是干什么的"""
         if len(update_properties) > 0:
-            self.client.databases.update(database_id=id, properties=update_properties)
+            self.call("databases.update", database_id=id, properties=update_properties)
 
     def create_database(self):
         title = [
@@ -187,12 +400,17 @@ class NotionHelper:
             },
         }
         parent = parent = {"page_id": self.page_id, "type": "page_id"}
-        self.read_database_id = self.client.databases.create(
+        self.read_database_id = self.call(
+            "databases.create",
             parent=parent,
             title=title,
             icon=get_icon("https://www.notion.so/icons/target_gray.svg"),
             properties=properties,
-        ).get("id")    
+        ).get("id")
+        self.database_id_dict[
+            self.database_name_dict.get("READ_DATABASE_NAME")
+        ] = self.read_database_id
+        self.save_database_cache()
         
     def create_setting_database(self):
         title = [
@@ -232,18 +450,50 @@ class NotionHelper:
             "最后同步时间": {"date": {}},
         }
         parent = parent = {"page_id": self.page_id, "type": "page_id"}
-        self.setting_database_id = self.client.databases.create(
+        self.setting_database_id = self.call(
+            "databases.create",
             parent=parent,
             title=title,
             icon=get_icon("https://www.notion.so/icons/gear_gray.svg"),
             properties=properties,
         ).get("id")
+        self.database_id_dict[
+            self.database_name_dict.get("SETTING_DATABASE_NAME")
+        ] = self.setting_database_id
+        self.save_database_cache()
+
+    def log_background_error(self, future):
+        """后台请求失败时输出错误，不中断同步"""
+        if not future.cancelled() and future.exception() is not None:
+            print(f"更新最后同步时间失败: {future.exception()}")
+
+    def flush(self):
+        """等待后台提交的请求完成，在运行结束前调用，失败已由回调输出"""
+        futures, self.background_futures = self.background_futures, []
+        wait(futures)
 
     def insert_to_setting_database(self):
+        """读取设置并更新最后同步时间，设置在本地缓存setting_ttl秒"""
+        now = pendulum.now("Asia/Shanghai").isoformat()
+        settings = self.get_schema_state().get("settings")
+        if settings and time.time() - settings.get("time", 0) < self.setting_ttl:
+            self.show_color = settings.get("show_color")
+            self.sync_bookmark = settings.get("sync_bookmark")
+            self.block_type = settings.get("block_type")
+            # 不等待结果，不影响启动，运行结束前由flush等待写入完成
+            future = self.scheduler.submit_threadsafe(
+                "pages.update",
+                PRIORITY_ROWS,
+                page_id=settings.get("page_id"),
+                properties={"最后同步时间": {"date": {"start": now}}},
+            )
+            future.add_done_callback(self.log_background_error)
+            self.background_futures.append(future)
+            return
         existing_pages = self.query(database_id=self.setting_database_id, filter={"property": "标题", "title": {"equals": "设置"}}).get("results")
         properties = {
             "标题": {"title": [{"type": "text", "text": {"content": "设置"}}]},
-            "最后同步时间": {"date": {"start": pendulum.now("Asia/Shanghai").isoformat()}},
+            "最后同步时间": {"date": {"start": now}},
             "NotinToken": {"rich_text": [{"type": "text", "text": {"content": os.getenv("NOTION_TOKEN")}}]},
             "NotinPage": {"rich_text": [{"type": "text", "text": {"content": os.getenv("NOTION_PAGE")}}]},
             "WeReadCookie": {"rich_text": [{"type": "text", "text": {"content": os.getenv("WEREAD_COOKIE")}}]},
@@ -254,21 +504,31 @@ class NotionHelper:
             self.sync_bookmark = get_property_value(remote_properties.get("同步书签"))
             self.block_type = get_property_value(remote_properties.get("样式"))
             page_id = existing_pages[0].get("id")
-            self.client.pages.update(page_id=page_id, properties=properties)
+            self.call("pages.update", page_id=page_id, properties=properties)
         else:
             properties["根据划线颜色设置文字颜色"] = {"checkbox": True}
             properties["同步书签"] = {"checkbox": True}
             properties["样式"] = {"select": {"name": "callout"}}
-            self.client.pages.create(
+            page_id = self.call(
+                "pages.create",
                 parent={"database_id": self.setting_database_id},
                 properties=properties,
-            )
-  
-        
+            ).get("id")
+        self.update_schema_state(
+            settings={
+                "page_id": page_id,
+                "show_color": self.show_color,
+                "sync_bookmark": self.sync_bookmark,
+                "block_type": self.block_type,
+                "time": time.time(),
+            }
+        )
 
     def update_heatmap(self, block_id, url):
         # 更新 image block 的链接
-        return self.client.blocks.update(block_id=block_id, embed={"url": url})
+        return self.call(
+            "blocks.update", PRIORITY_BLOCKS, block_id=block_id, embed={"url": url}
+        )
 
     def get_week_relation_id(self, date):
         year = date.isocalendar().year
@@ -325,23 +585,58 @@ class NotionHelper:
 
     def get_relation_id(self, name, id, icon, properties={}):
         key = f"{id}{name}"
+        self.relation_args.setdefault((id, name), (icon, dict(properties)))
         if key in self.__cache:
             return self.__cache.get(key)
-        filter = {"property": "标题", "title": {"equals": name}}
-        response = self.client.databases.query(database_id=id, filter=filter)
-        if len(response.get("results")) == 0:
+        page_id = self.relation_cache.get(id, name)
+        if page_id is None and id not in self.relation_cache.preloaded:
+            # 第一次未命中时全量扫描一次这个数据库，之后直接用缓存
+            self.relation_cache.preload(id, self.query_all(id, ["标题"]))
+            page_id = self.relation_cache.get(id, name)
+        if page_id is None:
             parent = {"database_id": id, "type": "database_id"}
+            properties = dict(properties)
             properties["标题"] = get_title(name)
-            page_id = self.client.pages.create(
-                parent=parent, properties=properties, icon=get_icon(icon)
+            page_id = self.call(
+                "pages.create", parent=parent, properties=properties, icon=get_icon(icon)
             ).get("id")
-        else:
-            page_id = response.get("results")[0].get("id")
+            self.relation_cache.set(id, name, page_id)
         self.__cache[key] = page_id
         return page_id
 
-    def insert_bookmark(self, id, bookmark):
-        icon = get_icon(BOOKMARK_ICON_URL)
+    def is_page_missing(self, page_id):
+        """页面已经被删除或者归档"""
+        try:
+            page = self.scheduler.call("pages.retrieve", page_id=page_id)
+        except APIResponseError as error:
+            return error.status == 404
+        return page.get("archived") or page.get("in_trash")
+
+    def replace_stale_relations(self, properties):
+        """写入失败时检查用到的缓存关联页面，把失效的页面重新创建并替换
+
+        返回是否有替换，有替换时可以重试写入。
+        """
+        replaced = False
+        for property in (properties or {}).values():
+            for relation in property.get("relation") or []:
+                page_id = relation.get("id")
+                found = self.relation_cache.find(page_id)
+                if found is None or not self.is_page_missing(page_id):
+                    continue
+                id, name = found
+                print(f"关联页面「{name}」已失效，重新创建")
+                self.relation_cache.remove(page_id)
+                self.__cache.pop(f"{id}{name}", None)
+                if self.mirror:
+                    self.mirror.delete(page_id)
+                self.calendar.discard(page_id)
+                icon, args = self.relation_args.get((id, name), (TARGET_ICON_URL, {}))
+                relation["id"] = self.get_relation_id(name, id, icon, args)
+                replaced = True
+        return replaced
+
+    def get_bookmark_properties(self, id, bookmark):
         properties = {
             "Name": get_title(bookmark.get("markText", "")),
             "bookId": get_rich_text(bookmark.get("bookId")),
@@ -359,12 +654,15 @@ class NotionHelper:
             create_time = timestamp_to_date(int(bookmark.get("createTime")))
             properties["Date"] = get_date(create_time.strftime("%Y-%m-%d %H:%M:%S"))
             self.get_date_relation(properties, create_time)
+        return properties
+
+    def insert_bookmark(self, id, bookmark):
+        icon = get_icon(BOOKMARK_ICON_URL)
+        properties = self.get_bookmark_properties(id, bookmark)
         parent = {"database_id": self.bookmark_database_id, "type": "database_id"}
         self.create_page(parent, properties, icon)
 
-    def insert_review(self, id, review):
-        time.sleep(0.1)
-        icon = get_icon(TAG_ICON_URL)
+    def get_review_properties(self, id, review):
         properties = {
             "Name": get_title(review.get("content", "")),
             "bookId": get_rich_text(review.get("bookId")),
@@ -385,11 +683,25 @@ class NotionHelper:
             create_time = timestamp_to_date(int(review.get("createTime")))
             properties["Date"] = get_date(create_time.strftime("%Y-%m-%d %H:%M:%S"))
             self.get_date_relation(properties, create_time)
+        return properties
+
+    def insert_review(self, id, review):
+        icon = get_icon(TAG_ICON_URL)
+        properties = self.get_review_properties(id, review)
         parent = {"database_id": self.review_database_id, "type": "database_id"}
         self.create_page(parent, properties, icon)
 
+    def update_note(self, page_id, id, value):
+        """更新已经存在的划线或笔记记录，page_id为记录的ID，id为书籍页面的ID"""
+        if "bookmarkId" in value:
+            properties = self.get_bookmark_properties(id, value)
+        elif "reviewId" in value:
+            properties = self.get_review_properties(id, value)
+        else:
+            properties = {"blockId": get_rich_text(value.get("blockId"))}
+        return self.update_book_page(page_id, properties)
+
     def insert_chapter(self, id, chapter):
-        time.sleep(0.1)
         icon = {"type": "external", "external": {"url": TAG_ICON_URL}}
         properties = {
             "Name": get_title(chapter.get("title")),
@@ -404,135 +716,212 @@ class NotionHelper:
         parent = {"database_id": self.chapter_database_id, "type": "database_id"}
         self.create_page(parent, properties, icon)
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
+    @retry(**RETRY_OPTIONS)
     def update_book_page(self, page_id, properties):
-        return self.client.pages.update(page_id=page_id, properties=properties)
+        return self.call("pages.update", page_id=page_id, properties=properties)
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
+    @retry(**RETRY_OPTIONS)
     def update_page(self, page_id, properties, cover):
-        return self.client.pages.update(
-            page_id=page_id, properties=properties, cover=cover
+        return self.call(
+            "pages.update", page_id=page_id, properties=properties, cover=cover
         )
 
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
+    @retry(**RETRY_OPTIONS)
     def create_page(self, parent, properties, icon):
-        return self.client.pages.create(parent=parent, properties=properties, icon=icon)
+        return self.call(
+            "pages.create",
+            PRIORITY_ROWS,
+            parent=parent,
+            properties=properties,
+            icon=icon,
+        )
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
+    @retry(**RETRY_OPTIONS)
     def create_book_page(self, parent, properties, icon):
-        return self.client.pages.create(
-            parent=parent, properties=properties, icon=icon, cover=icon
+        return self.call(
+            "pages.create", parent=parent, properties=properties, icon=icon, cover=icon
         )
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
+    @retry(**RETRY_OPTIONS)
     def query(self, **kwargs):
         kwargs = {k: v for k, v in kwargs.items() if v}
-        return self.client.databases.query(**kwargs)
+        return self.call("databases.query", **kwargs)
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
+    @retry(**RETRY_OPTIONS)
     def get_block_children(self, id):
-        response = self.client.blocks.children.list(id)
-        return response.get("results")
-
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
+        return self.list_children(id, PRIORITY_BLOCKS)
+
+    def get_block_tree(self, page_id):
+        """书籍页面的块镜像，第一次使用时才读取"""
+        tree = self.block_trees.get(page_id)
+        if tree is None:
+            tree = self.block_trees[page_id] = BlockTree(self, page_id)
+        return tree
+
+    def find_block_tree(self, block_id):
+        """查找包含这个块的页面镜像"""
+        for tree in self.block_trees.values():
+            if tree.contains(block_id):
+                return tree
+        return None
+
+    @retry(**RETRY_OPTIONS)
     def append_blocks(self, block_id, children):
-        return self.client.blocks.children.append(block_id=block_id, children=children)
+        response = self.call(
+            "blocks.children.append",
+            PRIORITY_BLOCKS,
+            block_id=block_id,
+            children=children,
+        )
+        results = response.get("results")[: len(children)]
+        if block_id in self.block_trees:
+            self.block_trees[block_id].insert_after(None, results, children)
+        else:
+            tree = self.find_block_tree(block_id)
+            if tree:
+                tree.add_children(block_id, results)
+        return response
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
+    @retry(**RETRY_OPTIONS)
     def append_blocks_after(self, block_id, children, after):
-        #奇怪不知道为什么会多插入一个children，没找到问题，先暂时这么解决，搜索是否有parent
-        parent = self.client.blocks.retrieve(after).get("parent")
-        if(parent.get("type")=="block_id"):
-            after = parent.get("block_id")
-        return self.client.blocks.children.append(
-            block_id=block_id, children=children, after=after
+        tree = self.block_trees.get(block_id)
+        anchor = tree.resolve_anchor(after) if tree else None
+        if anchor is None:
+            # 不在镜像中的块才需要查询
+            #奇怪不知道为什么会多插入一个children，没找到问题，先暂时这么解决，搜索是否有parent
+            parent = self.call("blocks.retrieve", PRIORITY_BLOCKS, block_id=after).get(
+                "parent"
+            )
+            anchor = after
+            if(parent.get("type")=="block_id"):
+                anchor = parent.get("block_id")
+        response = self.call(
+            "blocks.children.append",
+            PRIORITY_BLOCKS,
+            block_id=block_id,
+            children=children,
+            after=anchor,
+        )
+        if tree:
+            tree.insert_after(anchor, response.get("results")[: len(children)], children)
+        return response
+
+    @retry(**RETRY_OPTIONS)
+    def update_block(self, block_id, block):
+        """更新块的内容，块的类型不能修改"""
+        type = block.get("type")
+        response = self.call(
+            "blocks.update", PRIORITY_BLOCKS, block_id=block_id, **{type: block[type]}
         )
+        for tree in self.block_trees.values():
+            tree.update(block_id, block)
+        return response
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
+    @retry(**RETRY_OPTIONS)
     def delete_block(self, block_id):
-        return self.client.blocks.delete(block_id=block_id)
+        response = self.call("blocks.delete", PRIORITY_BLOCKS, block_id=block_id)
+        for tree in self.block_trees.values():
+            tree.remove(block_id)
+        return response
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
     def get_all_book(self):
-        """从Notion中获取所有的书籍"""
-        results = self.query_all(self.book_database_id)
+        """从Notion中获取所有的书籍，只获取需要的属性"""
+        results = self.query_all(
+            self.book_database_id, ["BookId"] + list(BOOK_FIELDS.values())
+        )
         books_dict = {}
         for result in results:
+            book = decode_properties(result, BOOK_FIELDS)
+            book["pageId"] = result.get("id")
+            book["cover"] = result.get("cover")
             bookId = get_property_value(result.get("properties").get("BookId"))
-            books_dict[bookId] = {
-                "pageId": result.get("id"),
-                "readingTime": get_property_value(
-                    result.get("properties").get("阅读时长")
-                ),
-                "category": get_property_value(
-                    result.get("properties").get("书架分类")
-                ),
-                "Sort": get_property_value(result.get("properties").get("Sort")),
-                "douban_url": get_property_value(
-                    result.get("properties").get("豆瓣链接")
-                ),
-                "cover": result.get("cover"),
-                "myRating": get_property_value(
-                    result.get("properties").get("我的评分")
-                ),
-                "comment": get_property_value(result.get("properties").get("豆瓣短评")),
-                "status": get_property_value(result.get("properties").get("阅读状态")),
-            }
+            books_dict[bookId] = book
         return books_dict
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
-    def query_all_by_book(self, database_id, filter):
+    @retry(**RETRY_OPTIONS)
+    def query_database(self, database_id, filter=None, properties=None):
+        """分页获取database中满足条件的所有数据，properties为需要返回的属性"""
+        try:
+            return self.query_pages(database_id, filter, properties)
+        except APIResponseError as error:
+            if properties is None or error.code != "validation_error":
+                raise
+            # 属性ID可能已经变化，重新获取属性ID后从第一页重新查询，
+            # 否则后面的分页请求还会使用失效的属性ID
+            print("查询指定的属性失败，重新获取属性ID")
+            self.property_ids = {}
+            self.update_schema_state(property_ids={})
+            return self.query_pages(database_id, filter, properties)
+
+    def query_pages(self, database_id, filter=None, properties=None):
+        """分页查询，properties不为None时只返回这些属性"""
         results = []
         has_more = True
         start_cursor = None
+        kwargs = {"filter": filter} if filter else {}
+        if properties is not None:
+            kwargs["filter_properties"] = self.get_property_ids(database_id, properties)
         while has_more:
-            response = self.client.databases.query(
+            response = self.call(
+                "databases.query",
                 database_id=database_id,
-                filter=filter,
                 start_cursor=start_cursor,
                 page_size=100,
+                **kwargs,
             )
             start_cursor = response.get("next_cursor")
             has_more = response.get("has_more")
             results.extend(response.get("results"))
         return results
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
-    def query_all(self, database_id):
-        """获取database中所有的数据"""
-        results = []
-        has_more = True
-        start_cursor = None
-        while has_more:
-            response = self.client.databases.query(
-                database_id=database_id,
-                start_cursor=start_cursor,
-                page_size=100,
-            )
-            start_cursor = response.get("next_cursor")
-            has_more = response.get("has_more")
-            results.extend(response.get("results"))
-        return results
+    def get_property_ids(self, database_id, names):
+        """把属性名称转换成filter_properties需要的属性ID，结果缓存在本地"""
+        if database_id not in self.property_ids:
+            cache = self.get_schema_state().get("property_ids", {})
+            property_ids = cache.get(database_id)
+            if property_ids is None or not set(names) <= set(property_ids):
+                response = self.call("databases.retrieve", database_id=database_id)
+                property_ids = {
+                    name: unquote(property.get("id"))
+                    for name, property in response.get("properties").items()
+                }
+                cache[database_id] = property_ids
+                self.update_schema_state(property_ids=cache)
+            self.property_ids[database_id] = property_ids
+        property_ids = self.property_ids[database_id]
+        return [property_ids[name] for name in names if name in property_ids]
+
+    def refresh_mirror(self, database_id, properties=None):
+        """从Notion刷新数据库的本地镜像，每次运行只刷新一次"""
+        self.mirror.refresh(
+            database_id,
+            lambda filter, properties: self.query_database(
+                database_id, filter, properties
+            ),
+            properties,
+        )
+
+    def query_mirror(self, database_id, filter=None, properties=None):
+        """优先从本地镜像查询，镜像不可用或者条件不支持时查询Notion"""
+        if self.mirror:
+            # 本地计算查询条件需要条件中用到的属性
+            if properties is not None:
+                properties = list(properties) + get_filter_properties(filter)
+            self.refresh_mirror(database_id, properties)
+            try:
+                return self.mirror.query(database_id, filter)
+            except ValueError:
+                pass
+        return self.query_database(database_id, filter, properties)
+
+    def query_all_by_book(self, database_id, filter, properties=None):
+        return self.query_mirror(database_id, filter, properties)
+
+    def query_all(self, database_id, properties=None):
+        """获取database中所有的数据，properties为需要的属性，None表示全部属性"""
+        return self.query_mirror(database_id, properties=properties)
 
     def get_date_relation(self, properties, date):
-        properties["年"] = get_relation(
-            [
-                self.get_year_relation_id(date),
-            ]
-        )
-        properties["月"] = get_relation(
-            [
-                self.get_month_relation_id(date),
-            ]
-        )
-        properties["周"] = get_relation(
-            [
-                self.get_week_relation_id(date),
-            ]
-        )
-        properties["日"] = get_relation(
-            [
-                self.get_day_relation_id(date),
-            ]
-        )
\ No newline at end of file
+        """写入日期对应的年、月、周、日关联"""
+        self.calendar.apply(properties, date)
@@ -0,0 +1,313 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from weread2notionpro.utils import get_data_path
+
+# 建立索引的业务字段，关系字段保存关联的页面ID
+KEY_PROPERTIES = (
+    "BookId",
+    "bookmarkId",
+    "reviewId",
+    "chapterUid",
+    "blockId",
+    "时间戳",
+    "书籍",
+    "书架",
+)
+# 超过这个时间（小时）后全量刷新一次，用来发现在Notion中被删除的页面
+DEFAULT_FULL_REFRESH_HOURS = 24
+
+
+def normalize_id(id):
+    return id.replace("-", "") if id else id
+
+
+def get_plain_value(property):
+    """把Notion的属性转换成可以比较的值"""
+    type = property.get("type")
+    content = property.get(type)
+    if type in ("title", "rich_text"):
+        return "".join(x.get("plain_text", "") for x in content or [])
+    if type == "relation":
+        return [normalize_id(x.get("id")) for x in content or []]
+    if type in ("select", "status"):
+        return content.get("name") if content else None
+    if type == "date":
+        return content.get("start") if content else None
+    return content
+
+
+def get_filter_properties(filter):
+    """查询条件中用到的属性名称"""
+    if not filter:
+        return []
+    if "and" in filter or "or" in filter:
+        return [
+            name
+            for x in filter.get("and", []) + filter.get("or", [])
+            for name in get_filter_properties(x)
+        ]
+    return [filter["property"]] if "property" in filter else []
+
+
+def covers(projection, properties):
+    """projection是否包含properties，None表示全部属性"""
+    if projection is None:
+        return True
+    return properties is not None and set(properties) <= set(projection)
+
+
+def match_filter(page, filter):
+    """在本地计算Notion的查询条件，不支持的条件抛出ValueError"""
+    if "and" in filter:
+        return all(match_filter(page, x) for x in filter["and"])
+    if "or" in filter:
+        return any(match_filter(page, x) for x in filter["or"])
+    property = page.get("properties", {}).get(filter.get("property"))
+    if property is None:
+        raise ValueError(f"不支持的查询条件: {filter}")
+    value = get_plain_value(property)
+    for type in ("relation", "rich_text", "title", "number", "select", "status", "checkbox"):
+        if type in filter:
+            condition = filter[type]
+            break
+    else:
+        raise ValueError(f"不支持的查询条件: {filter}")
+    for operator, expected in condition.items():
+        if operator == "is_empty":
+            return value in (None, "", [])
+        if operator == "is_not_empty":
+            return value not in (None, "", [])
+        if type == "relation":
+            expected = normalize_id(expected)
+        if operator == "equals":
+            return value == expected
+        if operator == "does_not_equal":
+            return value != expected
+        if operator == "contains":
+            return value is not None and expected in value
+        if operator == "does_not_contain":
+            return value is None or expected not in value
+        if operator == "greater_than":
+            return value is not None and value > expected
+        if operator == "less_than":
+            return value is not None and value < expected
+    raise ValueError(f"不支持的查询条件: {filter}")
+
+
+class NotionMirror:
+    """Notion数据库在本地SQLite中的镜像
+
+    首次使用时全量拉取，之后按last_edited_time增量刷新，
+    自己写入的页面直接更新镜像，读取时在本地按索引查询。
+    """
+
+    def __init__(self, path=None, full_refresh_hours=None):
+        self.path = path if path else get_data_path("notion_mirror.sqlite")
+        if full_refresh_hours is None:
+            full_refresh_hours = float(
+                os.getenv("NOTION_MIRROR_FULL_REFRESH_HOURS")
+                or DEFAULT_FULL_REFRESH_HOURS
+            )
+        self.full_refresh_seconds = full_refresh_hours * 3600
+        self.lock = threading.RLock()
+        self.refreshed = set()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                page_id TEXT PRIMARY KEY,
+                database_id TEXT,
+                data TEXT,
+                last_edited_time TEXT
+            );
+            CREATE INDEX IF NOT EXISTS pages_database ON pages (database_id);
+            CREATE TABLE IF NOT EXISTS keys (
+                database_id TEXT,
+                name TEXT,
+                value TEXT,
+                page_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS keys_lookup ON keys (database_id, name, value);
+            CREATE INDEX IF NOT EXISTS keys_page ON keys (page_id);
+            CREATE TABLE IF NOT EXISTS sync (
+                database_id TEXT PRIMARY KEY,
+                watermark TEXT,
+                full_refreshed_at REAL,
+                projection TEXT
+            );
+            """
+        )
+        try:
+            # 旧版本的镜像没有projection字段
+            self.conn.execute("ALTER TABLE sync ADD COLUMN projection TEXT")
+        except sqlite3.OperationalError:
+            pass
+        self.conn.commit()
+
+    def get_database_id(self, page):
+        parent = page.get("parent", {})
+        return normalize_id(parent.get("database_id"))
+
+    def upsert(self, page, commit=True):
+        """保存查询结果或者自己写入的页面"""
+        if not page or page.get("object") != "page":
+            return
+        database_id = self.get_database_id(page)
+        if not database_id:
+            return
+        page_id = normalize_id(page.get("id"))
+        if page.get("archived") or page.get("in_trash"):
+            self.delete(page_id, commit)
+            return
+        with self.lock:
+            self.conn.execute("DELETE FROM keys WHERE page_id = ?", (page_id,))
+            self.conn.execute(
+                "REPLACE INTO pages VALUES (?, ?, ?, ?)",
+                (
+                    page_id,
+                    database_id,
+                    json.dumps(page, ensure_ascii=False),
+                    page.get("last_edited_time"),
+                ),
+            )
+            keys = []
+            for name, property in page.get("properties", {}).items():
+                if name not in KEY_PROPERTIES and property.get("type") != "title":
+                    continue
+                if property.get("type") == "title":
+                    name = "title"
+                value = get_plain_value(property)
+                values = value if isinstance(value, list) else [value]
+                for value in values:
+                    if value not in (None, ""):
+                        keys.append((database_id, name, str(value), page_id))
+            self.conn.executemany("INSERT INTO keys VALUES (?, ?, ?, ?)", keys)
+            if commit:
+                self.conn.commit()
+
+    def delete(self, page_id, commit=True):
+        """页面被删除或者归档"""
+        page_id = normalize_id(page_id)
+        with self.lock:
+            self.conn.execute("DELETE FROM pages WHERE page_id = ?", (page_id,))
+            self.conn.execute("DELETE FROM keys WHERE page_id = ?", (page_id,))
+            if commit:
+                self.conn.commit()
+
+    def refresh(self, database_id, query, properties=None):
+        """从Notion刷新一个数据库，每次运行只刷新一次
+
+        query(filter, properties)返回满足条件的所有页面，filter为None时返回全部页面，
+        properties为需要的属性，None表示全部属性。镜像只保存调用方需要的属性，
+        需要的属性变多时全量刷新一次。
+        """
+        database_id = normalize_id(database_id)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT watermark, full_refreshed_at, projection FROM sync WHERE database_id = ?",
+                (database_id,),
+            ).fetchone()
+        watermark, full_refreshed_at, projection = row if row else (None, 0, None)
+        projection = json.loads(projection) if projection else None
+        if row and not covers(projection, properties):
+            projection = (
+                None if properties is None else sorted(set(projection) | set(properties))
+            )
+            watermark = None
+        elif database_id in self.refreshed:
+            return
+        elif not row:
+            projection = sorted(set(properties)) if properties is not None else None
+        full = not watermark or (
+            time.time() - (full_refreshed_at or 0) > self.full_refresh_seconds
+        )
+        if full:
+            results = query(None, projection)
+        else:
+            results = query(
+                {
+                    "timestamp": "last_edited_time",
+                    "last_edited_time": {"on_or_after": watermark},
+                },
+                projection,
+            )
+        with self.lock:
+            if full:
+                self.conn.execute(
+                    "DELETE FROM keys WHERE database_id = ?", (database_id,)
+                )
+                self.conn.execute(
+                    "DELETE FROM pages WHERE database_id = ?", (database_id,)
+                )
+                full_refreshed_at = time.time()
+            for page in results:
+                self.upsert(page, commit=False)
+                edited = page.get("last_edited_time")
+                if edited and (watermark is None or edited > watermark):
+                    watermark = edited
+            self.conn.execute(
+                "REPLACE INTO sync VALUES (?, ?, ?, ?)",
+                (
+                    database_id,
+                    watermark or "",
+                    full_refreshed_at,
+                    json.dumps(projection, ensure_ascii=False) if projection else None,
+                ),
+            )
+            self.conn.commit()
+        self.refreshed.add(database_id)
+        print(f"本地镜像已{'全量' if full else '增量'}刷新，更新了{len(results)}条记录")
+
+    def load_pages(self, page_ids):
+        pages = []
+        with self.lock:
+            for page_id in page_ids:
+                row = self.conn.execute(
+                    "SELECT data FROM pages WHERE page_id = ?", (page_id,)
+                ).fetchone()
+                if row:
+                    pages.append(json.loads(row[0]))
+        return pages
+
+    def get_by_key(self, database_id, name, value):
+        """按业务字段查找页面，name为title时按标题查找"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT page_id FROM keys WHERE database_id = ? AND name = ? AND value = ?",
+                (normalize_id(database_id), name, str(value)),
+            ).fetchall()
+        return self.load_pages([row[0] for row in rows])
+
+    def find_index_condition(self, filter):
+        """查找可以用索引的条件，返回 (字段名, 值)"""
+        conditions = filter.get("and", [filter]) if filter else []
+        for condition in conditions:
+            name = condition.get("property")
+            if name not in KEY_PROPERTIES:
+                continue
+            if "relation" in condition and "contains" in condition["relation"]:
+                return name, normalize_id(condition["relation"]["contains"])
+            for type in ("rich_text", "number", "title"):
+                if type in condition and "equals" in condition[type]:
+                    return name, condition[type]["equals"]
+        return None
+
+    def query(self, database_id, filter=None):
+        """在本地查询数据库，条件不支持时抛出ValueError"""
+        index = self.find_index_condition(filter)
+        if index:
+            pages = self.get_by_key(database_id, *index)
+        else:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT data FROM pages WHERE database_id = ?",
+                    (normalize_id(database_id),),
+                ).fetchall()
+            pages = [json.loads(row[0]) for row in rows]
+        if filter:
+            pages = [page for page in pages if match_filter(page, filter)]
+        return pages
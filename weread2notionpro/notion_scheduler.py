@@ -0,0 +1,143 @@
+import asyncio
+import functools
+import itertools
+import os
+import threading
+import time
+
+from notion_client import AsyncClient
+from notion_client.errors import APIErrorCode, APIResponseError
+
+# 请求优先级，数字越小越先执行
+# 用户能看到的块操作最先执行，划线/笔记/章节数据库中的记录最后执行
+PRIORITY_BLOCKS = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_ROWS = 2
+# Notion文档中的平均限制是每秒3个请求
+DEFAULT_NOTION_RATE = 3
+# 收到429但没有Retry-After时等待的秒数
+DEFAULT_RETRY_AFTER = 1
+
+
+class TokenBucket:
+    """令牌桶，平均每秒rate个请求，最多允许capacity个突发请求"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """收到429后暂停发放令牌"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class NotionScheduler:
+    """全局的Notion请求调度器
+
+    所有请求共享一个令牌桶，按优先级排队，429时按Retry-After等待后重新排队。
+    调度器在后台线程中运行事件循环，同步代码用call()，异步代码用submit()。
+    """
+
+    def __init__(self, auth, rate=None, max_concurrency=None, **client_options):
+        if rate is None:
+            rate = float(os.getenv("NOTION_RATE") or DEFAULT_NOTION_RATE)
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("NOTION_CONCURRENCY") or 3)
+        self.auth = auth
+        self.client_options = client_options
+        self.bucket = TokenBucket(rate, max(1, rate))
+        self.max_concurrency = max_concurrency
+        self.counter = itertools.count()
+        self.stats = {"requests": 0, "rate_limited": 0}
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.run_loop, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    def run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.client = AsyncClient(auth=self.auth, **self.client_options)
+        self.queue = asyncio.PriorityQueue()
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.loop.create_task(self.dispatch())
+        self.ready.set()
+        self.loop.run_forever()
+
+    async def dispatch(self):
+        """拿到令牌后执行优先级最高的请求"""
+        while True:
+            item = await self.queue.get()
+            await self.bucket.acquire()
+            # 等待令牌期间可能有优先级更高的请求入队
+            self.queue.put_nowait(item)
+            item = self.queue.get_nowait()
+            await self.semaphore.acquire()
+            self.loop.create_task(self.execute(item))
+
+    async def execute(self, item):
+        priority, _, path, kwargs, future = item
+        try:
+            method = functools.reduce(getattr, path.split("."), self.client)
+            self.stats["requests"] += 1
+            result = await method(**kwargs)
+        except APIResponseError as error:
+            if error.code == APIErrorCode.RateLimited or error.status == 429:
+                self.stats["rate_limited"] += 1
+                retry_after = error.headers.get("Retry-After")
+                self.bucket.pause(float(retry_after or DEFAULT_RETRY_AFTER))
+                self.queue.put_nowait((priority, next(self.counter), path, kwargs, future))
+            elif not future.done():
+                future.set_exception(error)
+        except Exception as error:
+            if not future.done():
+                future.set_exception(error)
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            self.semaphore.release()
+
+    async def submit(self, path, priority=PRIORITY_DEFAULT, **kwargs):
+        """排队执行，path为AsyncClient的方法，比如pages.create
+
+        只能在调度器自己的事件循环中调用，其他线程用call()或者call_async()。
+        """
+        future = self.loop.create_future()
+        self.queue.put_nowait((priority, next(self.counter), path, kwargs, future))
+        return await future
+
+    def submit_threadsafe(self, path, priority=PRIORITY_DEFAULT, **kwargs):
+        """从其他线程提交请求，返回concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(
+            self.submit(path, priority, **kwargs), self.loop
+        )
+
+    def call(self, path, priority=PRIORITY_DEFAULT, **kwargs):
+        """同步执行请求并返回结果"""
+        return self.submit_threadsafe(path, priority, **kwargs).result()
+
+    async def call_async(self, path, priority=PRIORITY_DEFAULT, **kwargs):
+        """在其他事件循环中等待请求结果"""
+        return await asyncio.wrap_future(
+            self.submit_threadsafe(path, priority, **kwargs)
+        )
@@ -0,0 +1,111 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class AIMDLimiter:
+    """加性增、乘性减（AIMD）的自适应限流器
+
+    请求成功时并发数和速率缓慢增加，出错、超时或者被限流时成倍减少，
+    所有请求共享一个限流器，通过state()可以查看当前状态。
+    """
+
+    def __init__(
+        self,
+        max_concurrency=8,
+        initial_concurrency=2,
+        min_concurrency=1,
+        initial_rate=2.0,
+        min_rate=0.2,
+        max_rate=20.0,
+        rate_increase=0.5,
+        decrease_factor=0.5,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.concurrency = float(
+            min(max(initial_concurrency, self.min_concurrency), self.max_concurrency)
+        )
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = float(min(max(initial_rate, min_rate), max_rate))
+        self.rate_increase = rate_increase
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.next_time = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """等待直到并发数和速率都允许发送请求"""
+        with self.condition:
+            while self.in_flight >= int(self.concurrency):
+                self.condition.wait()
+            self.in_flight += 1
+            now = time.monotonic()
+            wait = self.next_time - now
+            self.next_time = max(now, self.next_time) + 1 / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def release(self, success):
+        """请求结束，根据结果调整并发数和速率"""
+        with self.condition:
+            self.in_flight -= 1
+            if success:
+                self.successes += 1
+                # 每个并发窗口的请求都成功后，并发数加1
+                self.concurrency = min(
+                    self.max_concurrency, self.concurrency + 1 / self.concurrency
+                )
+                self.rate = min(
+                    self.max_rate, self.rate + self.rate_increase / self.concurrency
+                )
+            else:
+                self.failures += 1
+                self.concurrency = max(
+                    self.min_concurrency, self.concurrency * self.decrease_factor
+                )
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                # 立即按新的速率推迟后续请求
+                self.next_time = max(self.next_time, time.monotonic() + 1 / self.rate)
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """获取一个请求名额，代码块抛出异常时按失败处理
+
+        可以调用返回对象的fail()把没有抛出异常的请求标记为失败（比如被限流）。
+        """
+        result = LimiterSlot()
+        self.acquire()
+        try:
+            yield result
+        except BaseException:
+            result.success = False
+            raise
+        finally:
+            self.release(result.success)
+
+    def state(self):
+        """当前的限流状态"""
+        with self.condition:
+            return {
+                "concurrency": round(self.concurrency, 2),
+                "max_concurrency": self.max_concurrency,
+                "rate": round(self.rate, 2),
+                "in_flight": self.in_flight,
+                "successes": self.successes,
+                "failures": self.failures,
+            }
+
+
+class LimiterSlot:
+    """限流器的一个请求名额，记录请求是否成功"""
+
+    def __init__(self):
+        self.success = True
+
+    def fail(self):
+        self.success = False
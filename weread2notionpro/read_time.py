@@ -3,58 +3,43 @@ from datetime import datetime, timedelta
 
 import pendulum
 
-from weread2notionpro.notion_helper import NotionHelper
+from weread2notionpro.circuit_breaker import exit_on_cookie_expired
+from weread2notionpro.notion_helper import READ_FIELDS, NotionHelper
+from weread2notionpro.notion_scheduler import PRIORITY_ROWS
 from weread2notionpro.utils import (
+    decode_properties,
     format_date,
     get_date,
     get_icon,
     get_number,
-    get_relation,
     get_title,
 )
 from weread2notionpro.weread_api import WeReadApi
 
 
+def to_date(timestamp):
+    """时间戳转换为北京时间"""
+    return datetime.utcfromtimestamp(timestamp) + timedelta(hours=8)
+
+
 def insert_to_notion(page_id, timestamp, duration):
     parent = {"database_id": notion_helper.day_database_id, "type": "database_id"}
+    date = to_date(timestamp)
     properties = {
-        "标题": get_title(
-            format_date(
-                datetime.utcfromtimestamp(timestamp) + timedelta(hours=8),
-                "%Y年%m月%d日",
-            )
-        ),
-        "日期": get_date(
-            start=format_date(datetime.utcfromtimestamp(timestamp) + timedelta(hours=8))
-        ),
+        "标题": get_title(format_date(date, "%Y年%m月%d日")),
+        "日期": get_date(start=format_date(date)),
         "时长": get_number(duration),
         "时间戳": get_number(timestamp),
-        "年": get_relation(
-            [
-                notion_helper.get_year_relation_id(
-                    datetime.utcfromtimestamp(timestamp) + timedelta(hours=8)
-                ),
-            ]
-        ),
-        "月": get_relation(
-            [
-                notion_helper.get_month_relation_id(
-                    datetime.utcfromtimestamp(timestamp) + timedelta(hours=8)
-                ),
-            ]
-        ),
-        "周": get_relation(
-            [
-                notion_helper.get_week_relation_id(
-                    datetime.utcfromtimestamp(timestamp) + timedelta(hours=8)
-                ),
-            ]
-        ),
     }
+    notion_helper.calendar.apply(properties, date, ("年", "月", "周"))
     if page_id != None:
-        notion_helper.client.pages.update(page_id=page_id, properties=properties)
+        notion_helper.call(
+            "pages.update", PRIORITY_ROWS, page_id=page_id, properties=properties
+        )
     else:
-        notion_helper.client.pages.create(
+        notion_helper.call(
+            "pages.create",
+            PRIORITY_ROWS,
             parent=parent,
             icon=get_icon("https://www.notion.so/icons/target_red.svg"),
             properties=properties,
@@ -83,6 +68,7 @@ notion_helper = NotionHelper()
 weread_api = WeReadApi()
 
 
+@exit_on_cookie_expired
 def main():
     image_file = get_file()
     if image_file:
@@ -107,18 +93,27 @@ def main():
     if today_timestamp not in readTimes:
         readTimes[today_timestamp] = 0
     readTimes = dict(sorted(readTimes.items()))
-    results = notion_helper.query_all(database_id=notion_helper.day_database_id)
+    results = notion_helper.query_all(
+        notion_helper.day_database_id, list(READ_FIELDS.values())
+    )
+    changes = []
     for result in results:
-        timestamp = result.get("properties").get("时间戳").get("number")
-        duration = result.get("properties").get("时长").get("number")
+        fields = decode_properties(result, READ_FIELDS)
+        timestamp = fields.get("timestamp")
+        duration = fields.get("duration")
         id = result.get("id")
         if timestamp in readTimes:
             value = readTimes.pop(timestamp)
             if value != duration:
-                insert_to_notion(page_id=id, timestamp=timestamp, duration=value)
-    for key, value in readTimes.items():
-        insert_to_notion(None, int(key), value)
-
+                changes.append((id, timestamp, value))
+    changes.extend((None, int(key), value) for key, value in readTimes.items())
+    # 一次解析所有要写入的日期的年月周关联
+    notion_helper.calendar.resolve(
+        (to_date(timestamp) for _, timestamp, _ in changes), ("年", "月", "周")
+    )
+    for page_id, timestamp, duration in changes:
+        insert_to_notion(page_id=page_id, timestamp=timestamp, duration=duration)
+    notion_helper.flush()
 
 if __name__ == "__main__":
     import sys
@@ -0,0 +1,52 @@
+from weread2notionpro.notion_mirror import normalize_id
+from weread2notionpro.utils import get_block_hash
+
+
+def plan_block_operations(desired, blocks, anchor, stale=()):
+    """比较期望的笔记顺序和页面中已有的块，生成最少的块操作
+
+    desired为按顺序排列的 [(content, block)]，content中有blockId说明已经同步过，
+    block为期望的块内容，为None时不检查内容是否变化；
+    blocks为BlockTree中的顶层块；anchor为第一个新块插入的位置，一般是目录；
+    stale为已经删除的划线、笔记和章节对应的块。
+
+    已有的块不会移动，新块插入到前一个已有块的后面。返回的操作依次为：
+    ("delete", block_id)、("update", block_id, block)、("append", after, [(content, block)])。
+    块已经不存在的content会去掉blockId，作为新块重新插入。
+    """
+    existing = {normalize_id(x["id"]): x for x in blocks}
+    desired_ids = {
+        normalize_id(content.get("blockId"))
+        for content, _ in desired
+        if content.get("blockId")
+    }
+    operations = []
+    for block_id in stale:
+        key = normalize_id(block_id)
+        if key in existing and key not in desired_ids:
+            operations.append(("delete", block_id))
+    run = []
+    for content, block in desired:
+        block_id = content.get("blockId")
+        item = existing.get(normalize_id(block_id)) if block_id else None
+        if item is None:
+            if block_id:
+                # 块在Notion中被删除了，重新插入
+                content.pop("blockId")
+                content["recreated"] = True
+            if block is not None:
+                run.append((content, block))
+            continue
+        if run:
+            operations.append(("append", anchor, run))
+            run = []
+        if (
+            block is not None
+            and item["type"] == block.get("type")
+            and item["hash"] != get_block_hash(block)
+        ):
+            operations.append(("update", block_id, block))
+        anchor = block_id
+    if run:
+        operations.append(("append", anchor, run))
+    return operations
@@ -0,0 +1,67 @@
+import json
+import os
+import threading
+
+from weread2notionpro.utils import get_data_path
+
+
+class RelationCache:
+    """保存关联数据库（作者、分类、年月周日）中标题到页面ID的映射
+
+    按 (database_id, 标题) 保存，跨运行复用，只有页面被删除或者归档时才失效。
+    """
+
+    def __init__(self, path=None):
+        self.path = path if path else get_data_path("relation_cache.json")
+        self.lock = threading.Lock()
+        self.state = {}
+        self.preloaded = set()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.state = json.load(f)
+            except Exception as error:
+                print(f"读取关联缓存失败，将重新查询: {error}")
+
+    def get(self, database_id, name):
+        return self.state.get(database_id, {}).get(name)
+
+    def set(self, database_id, name, page_id):
+        with self.lock:
+            self.state.setdefault(database_id, {})[name] = page_id
+            self.save()
+
+    def find(self, page_id):
+        """根据页面ID反查 (database_id, 标题)"""
+        for database_id, names in self.state.items():
+            for name, id in names.items():
+                if id == page_id:
+                    return database_id, name
+        return None
+
+    def remove(self, page_id):
+        """页面被删除或者归档后移除对应的缓存"""
+        with self.lock:
+            for names in self.state.values():
+                for name in [k for k, v in names.items() if v == page_id]:
+                    names.pop(name)
+            self.save()
+
+    def preload(self, database_id, results, title_property="标题"):
+        """用一次全量查询的结果填充一个数据库的缓存，每次运行只需要一次"""
+        names = {}
+        for result in results:
+            title = result.get("properties", {}).get(title_property, {}).get("title")
+            name = "".join(x.get("plain_text", "") for x in title or [])
+            if name and name not in names:
+                names[name] = result.get("id")
+        with self.lock:
+            self.state[database_id] = names
+            self.preloaded.add(database_id)
+            self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,73 @@
+import json
+import os
+import threading
+
+from weread2notionpro.content_hash import get_note_key
+from weread2notionpro.utils import get_data_path
+
+
+def get_item_key(value):
+    """划线、笔记和章节在日志中的ID"""
+    return get_note_key(value) or f"chapterUid:{value.get('chapterUid')}"
+
+
+class SyncJournal:
+    """每本书同步过程的追加日志
+
+    每次追加块后立即记录新块的ID，一本书同步完成后记录commit。
+    运行被取消时，下次同步这本书可以复用已经追加的块，不会重复插入。
+    """
+
+    def __init__(self, path=None):
+        self.path = path if path else get_data_path("sync_journal.jsonl")
+        self.lock = threading.Lock()
+        self.pending = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.apply(json.loads(line))
+                    except ValueError:
+                        # 最后一行可能没有写完
+                        continue
+        if self.pending:
+            print(f"上次运行有{len(self.pending)}本书没有同步完成，将继续同步")
+        # 只保留没有完成的书，压缩日志
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for book, items in self.pending.items():
+                record = {"book": book, "op": "append", "items": items}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def apply(self, record):
+        book = record.get("book")
+        if record.get("op") == "append":
+            self.pending.setdefault(book, {}).update(record.get("items"))
+        elif record.get("op") == "commit":
+            self.pending.pop(book, None)
+
+    def write(self, record):
+        with self.lock:
+            self.apply(record)
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def record_append(self, book, contents):
+        """记录追加成功的块，contents中已经有blockId"""
+        items = {get_item_key(x): x.get("blockId") for x in contents}
+        self.write({"book": book, "op": "append", "items": items})
+
+    def commit(self, book):
+        """一本书同步完成"""
+        if book in self.pending:
+            self.write({"book": book, "op": "commit"})
+
+    def get_appended(self, book):
+        """上次没有完成的运行中已经追加的块，返回 {ID: blockId}"""
+        return self.pending.get(book, {})
@@ -0,0 +1,60 @@
+import json
+import os
+import threading
+
+from weread2notionpro.utils import get_data_path
+
+
+class SyncState:
+    """保存每本书上次同步的syncKey和同步到的Notion页面，用于增量获取划线和笔记"""
+
+    def __init__(self, path=None):
+        self.path = path if path else get_data_path("sync_state.json")
+        self.lock = threading.Lock()
+        self.state = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.state = json.load(f)
+            except Exception as error:
+                print(f"读取同步状态失败，将全量同步: {error}")
+
+    def get(self, bookId, name):
+        return self.state.get(bookId, {}).get(name, 0)
+
+    def update(self, bookId, **synckeys):
+        """更新一本书的syncKey并写入文件"""
+        with self.lock:
+            self.state.setdefault(bookId, {}).update(synckeys)
+            self.save()
+
+    def bind_pages(self, pages):
+        """pages为 bookId -> Notion页面ID
+
+        syncKey只对同步到的页面有效，页面被重新创建或者换了Notion模板时清空，
+        这本书会重新全量同步。
+        """
+        with self.lock:
+            changed = False
+            for bookId, page_id in pages.items():
+                page_id = page_id.replace("-", "")
+                if self.state.get(bookId, {}).get("page") != page_id:
+                    self.state[bookId] = {"page": page_id}
+                    changed = True
+            if changed:
+                self.save()
+
+    def reset(self, bookId=None):
+        """清空syncKey，下次全量同步"""
+        with self.lock:
+            if bookId is None:
+                self.state = {}
+            else:
+                self.state.pop(bookId, None)
+            self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
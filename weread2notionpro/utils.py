@@ -1,12 +1,16 @@
 import calendar
+import codecs
 from datetime import datetime
 from datetime import timedelta
 import hashlib
+import itertools
+import json
 import os
 import re
 import requests
 import base64
 from weread2notionpro.config  import (
+    DATA_DIR,
     RICH_TEXT,
     URL,
     RELATION,
@@ -156,6 +160,19 @@ def get_block(content,type,show_color, style, colorStyle, reviewId):
     return block
 
 
+def get_block_hash(block):
+    """块内容的哈希，Notion返回的块和要写入的块计算结果一致"""
+    type = block.get("type")
+    content = block.get(type) or {}
+    text = "".join(
+        x.get("plain_text") or x.get("text", {}).get("content", "")
+        for x in content.get("rich_text", [])
+    )
+    icon = content.get("icon") or {}
+    data = [type, text, content.get("color"), icon.get("emoji")]
+    return hashlib.md5(json.dumps(data, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
 def get_rich_text_from_result(result, name):
     return result.get("properties").get(name).get("rich_text")[0].get("plain_text")
 
@@ -176,6 +193,15 @@ def format_time(time):
     return result
 
 
+def get_book_timestamp(book):
+    """书籍的时间：读完的时间，没有读完时为最后阅读时间"""
+    return (
+        book.get("finishedDate")
+        or book.get("lastReadingDate")
+        or book.get("readingBookDate")
+    )
+
+
 def format_date(date, format="%Y-%m-%d %H:%M:%S"):
     return date.strftime(format)
 
@@ -290,6 +316,14 @@ def get_property_value(property):
 
 
 
+def decode_properties(result, fields):
+    """只解析需要的属性，fields为 {键: 属性名}，缺少的属性返回None"""
+    properties = result.get("properties", {})
+    return {
+        key: get_property_value(properties[name]) if name in properties else None
+        for key, name in fields.items()
+    }
+
 
 def str_to_timestamp(date):
     if date == None:
@@ -363,3 +397,133 @@ def download_image(url, save_dir="cover"):
 
 def get_embed(url):
     return {"type": "embed", "embed": {"url": url}}
+
+
+def get_data_path(name):
+    """获取本地数据文件的路径，目录不存在时自动创建"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, name)
+
+
+def load_json(path, default=None):
+    """读取本地JSON文件，文件不存在或者损坏时返回default"""
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as error:
+            print(f"读取{path}失败: {error}")
+    return default
+
+
+def save_json(path, data):
+    """原子写入本地JSON文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def iter_batches(iterable, size):
+    """把可迭代对象按size分批，逐批返回列表"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+# 完整的JSON数字后面只能是这些字符
+NUMBER_DELIMITERS = ",]} \t\r\n"
+
+
+class JsonStreamReader:
+    """从分块的字节流中逐个解析JSON值，已经解析的部分会被丢弃"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def read_more(self):
+        """读取下一块数据，没有更多数据时返回False"""
+        if self.eof:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            self.buffer = self.buffer[self.pos :] + self.decoder.decode(b"", final=True)
+        else:
+            self.buffer = self.buffer[self.pos :] + self.decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """跳过空白，返回下一个字符，数据结束时返回空字符串"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.read_more():
+                return ""
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f"JSON格式错误，期望{chars}，实际为{char!r}")
+        self.pos += 1
+        return char
+
+    def read_value(self):
+        """解析一个完整的JSON值，数据不完整时继续读取"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+                # 数字可能在小数点或者指数之前被截断，后面是分隔符时才是完整的
+                if self.eof or (end < len(self.buffer) and self.is_complete(value, end)):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.read_more()
+
+    def is_complete(self, value, end):
+        """解析出的值后面还有数据时，判断这个值是否完整"""
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return True
+        return self.buffer[end] in NUMBER_DELIMITERS
+
+
+def iter_json_items(chunks, keys):
+    """流式解析JSON对象，逐个返回指定字段数组中的元素 (key, item)
+
+    只有正在解析的一个元素保存在内存中，其它字段会被跳过。
+    """
+    reader = JsonStreamReader(chunks)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.read_value()
+        reader.expect(":")
+        if key in keys and reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    yield key, reader.read_value()
+                    if reader.expect(",]") == "]":
+                        break
+        else:
+            reader.read_value()
+        if reader.expect(",}") == "}":
+            return
+
@@ -1,4 +1,13 @@
+import signal
+import sys
+
+from weread2notionpro.cache import apply_cache_args
+from weread2notionpro.circuit_breaker import exit_on_cookie_expired
+from weread2notionpro.content_hash import ContentHashStore, get_note_key
 from weread2notionpro.notion_helper import NotionHelper
+from weread2notionpro.notion_scheduler import PRIORITY_BLOCKS
+from weread2notionpro.reconcile import plan_block_operations
+from weread2notionpro.sync_journal import SyncJournal, get_item_key
 from weread2notionpro.utils import (
     get_block,
     get_heading,
@@ -7,12 +16,20 @@ from weread2notionpro.utils import (
     get_quote,
     get_rich_text_from_result,
     get_table_of_contents,
+    iter_batches,
+    timestamp_to_date,
 )
-from weread2notionpro.weread_api import WeReadApi
+from weread2notionpro.weread_api import AsyncWeReadApi, WeReadApi
+from weread2notionpro.write_queue import WriteBehindQueue
+
+
+def get_note_properties(id_key):
+    """查询划线和笔记时需要的属性，全量和增量同步使用相同的属性"""
+    return [id_key, "blockId", "chapterUid", "range"]
 
 
-def get_bookmark_list(page_id, bookId):
-    """获取我的划线"""
+def get_bookmark_list(page_id, bookId, bookmarks=None):
+    """获取我的划线，bookmarks为预先获取的微信读书划线"""
     filter = {
         "and": [
             {"property": "书籍", "relation": {"contains": page_id}},
@@ -20,7 +37,7 @@ def get_bookmark_list(page_id, bookId):
         ]
     }
     results = notion_helper.query_all_by_book(
-        notion_helper.bookmark_database_id, filter
+        notion_helper.bookmark_database_id, filter, get_note_properties("bookmarkId")
     )
     dict1 = {
         get_rich_text_from_result(x, "bookmarkId"): get_rich_text_from_result(
@@ -29,25 +46,79 @@ def get_bookmark_list(page_id, bookId):
         for x in results
     }
     dict2 = {get_rich_text_from_result(x, "blockId"): x.get("id") for x in results}
-    bookmarks = weread_api.get_bookmark_list(bookId)
+    if bookmarks is None:
+        bookmarks = weread_api.get_bookmark_list(bookId)
     for i in bookmarks:
         if i.get("bookmarkId") in dict1:
             i["blockId"] = dict1.pop(i.get("bookmarkId"))
     for blockId in dict1.values():
-        notion_helper.delete_block(blockId)
+        stale_blocks.setdefault(page_id, []).append(blockId)
         notion_helper.delete_block(dict2.get(blockId))
     return bookmarks
 
 
-def get_review_list(page_id, bookId):
-    """获取笔记"""
+def get_existing_notes(database_id, page_id, id_key):
+    """从Notion中获取一本书已经同步的划线或笔记"""
+    filter = {
+        "and": [
+            {"property": "书籍", "relation": {"contains": page_id}},
+            {"property": "blockId", "rich_text": {"is_not_empty": True}},
+        ]
+    }
+    results = notion_helper.query_all_by_book(
+        database_id, filter, get_note_properties(id_key)
+    )
+    return {get_rich_text_from_result(x, id_key): x for x in results}
+
+
+def result_to_note(result, id_key):
+    """把Notion中的记录转换成排序和定位需要的字段"""
+    properties = result.get("properties")
+    note = {
+        id_key: get_rich_text_from_result(result, id_key),
+        "blockId": get_rich_text_from_result(result, "blockId"),
+        "chapterUid": get_number_from_result(result, "chapterUid"),
+    }
+    if properties.get("range") and properties.get("range").get("rich_text"):
+        note["range"] = get_rich_text_from_result(result, "range")
+    return note
+
+
+def apply_changes(page_id, changes, database_id, id_key):
+    """增量模式：删除已经删除的记录，只返回新增的记录和已有记录的位置"""
+    existing = get_existing_notes(database_id, page_id, id_key)
+    for removed_id in changes.get("removed"):
+        result = existing.pop(removed_id, None)
+        if result:
+            stale_blocks.setdefault(page_id, []).append(
+                get_rich_text_from_result(result, "blockId")
+            )
+            notion_helper.delete_block(result.get("id"))
+    # 修改过的记录使用微信读书返回的完整内容，用于检查内容是否变化
+    updated = {str(x.get(id_key)): x for x in changes.get("updated")}
+    notes = []
+    for key, result in existing.items():
+        if key in updated:
+            note = updated.pop(key)
+            note["blockId"] = get_rich_text_from_result(result, "blockId")
+            notes.append(note)
+        else:
+            notes.append(result_to_note(result, id_key))
+    notes.extend(updated.values())
+    return notes
+
+
+def get_review_list(page_id, bookId, reviews=None):
+    """获取笔记，reviews为预先获取的微信读书笔记"""
     filter = {
         "and": [
             {"property": "书籍", "relation": {"contains": page_id}},
             {"property": "blockId", "rich_text": {"is_not_empty": True}},
         ]
     }
-    results = notion_helper.query_all_by_book(notion_helper.review_database_id, filter)
+    results = notion_helper.query_all_by_book(
+        notion_helper.review_database_id, filter, get_note_properties("reviewId")
+    )
     dict1 = {
         get_rich_text_from_result(x, "reviewId"): get_rich_text_from_result(
             x, "blockId"
@@ -55,14 +126,18 @@ def get_review_list(page_id, bookId):
         for x in results
     }
     dict2 = {get_rich_text_from_result(x, "blockId"): x.get("id") for x in results}
-    reviews = weread_api.get_review_list(bookId)
+    if reviews is None:
+        # 分页逐条获取，边获取边匹配已经同步的笔记
+        reviews = weread_api.iter_review_list(bookId)
+    result = []
     for i in reviews:
         if i.get("reviewId") in dict1:
             i["blockId"] = dict1.pop(i.get("reviewId"))
+        result.append(i)
     for blockId in dict1.values():
-        notion_helper.delete_block(blockId)
+        stale_blocks.setdefault(page_id, []).append(blockId)
         notion_helper.delete_block(dict2.get(blockId))
-    return reviews
+    return result
 
 
 def check(bookId):
@@ -112,7 +187,7 @@ def sort_notes(page_id, chapter, bookmark_list):
     if chapter != None:
         filter = {"property": "书籍", "relation": {"contains": page_id}}
         results = notion_helper.query_all_by_book(
-            notion_helper.chapter_database_id, filter
+            notion_helper.chapter_database_id, filter, ["chapterUid", "blockId"]
         )
         dict1 = {
             get_number_from_result(x, "chapterUid"): get_rich_text_from_result(
@@ -134,62 +209,111 @@ def sort_notes(page_id, chapter, bookmark_list):
                 notes.append(chapter.get(key))
             notes.extend(value)
         for blockId in dict1.values():
-            notion_helper.delete_block(blockId)
+            stale_blocks.setdefault(page_id, []).append(blockId)
             notion_helper.delete_block(dict2.get(blockId))
     else:
         notes.extend(bookmark_list)
     return notes
 
 
+def has_block_content(content):
+    """是否有完整的内容，增量同步中从Notion读取的已有记录没有内容"""
+    if "bookmarkId" in content:
+        return "markText" in content
+    if "reviewId" in content:
+        return "content" in content
+    return "title" in content
+
+
 def append_blocks(id, contents):
+    """把页面中的块调整为contents的顺序，只追加、更新和删除有变化的块"""
     print(f"笔记数{len(contents)}")
-    before_block_id = ""
-    block_children = notion_helper.get_block_children(id)
-    if len(block_children) > 0 and block_children[0].get("type") == "table_of_contents":
-        before_block_id = block_children[0].get("id")
-    else:
+    tree = notion_helper.get_block_tree(id)
+    before_block_id = tree.get_table_of_contents()
+    if before_block_id is None:
         response = notion_helper.append_blocks(
             block_id=id, children=[get_table_of_contents()]
         )
         before_block_id = response.get("results")[0].get("id")
-    blocks = []
-    sub_contents = []
-    l = []
+    # 上次运行被取消时已经追加的块直接复用，只补写数据库记录
+    appended = journal.get_appended(id)
     for content in contents:
-        if len(blocks) == 100:
-            results = append_blocks_to_notion(id, blocks, before_block_id, sub_contents)
-            before_block_id = results[-1].get("blockId")
-            l.extend(results)
-            blocks.clear()
-            sub_contents.clear()
-            if not notion_helper.sync_bookmark and content.get("type") == 0:
-                continue
-            blocks.append(content_to_block(content))
-            sub_contents.append(content)
-        elif "blockId" in content:
-            if len(blocks) > 0:
-                l.extend(
-                    append_blocks_to_notion(id, blocks, before_block_id, sub_contents)
-                )
-                blocks.clear()
-                sub_contents.clear()
-            before_block_id = content["blockId"]
-        else:
-            if not notion_helper.sync_bookmark and content.get("type") == 0:
-                continue
-            blocks.append(content_to_block(content))
-            sub_contents.append(content)
-
-    if len(blocks) > 0:
-        l.extend(append_blocks_to_notion(id, blocks, before_block_id, sub_contents))
-    for index, value in enumerate(l):
-        print(f"正在插入第{index+1}条笔记，共{len(l)}条")
-        if "bookmarkId" in value:
-            notion_helper.insert_bookmark(id, value)
-        elif "reviewId" in value:
-            notion_helper.insert_review(id, value)
+        blockId = appended.get(get_item_key(content))
+        if "blockId" not in content and blockId and tree.contains(blockId):
+            content["blockId"] = blockId
+            content["resumed"] = True
+    desired = []
+    for content in contents:
+        if "blockId" in content:
+            block = None
+            if has_block_content(content):
+                changed = None
+                if get_note_key(content):
+                    changed = content_hashes.is_changed(content)
+                if changed:
+                    content["changed"] = True
+                # 内容没有变化时不需要比较块
+                if changed is not False:
+                    block = content_to_block(content)
+            desired.append((content, block))
+        elif notion_helper.sync_bookmark or content.get("type") != 0:
+            desired.append((content, content_to_block(content)))
+    operations = plan_block_operations(
+        desired, tree.blocks, before_block_id, stale_blocks.pop(id, [])
+    )
+    count = 0
+    for operation in operations:
+        if operation[0] == "delete":
+            notion_helper.delete_block(operation[1])
+        elif operation[0] == "update":
+            notion_helper.update_block(operation[1], operation[2])
         else:
-            notion_helper.insert_chapter(id, value)
+            _, after, items = operation
+            for batch in iter_batches(items, 100):
+                results = append_blocks_to_notion(
+                    id, [x[1] for x in batch], after, [x[0] for x in batch]
+                )
+                after = results[-1].get("blockId")
+                count += len(results)
+                # 先记录日志再写入队列，运行被取消时下次可以继续
+                journal.record_append(id, results)
+                put_rows(id, results)
+    # 摘要在笔记块的子块中，块哈希不包含摘要，内容修改过的笔记需要替换摘要
+    for content in contents:
+        if content.get("changed") and not content.get("recreated") and "reviewId" in content:
+            update_abstract(content)
+    print(f"新增{count}个块，共{len(operations)}个块操作")
+    # 内容修改过的已有记录和上次没有写入的记录也需要更新
+    put_rows(
+        id,
+        [
+            x
+            for x in contents
+            if (x.get("changed") and not x.get("recreated")) or x.get("resumed")
+        ],
+    )
+
+
+def update_abstract(content):
+    """删除笔记块下面原来的摘要，重新添加修改后的摘要"""
+    block_id = content.get("blockId")
+    for child in notion_helper.list_children(block_id, PRIORITY_BLOCKS):
+        if child.get("type") == "quote":
+            notion_helper.delete_block(child.get("id"))
+    if content.get("abstract"):
+        notion_helper.append_blocks(
+            block_id=block_id, children=[get_quote(content.get("abstract"))]
+        )
+
+
+def put_rows(id, values):
+    """把数据库记录交给后台队列写入，不阻塞下一本书"""
+    # 一次解析这些记录用到的年月周日关联
+    notion_helper.calendar.resolve(
+        timestamp_to_date(int(x.get("createTime"))) for x in values if "createTime" in x
+    )
+    for value in values:
+        write_queue.put(id, value)
 
 
 def content_to_block(content):
@@ -232,40 +356,155 @@ def append_blocks_to_notion(id, blocks, after, contents):
     return l
 
 
+def get_result(data, name):
+    """取出并发获取的结果，出错时抛出原来的异常"""
+    result = data.get(name)
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+BOOK_DATA_METHODS = ["get_bookmark_changes", "get_review_delta"]
 weread_api = WeReadApi()
+async_weread_api = AsyncWeReadApi(weread_api)
 notion_helper = NotionHelper()
+# 每本书需要删除的块，由append_blocks统一处理
+stale_blocks = {}
+content_hashes = ContentHashStore()
+journal = SyncJournal()
+write_queue = WriteBehindQueue(
+    notion_helper, on_written=lambda page_id, value: content_hashes.save(value)
+)
 
 
-def main():
-    notion_books = notion_helper.get_all_book()
-    books = weread_api.get_notebooklist()
-    if books != None:
-        for index, book in enumerate(books):
-            bookId = book.get("bookId")
-            title = book.get("book").get("title")
-            sort = book.get("sort")
-            if bookId not in notion_books:
-                continue
-            if sort == notion_books.get(bookId).get("Sort"):
-                continue
-            pageId = notion_books.get(bookId).get("pageId")
-            print(f"正在同步《{title}》,一共{len(books)}本，当前是第{index+1}本。")
-            chapter = weread_api.get_chapter_info(bookId)
-            bookmark_list = get_bookmark_list(pageId, bookId)
-            reviews = get_review_list(pageId, bookId)
-            bookmark_list.extend(reviews)
-            content = sort_notes(pageId, chapter, bookmark_list)
-            append_blocks(pageId, content)
-            properties = {"Sort": get_number(sort)}
-            notion_helper.update_book_page(page_id=pageId, properties=properties)
+def handle_sigterm(signum, frame):
+    """运行被取消时保存日志后退出，没有写入的记录保存在本地队列中"""
+    print("收到终止信号，保存同步日志后退出")
+    journal.flush()
+    sys.exit(128 + signum)
 
 
-if __name__ == "__main__":
-    import sys
-
+@exit_on_cookie_expired
+def main():
+    # 在main中处理命令行参数，通过console_scripts运行时同样生效
     if len(sys.argv) > 1 and sys.argv[1] == "--help":
         print("微信读书划线和笔记同步工具")
-        print("用法: python -m weread2notionpro.weread")
+        print("用法: python -m weread2notionpro.weread [--no-cache] [--clear-cache] [--full]")
         print("功能: 同步微信读书的划线和笔记到Notion")
+        print("  --no-cache     不读取也不写入本地接口缓存")
+        print("  --clear-cache  运行前清空本地接口缓存")
+        print("  --full         忽略保存的syncKey，全量同步划线和笔记")
         sys.exit(0)
+    apply_cache_args(weread_api.cache, sys.argv[1:])
+    if "--full" in sys.argv[1:]:
+        weread_api.sync_state.reset()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    # 先写完上次没有完成的记录，避免和本次同步的记录重复
+    write_queue.resume()
+    write_queue.join()
+    notion_books = notion_helper.get_all_book()
+    # 流式读取笔记本列表，只保留需要同步的书籍的ID、标题和sort
+    need_sync = []
+    for book in weread_api.iter_notebooklist():
+        bookId = book.get("bookId")
+        sort = book.get("sort")
+        if bookId in notion_books and sort != notion_books.get(bookId).get("Sort"):
+            need_sync.append(
+                {
+                    "bookId": bookId,
+                    "sort": sort,
+                    "book": {"title": book.get("book").get("title")},
+                }
+            )
+    need_sync.sort(key=lambda x: x.get("sort", 0))
+    # 保存的syncKey属于之前同步到的页面，页面变化时全量同步
+    weread_api.sync_state.bind_pages(
+        {
+            book.get("bookId"): notion_books.get(book.get("bookId")).get("pageId")
+            for book in need_sync
+        }
+    )
+    # 一次或几次请求预先获取所有需要同步的书籍的章节
+    chapters = async_weread_api.get_chapter_infos_sync(
+        [book.get("bookId") for book in need_sync]
+    )
+    # 分批并发获取划线和笔记，再依次写入Notion
+    batch_size = async_weread_api.concurrency * 4
+    for start in range(0, len(need_sync), batch_size):
+        batch = need_sync[start : start + batch_size]
+        book_data = async_weread_api.fetch_books_sync(
+            [book.get("bookId") for book in batch], BOOK_DATA_METHODS
+        )
+        for index, book in enumerate(batch, start=start):
+            pageId = notion_books.get(book.get("bookId")).get("pageId")
+            print(
+                f"正在同步《{book.get('book').get('title')}》,一共{len(need_sync)}本，当前是第{index+1}本。"
+            )
+            chapter = chapters.get(book.get("bookId"))
+            sync_book(pageId, book, chapter, book_data.get(book.get("bookId")))
+    write_queue.join()
+    notion_helper.flush()
+    print(f"微信读书限流状态: {weread_api.limiter.state()}")
+
+
+def sync_book(pageId, book, chapter, data):
+    """同步一本书的划线和笔记，chapter为批量获取的章节，data为并发获取的划线和笔记"""
+    bookId = book.get("bookId")
+    bookmark_changes = get_result(data, "get_bookmark_changes")
+    review_changes = get_result(data, "get_review_delta")
+    if bookmark_changes.get("incremental") and review_changes.get("incremental"):
+        # 增量模式：只处理上次同步之后新增和删除的划线和笔记
+        changed = [
+            x
+            for changes in (bookmark_changes, review_changes)
+            for x in changes.get("updated") + changes.get("removed")
+        ]
+        if len(changed) == 0:
+            print("划线和笔记没有变化，跳过")
+            bookmark_list = None
+        else:
+            bookmark_list = apply_changes(
+                pageId,
+                bookmark_changes,
+                notion_helper.bookmark_database_id,
+                "bookmarkId",
+            )
+            bookmark_list.extend(
+                apply_changes(
+                    pageId, review_changes, notion_helper.review_database_id, "reviewId"
+                )
+            )
+    else:
+        if bookmark_changes.get("incremental"):
+            # 笔记需要全量同步时划线也要全量获取，增量结果不是完整的划线列表
+            bookmark_changes = weread_api.get_bookmark_changes(bookId, synckey=0)
+        bookmark_list = get_bookmark_list(
+            pageId, bookId, bookmark_changes.get("updated")
+        )
+        reviews = review_changes.get("updated")
+        if reviews is None or review_changes.get("incremental"):
+            # 全量同步时分页逐条获取笔记，边获取边匹配已经同步的笔记
+            reviews = weread_api.iter_review_changes(bookId, review_changes)
+        bookmark_list.extend(get_review_list(pageId, bookId, reviews))
+    if bookmark_list is not None:
+        if chapter is None:
+            chapter = weread_api.get_chapter_info(bookId)
+        content = sort_notes(pageId, chapter, bookmark_list)
+        append_blocks(pageId, content)
+
+    def finish():
+        properties = {"Sort": get_number(book.get("sort"))}
+        notion_helper.update_book_page(page_id=pageId, properties=properties)
+        weread_api.sync_state.update(
+            bookId,
+            bookmark=bookmark_changes.get("synckey") or 0,
+            review=review_changes.get("synckey") or 0,
+        )
+        journal.commit(pageId)
+
+    # 这本书的记录全部写入Notion后才标记为已同步，中断时下次运行会重新同步
+    write_queue.after_written(pageId, finish)
+
+
+if __name__ == "__main__":
     main()
@@ -1,12 +1,28 @@
+import asyncio
 import hashlib
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 from requests.utils import cookiejar_from_dict
 from retrying import retry
 
+from weread2notionpro.cache import ResponseCache, get_account_key
+from weread2notionpro.circuit_breaker import (
+    CookieCircuitBreaker,
+    CookieExpiredError,
+    is_retryable,
+)
+from weread2notionpro.cookie_cache import CookieCache
+from weread2notionpro.rate_limiter import AIMDLimiter
+from weread2notionpro.sync_state import SyncState
+from weread2notionpro.utils import iter_json_items
+
 load_dotenv()
 WEREAD_URL = "https://weread.qq.com/"
 WEREAD_NOTEBOOKS_URL = "https://weread.qq.com/api/user/notebook"
@@ -19,13 +35,137 @@ WEREAD_READDATA_DETAIL = "https://i.weread.qq.com/readdata/detail"
 WEREAD_HISTORY_URL = "https://i.weread.qq.com/readdata/summary?synckey=0"
 WEREAD_SHELF_SYNC_URL = "https://weread.qq.com/web/shelf/sync"
 WEREAD_BEST_REVIEW_URL = "https://weread.qq.com/web/review/list/best"
+# 并发请求数，可通过环境变量WEREAD_CONCURRENCY配置
+DEFAULT_CONCURRENCY = 8
+# 分页获取笔记时每页的数量
+DEFAULT_REVIEW_PAGE_SIZE = 100
+# 批量获取章节信息时每次请求的书籍数量
+DEFAULT_CHAPTER_BATCH_SIZE = 20
+# 会话预热后的有效期（秒），可通过环境变量WEREAD_SESSION_TTL配置
+DEFAULT_SESSION_TTL = 1800
+# Cookie过期的错误码
+AUTH_ERRCODES = (-2010, -2012)
+# 限流由AIMDLimiter负责，重试只需要短暂的指数退避
+RETRY_OPTIONS = dict(
+    retry_on_exception=is_retryable,
+    stop_max_attempt_number=3,
+    wait_exponential_multiplier=500,
+    wait_exponential_max=4000,
+)
+# 流式解析时每次读取的字节数
+STREAM_CHUNK_SIZE = 64 * 1024
+# 这些状态码说明微信读书在限流或者服务异常
+THROTTLE_STATUS_CODES = (429, 500, 502, 503, 504)
+# 这些错误码出现在200响应中，同样说明微信读书在限流，可通过环境变量WEREAD_THROTTLE_ERRCODES配置
+DEFAULT_THROTTLE_ERRCODES = (-1,)
+# 只检查这个大小以内的响应中的错误码，正常的数据不需要解析
+ERRCODE_CHECK_MAX_SIZE = 1024
+# 微信读书接口的域名，设置WEREAD_BASE_URL后替换成指定地址
+WEREAD_HOST_PATTERN = re.compile(r"^https://(i\.)?weread\.qq\.com")
+
+
+class WeReadThrottledError(Exception):
+    """微信读书在200响应中返回了限流错误码，请求可以退避后重试"""
+
+
+class WeReadSession:
+    """管理会话的预热，一次运行只访问一次主页，过期或者鉴权失败后才重新预热"""
+
+    def __init__(self, send, headers, ttl=None):
+        self.send = send
+        self.headers = headers
+        if ttl is None:
+            ttl = int(os.getenv("WEREAD_SESSION_TTL") or DEFAULT_SESSION_TTL)
+        self.ttl = ttl
+        self.warmed_at = None
+        self.lock = threading.Lock()
+
+    def is_valid(self):
+        """会话是否已经预热并且没有过期"""
+        if self.warmed_at is None:
+            return False
+        return time.monotonic() - self.warmed_at < self.ttl
+
+    def warm_up(self):
+        """访问主页以初始化会话"""
+        try:
+            self.send("GET", WEREAD_URL, headers=self.headers, timeout=30)
+            self.warmed_at = time.monotonic()
+        except CookieExpiredError:
+            raise
+        except Exception as error:
+            print(f"访问主页失败: {error}")
+
+    def ensure(self):
+        """保证会话可用，多个线程同时调用时只预热一次"""
+        if self.is_valid():
+            return
+        with self.lock:
+            if not self.is_valid():
+                self.warm_up()
+
+    def invalidate(self):
+        """标记会话失效，下次请求前重新预热"""
+        self.warmed_at = None
 
 
 class WeReadApi:
     def __init__(self):
+        self.cookie_cache = self.create_cookie_cache()
+        self.cookie_source = None
+        self.cookie_generation = 0
+        self.cookie_lock = threading.Lock()
+        self.local = threading.local()
         self.cookie = self.get_cookie()
+        # 设置WEREAD_BASE_URL可以连接到本地模拟的微信读书接口
+        self.base_url = (os.getenv("WEREAD_BASE_URL") or "").rstrip("/")
         self.session = requests.Session()
         self.session.cookies = self.parse_cookie_string()
+        self.mount_pool(DEFAULT_CONCURRENCY)
+        self.limiter = self.create_limiter()
+        self.throttle_errcodes = self.get_throttle_errcodes()
+        self.breaker = CookieCircuitBreaker(recover=self.refresh_cookie)
+        self.session_manager = WeReadSession(self.send, self.get_standard_headers())
+        self.cache = ResponseCache(account=get_account_key(self.cookie))
+        self.sync_state = SyncState()
+
+    def create_limiter(self):
+        """创建限流器，可通过环境变量调整初始速率和上限"""
+        max_concurrency = int(os.getenv("WEREAD_CONCURRENCY") or DEFAULT_CONCURRENCY)
+        return AIMDLimiter(
+            max_concurrency=max_concurrency,
+            initial_rate=float(os.getenv("WEREAD_RATE") or 2),
+            max_rate=float(os.getenv("WEREAD_MAX_RATE") or 20),
+        )
+
+    def get_throttle_errcodes(self):
+        """表示限流的错误码，环境变量中用逗号分隔"""
+        value = os.getenv("WEREAD_THROTTLE_ERRCODES")
+        if not value:
+            return DEFAULT_THROTTLE_ERRCODES
+        return tuple(int(x) for x in value.split(",") if x.strip())
+
+    def is_throttled(self, r, stream=False):
+        """状态码或者响应中的错误码说明微信读书在限流"""
+        if r.status_code in THROTTLE_STATUS_CODES:
+            return True
+        if stream or not r.ok:
+            # 流式响应不能提前读取，失败的响应由调用方处理错误码
+            return False
+        length = r.headers.get("Content-Length")
+        if length is None or int(length) > ERRCODE_CHECK_MAX_SIZE:
+            return False
+        try:
+            data = r.json()
+        except ValueError:
+            return False
+        return isinstance(data, dict) and data.get("errcode") in self.throttle_errcodes
+
+    def mount_pool(self, pool_size):
+        """设置连接池大小，保证并发请求时能复用连接"""
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
     def try_get_cloud_cookie(self, url, id, password):
         """从CookieCloud获取微信读书Cookie"""
@@ -119,33 +259,100 @@ class WeReadApi:
 
         return "; ".join(cookie_items)
 
-    def get_cookie(self):
-        """获取微信读书Cookie，优先级：环境变量Cookie Cloud > 环境变量WEREAD_COOKIE"""
-        cookie = None
-
-        # 1. 尝试环境变量中的Cookie Cloud配置
+    def get_cloud_config(self):
+        """环境变量中的Cookie Cloud配置"""
         url = os.getenv("CC_URL")
         if not url:
             url = "https://cc.chenge.ink"  # 使用默认服务器
-        id = os.getenv("CC_ID")
-        password = os.getenv("CC_PASSWORD")
+        return url, os.getenv("CC_ID"), os.getenv("CC_PASSWORD")
+
+    def create_cookie_cache(self):
+        """配置了Cookie Cloud或者WEREAD_COOKIE_CACHE_KEY时启用本地Cookie缓存"""
+        _, id, password = self.get_cloud_config()
+        secret = os.getenv("WEREAD_COOKIE_CACHE_KEY")
+        if not secret and id and password:
+            secret = f"{id}:{password}"
+        if not secret:
+            return None
+        return CookieCache(secret)
+
+    def get_cookie(self):
+        """获取微信读书Cookie，优先级：本地缓存 > 环境变量Cookie Cloud > 环境变量WEREAD_COOKIE"""
+        cookie = None
+
+        # 1. 尝试本地缓存的Cookie
+        if self.cookie_cache:
+            cookie = self.cookie_cache.load()
+            if cookie:
+                print("使用本地缓存的微信读书Cookie")
+                self.cookie_source = "cache"
+                return cookie
+
+        # 2. 尝试环境变量中的Cookie Cloud配置
+        url, id, password = self.get_cloud_config()
 
         if url and id and password:
             try:
                 cookie = self.try_get_cloud_cookie(url, id, password)
                 if cookie:
                     print("成功从Cookie Cloud获取微信读书Cookie")
+                    self.cookie_source = "cloud"
+                    if self.cookie_cache:
+                        self.cookie_cache.save(cookie)
                     return cookie
             except Exception as error:
                 print(f"使用Cookie Cloud获取Cookie失败: {error}")
 
-        # 2. 回退到环境变量中的直接Cookie
+        # 3. Cookie Cloud暂时不可用时，使用已过期的本地缓存
+        if self.cookie_cache:
+            cookie = self.cookie_cache.load(allow_expired=True)
+            if cookie:
+                print("Cookie Cloud不可用，使用本地缓存的微信读书Cookie")
+                self.cookie_source = "cache"
+                return cookie
+
+        # 4. 回退到环境变量中的直接Cookie
         env_cookie = os.getenv("WEREAD_COOKIE")
         if not env_cookie or not env_cookie.strip():
             raise Exception("没有找到cookie，请按照文档填写cookie或配置Cookie Cloud")
 
+        self.cookie_source = "env"
         return env_cookie
 
+    def refresh_cookie(self):
+        """缓存的Cookie被拒绝后重新获取，返回True表示可以用新的Cookie重试"""
+        generation = getattr(self.local, "cookie_generation", self.cookie_generation)
+        with self.cookie_lock:
+            if generation != self.cookie_generation:
+                # 其他请求已经刷新过Cookie
+                return True
+            if self.cookie_source != "cache":
+                return False
+            self.cookie_cache.invalidate()
+            self.cookie_source = "refreshed"
+            url, id, password = self.get_cloud_config()
+            cookie = None
+            if id and password:
+                cookie = self.try_get_cloud_cookie(url, id, password)
+            if not cookie:
+                cookie = os.getenv("WEREAD_COOKIE")
+            if not cookie or cookie == self.cookie:
+                return False
+            print("本地缓存的Cookie已失效，已重新获取微信读书Cookie")
+            self.cookie = cookie
+            self.session.cookies = self.parse_cookie_string()
+            self.cache.account = get_account_key(cookie)
+            self.cookie_cache.save(cookie)
+            self.cookie_generation += 1
+            self.session_manager.invalidate()
+            return True
+
+    def save_session_cookies(self):
+        """保存微信读书通过Set-Cookie刷新的Cookie"""
+        cookies = requests.utils.dict_from_cookiejar(self.session.cookies)
+        cookie = "; ".join(f"{key}={value}" for key, value in cookies.items())
+        self.cookie_cache.save(cookie)
+
     def parse_cookie_string(self):
         cookies_dict = {}
 
@@ -180,20 +387,48 @@ class WeReadApi:
 
     def visit_homepage(self):
         """访问主页以初始化会话"""
-        try:
-            self.session.get(
-                WEREAD_URL, headers=self.get_standard_headers(), timeout=30
-            )
-        except Exception as error:
-            print(f"访问主页失败: {error}")
-
+        self.session_manager.warm_up()
+
+    def send(self, method, url, **kwargs):
+        """经过限流器发送请求，超时、连接错误、限流状态码和限流错误码会让限流器降速
+
+        Cookie过期熔断后不再发送请求，直接抛出CookieExpiredError。
+        200响应中带有限流错误码时抛出WeReadThrottledError，由@retry退避后重试。
+        """
+        self.breaker.check()
+        url = self.resolve_url(url)
+        with self.limiter.slot() as slot:
+            self.breaker.check()
+            self.local.cookie_generation = self.cookie_generation
+            r = self.session.request(method, url, **kwargs)
+            throttled = self.is_throttled(r, kwargs.get("stream"))
+            if throttled:
+                slot.fail()
+        self.breaker.record_status(r.status_code)
+        if throttled and r.ok:
+            raise WeReadThrottledError(f"{url} 被限流: {r.text}")
+        if r.ok and r.cookies and self.cookie_cache:
+            self.save_session_cookies()
+        return r
+
+    def resolve_url(self, url):
+        """设置了WEREAD_BASE_URL时，把weread.qq.com和i.weread.qq.com替换成指定地址"""
+        if not self.base_url:
+            return url
+        return WEREAD_HOST_PATTERN.sub(self.base_url, url)
+
+    def request(self, method, url, **kwargs):
+        """发送请求，会话未预热或者已过期时先访问主页"""
+        self.session_manager.ensure()
+        return self.send(method, url, **kwargs)
+
+    @retry(**RETRY_OPTIONS)
     def get_bookshelf(self):
         """获取书架信息（存在笔记的书籍）"""
-        self.visit_homepage()
         headers = self.get_standard_headers()
         headers["Accept"] = "application/json, text/plain, */*"
 
-        r = self.session.get(WEREAD_NOTEBOOKS_URL, headers=headers)
+        r = self.request("GET", WEREAD_NOTEBOOKS_URL, headers=headers)
         if r.ok:
             return r.json()
         else:
@@ -201,13 +436,13 @@ class WeReadApi:
             self.handle_errcode(errcode)
             raise Exception(f"Could not get bookshelf {r.text}")
 
+    @retry(**RETRY_OPTIONS)
     def get_entire_shelf(self):
         """获取所有书架书籍信息"""
-        self.visit_homepage()
         headers = self.get_standard_headers()
         headers["Accept"] = "application/json, text/plain, */*"
 
-        r = self.session.get(WEREAD_SHELF_SYNC_URL, headers=headers)
+        r = self.request("GET", WEREAD_SHELF_SYNC_URL, headers=headers)
         if r.ok:
             return r.json()
         else:
@@ -215,20 +450,53 @@ class WeReadApi:
             self.handle_errcode(errcode)
             raise Exception(f"Could not get entire shelf {r.text}")
 
+    @retry(**RETRY_OPTIONS)
+    def open_stream(self, url, name):
+        """发送流式请求，只读取响应头，响应体由调用方逐块读取"""
+        headers = self.get_standard_headers()
+        headers["Accept"] = "application/json, text/plain, */*"
+
+        r = self.request("GET", url, headers=headers, stream=True)
+        if r.ok:
+            return r
+        else:
+            errcode = r.json().get("errcode", 0)
+            self.handle_errcode(errcode)
+            raise Exception(f"Could not get {name} {r.text}")
+
+    def iter_stream(self, url, name, keys):
+        """流式解析接口返回的JSON，逐个返回keys中各数组的元素 (key, item)"""
+        r = self.open_stream(url, name)
+        try:
+            yield from iter_json_items(r.iter_content(chunk_size=STREAM_CHUNK_SIZE), keys)
+        finally:
+            r.close()
+
+    def iter_bookshelf(self, keys=("books", "bookProgress", "archive")):
+        """流式获取书架信息（存在笔记的书籍），内存占用不随书籍数量增长"""
+        return self.iter_stream(WEREAD_NOTEBOOKS_URL, "bookshelf", keys)
+
+    def iter_entire_shelf(self, keys=("books", "bookProgress", "archive")):
+        """流式获取所有书架书籍信息"""
+        return self.iter_stream(WEREAD_SHELF_SYNC_URL, "entire shelf", keys)
+
+    def iter_notebooklist(self):
+        """流式获取笔记本列表，按接口返回的顺序逐本返回，不排序"""
+        for _, book in self.iter_stream(WEREAD_NOTEBOOKS_URL, "notebook list", ("books",)):
+            yield book
+
     def handle_errcode(self, errcode):
-        if errcode == -2012 or errcode == -2010:
-            print(
-                "::error::微信读书Cookie过期了，请参考文档重新设置。https://mp.weixin.qq.com/s/B_mqLUZv7M1rmXRsMlBf7A"
-            )
+        if errcode in AUTH_ERRCODES:
+            self.session_manager.invalidate()
+            self.breaker.trip(f"errcode {errcode}")
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
+    @retry(**RETRY_OPTIONS)
     def get_notebooklist(self):
         """获取笔记本列表"""
-        self.visit_homepage()
         headers = self.get_standard_headers()
         headers["Accept"] = "application/json, text/plain, */*"
 
-        r = self.session.get(WEREAD_NOTEBOOKS_URL, headers=headers)
+        r = self.request("GET", WEREAD_NOTEBOOKS_URL, headers=headers)
         if r.ok:
             data = r.json()
             books = data.get("books", [])
@@ -239,31 +507,51 @@ class WeReadApi:
             self.handle_errcode(errcode)
             raise Exception(f"Could not get notebook list {r.text}")
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
+    @retry(**RETRY_OPTIONS)
     def get_bookinfo(self, bookId):
         """获取书的详情"""
-        self.visit_homepage()
         headers = self.get_standard_headers()
         headers["Accept"] = "application/json, text/plain, */*"
 
         params = dict(bookId=bookId)
-        r = self.session.get(WEREAD_BOOK_INFO, params=params, headers=headers)
+        cached = self.cache.get("book_info", params)
+        if cached is not None:
+            return cached
+        r = self.request("GET", WEREAD_BOOK_INFO, params=params, headers=headers)
         if r.ok:
-            return r.json()
+            data = r.json()
+            self.cache.set("book_info", params, data)
+            return data
         else:
             errcode = r.json().get("errcode", 0)
             self.handle_errcode(errcode)
             print(f"Could not get book info {r.text}")
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
     def get_bookmark_list(self, bookId):
         """获取书籍的划线记录"""
-        self.visit_homepage()
+        return self.get_bookmark_changes(bookId, synckey=0).get("updated")
+
+    @retry(**RETRY_OPTIONS)
+    def get_bookmark_changes(self, bookId, synckey=None):
+        """获取书籍的划线变化
+
+        synckey为0时返回全部划线，否则只返回该synckey之后新增和删除的划线，
+        synckey为None时使用上次同步保存的值。
+        返回 {"updated": [...], "removed": [bookmarkId...], "synckey": 新的synckey,
+        "incremental": 是否为增量结果}
+        """
+        if synckey is None:
+            synckey = self.get_synckey(bookId, "bookmark")
         headers = self.get_standard_headers()
         headers["Accept"] = "application/json, text/plain, */*"
 
         params = dict(bookId=bookId)
-        r = self.session.get(WEREAD_BOOKMARKLIST_URL, params=params, headers=headers)
+        if synckey:
+            params["synckey"] = synckey
+        cached = self.cache.get("bookmark_list", params)
+        if cached is not None:
+            return cached
+        r = self.request("GET", WEREAD_BOOKMARKLIST_URL, params=params, headers=headers)
         if r.ok:
             data = r.json()
             bookmarks = data.get("updated", [])
@@ -273,64 +561,179 @@ class WeReadApi:
                 for mark in bookmarks
                 if mark.get("markText") and mark.get("chapterUid")
             ]
-            return bookmarks
+            changes = self.make_changes(
+                bookmarks, data.get("removed"), "bookmarkId", synckey, data
+            )
+            self.cache.set("bookmark_list", params, changes)
+            return changes
         else:
             errcode = r.json().get("errcode", 0)
             self.handle_errcode(errcode)
             raise Exception(f"Could not get {bookId} bookmark list")
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
+    @retry(**RETRY_OPTIONS)
     def get_read_info(self, bookId):
         """获取阅读进度"""
-        self.visit_homepage()
         headers = self.get_standard_headers()
         headers["Accept"] = "application/json, text/plain, */*"
 
         params = dict(bookId=bookId)
-        r = self.session.get(WEREAD_READ_INFO_URL, headers=headers, params=params)
+        cached = self.cache.get("read_info", params)
+        if cached is not None:
+            return cached
+        r = self.request("GET", WEREAD_READ_INFO_URL, headers=headers, params=params)
         if r.ok:
-            return r.json()
+            data = r.json()
+            self.cache.set("read_info", params, data)
+            return data
         else:
             errcode = r.json().get("errcode", 0)
             self.handle_errcode(errcode)
             raise Exception(f"get {bookId} read info failed {r.text}")
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
     def get_review_list(self, bookId):
         """获取笔记/想法列表"""
-        self.visit_homepage()
+        return self.get_review_changes(bookId, synckey=0).get("updated")
+
+    def iter_review_list(self, bookId, synckey=0, page_size=None):
+        """分页逐条返回笔记/想法，适合笔记很多的书籍"""
+        for data in self.iter_review_pages(bookId, synckey, page_size):
+            yield from self.parse_reviews(data.get("reviews", []))
+
+    def get_review_delta(self, bookId):
+        """增量同步时获取笔记的变化
+
+        没有保存的syncKey时不预先获取，返回的updated为None，
+        由调用方用iter_review_changes分页逐条获取，不在内存中保存整本书的笔记。
+        """
+        synckey = self.get_synckey(bookId, "review")
+        if synckey:
+            return self.get_review_changes(bookId, synckey)
+        return {"updated": None, "removed": [], "synckey": None, "incremental": False}
+
+    def iter_review_changes(self, bookId, changes):
+        """分页逐条返回全部笔记，遍历完成后把最后一页的syncKey写入changes"""
+        for data in self.iter_review_pages(bookId):
+            yield from self.parse_reviews(data.get("reviews", []))
+            changes["synckey"] = (
+                data.get("synckey") or data.get("syncKey") or changes.get("synckey")
+            )
+
+    def get_review_changes(self, bookId, synckey=None):
+        """获取笔记/想法的变化，参数和返回值同get_bookmark_changes"""
+        if synckey is None:
+            synckey = self.get_synckey(bookId, "review")
+        params = dict(bookId=bookId, listType=4, listMode=2, syncKey=synckey)
+        cached = self.cache.get("review_list", params)
+        if cached is not None:
+            return cached
+        reviews = []
+        removed = []
+        last_page = {}
+        for data in self.iter_review_pages(bookId, synckey):
+            reviews.extend(self.parse_reviews(data.get("reviews", [])))
+            removed.extend(data.get("removed") or [])
+            last_page = data
+        changes = self.make_changes(reviews, removed, "reviewId", synckey, last_page)
+        self.cache.set("review_list", params, changes)
+        return changes
+
+    def parse_reviews(self, items):
+        """把接口返回的笔记转换成正确的格式"""
+        reviews = [x.get("review") for x in items if x.get("review")]
+
+        # 为书评添加chapterUid
+        return [
+            {"chapterUid": 1000000, **x} if x.get("type") == 4 else x for x in reviews
+        ]
+
+    def get_review_page_size(self):
+        """每页笔记数量，可通过环境变量WEREAD_REVIEW_PAGE_SIZE配置，0表示一次获取全部"""
+        return int(os.getenv("WEREAD_REVIEW_PAGE_SIZE") or DEFAULT_REVIEW_PAGE_SIZE)
+
+    @retry(**RETRY_OPTIONS)
+    def get_review_page(self, bookId, maxIdx=0, count=0, synckey=0):
+        """获取一页笔记/想法，返回接口的原始数据"""
         headers = self.get_standard_headers()
         headers["Accept"] = "application/json, text/plain, */*"
 
         params = dict(
-            bookId=bookId, listType=4, maxIdx=0, count=0, listMode=2, syncKey=0
+            bookId=bookId,
+            listType=4,
+            maxIdx=maxIdx,
+            count=count,
+            listMode=2,
+            syncKey=synckey,
         )
-        r = self.session.get(WEREAD_REVIEW_LIST_URL, params=params, headers=headers)
+        r = self.request("GET", WEREAD_REVIEW_LIST_URL, params=params, headers=headers)
         if r.ok:
-            data = r.json()
-            reviews = data.get("reviews", [])
-            # 转换成正确的格式
-            reviews = [x.get("review") for x in reviews if x.get("review")]
-
-            # 为书评添加chapterUid
-            reviews = [
-                {"chapterUid": 1000000, **x} if x.get("type") == 4 else x
-                for x in reviews
-            ]
-            return reviews
+            return r.json()
         else:
             errcode = r.json().get("errcode", 0)
             self.handle_errcode(errcode)
             raise Exception(f"get {bookId} review list failed {r.text}")
 
+    def iter_review_pages(self, bookId, synckey=0, page_size=None):
+        """按maxIdx/count游标分页获取笔记，处理当前页时在后台预取下一页
+
+        每一页都单独重试，失败时从这一页的游标继续，不会从头开始。
+        """
+        if page_size is None:
+            page_size = self.get_review_page_size()
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            future = executor.submit(self.get_review_page, bookId, 0, page_size, synckey)
+            fetched = 0
+            seen = set()
+            while future is not None:
+                data = future.result()
+                items = data.get("reviews", [])
+                ids = {x.get("review", {}).get("reviewId") for x in items}
+                new_ids = ids - seen
+                seen |= ids
+                fetched += len(items)
+                future = None
+                # 没有更多数据，或者接口返回了重复的数据时停止翻页
+                if page_size and data.get("hasMore") and items and new_ids:
+                    # 游标优先使用最后一条的idx，没有时按已经获取的数量
+                    maxIdx = items[-1].get("idx") or fetched
+                    future = executor.submit(
+                        self.get_review_page, bookId, maxIdx, page_size, synckey
+                    )
+                yield data
+        finally:
+            executor.shutdown(wait=False)
+
+    def get_synckey(self, bookId, name):
+        """上次同步保存的synckey，关闭增量同步时返回0"""
+        if os.getenv("WEREAD_INCREMENTAL", "1").lower() in ("0", "false", "off"):
+            return 0
+        return self.sync_state.get(bookId, name)
+
+    def make_changes(self, updated, removed, id_key, synckey, data):
+        """整理增量接口的返回结果，删除的记录可能是ID也可能是对象"""
+        removed_ids = []
+        for item in removed or []:
+            if isinstance(item, dict):
+                item = item.get(id_key)
+            if item:
+                removed_ids.append(str(item))
+        new_synckey = data.get("synckey") or data.get("syncKey")
+        return {
+            "updated": updated,
+            "removed": removed_ids,
+            "synckey": new_synckey,
+            # 接口没有返回synckey时无法判断是否为增量结果，按全量处理
+            "incremental": bool(synckey) and bool(new_synckey),
+        }
+
     def get_best_reviews(self, bookId, count=10, maxIdx=0, synckey=0):
         """获取热门书评"""
-        self.visit_homepage()
         headers = self.get_standard_headers()
         headers["Accept"] = "application/json, text/plain, */*"
 
         params = dict(bookId=bookId, synckey=synckey, maxIdx=maxIdx, count=count)
-        r = self.session.get(WEREAD_BEST_REVIEW_URL, params=params, headers=headers)
+        r = self.request("GET", WEREAD_BEST_REVIEW_URL, params=params, headers=headers)
         if r.ok:
             return r.json()
         else:
@@ -338,9 +741,9 @@ class WeReadApi:
             self.handle_errcode(errcode)
             raise Exception(f"get {bookId} best reviews failed {r.text}")
 
+    @retry(**RETRY_OPTIONS)
     def get_api_data(self):
-        self.session.get(WEREAD_URL)
-        r = self.session.get(WEREAD_HISTORY_URL)
+        r = self.request("GET", WEREAD_HISTORY_URL)
         if r.ok:
             return r.json()
         else:
@@ -348,47 +751,79 @@ class WeReadApi:
             self.handle_errcode(errcode)
             raise Exception(f"get history data failed {r.text}")
 
-    @retry(stop_max_attempt_number=3, wait_fixed=5000)
+    def get_chapter_headers(self, bookId):
+        """获取章节接口的请求头 - 模拟浏览器行为，会话由request统一预热"""
+        return {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36",
+            "Content-Type": "application/json;charset=UTF-8",
+            "Accept": "application/json, text/plain, */*",
+            "Origin": "https://weread.qq.com",
+            "Referer": f"https://weread.qq.com/web/reader/{bookId}",
+            "Sec-Fetch-Dest": "empty",
+            "Sec-Fetch-Mode": "cors",
+            "Sec-Fetch-Site": "same-origin",
+        }
+
+    def parse_chapter_update(self, update):
+        """添加点评章节，并以字符串形式的chapterUid作为键"""
+        update.append(
+            {
+                "chapterUid": 1000000,
+                "chapterIdx": 1000000,
+                "updateTime": 1683825006,
+                "readAhead": 0,
+                "title": "点评",
+                "level": 1,
+            }
+        )
+        # 确保chapterUid始终以字符串形式作为键
+        return {str(item["chapterUid"]): item for item in update}
+
+    def raise_chapter_error(self, data):
+        """章节接口没有返回章节时，处理错误码并抛出异常"""
+        if isinstance(data, dict) and data.get("errCode"):
+            self.handle_errcode(data["errCode"])
+            raise Exception(
+                f"API返回错误: {data.get('errMsg', 'Unknown error')} (code: {data['errCode']})"
+            )
+        elif isinstance(data, dict) and data.get("errcode"):
+            self.handle_errcode(data["errcode"])
+            raise Exception(
+                f"API返回错误: {data.get('errmsg', 'Unknown error')} (code: {data['errcode']})"
+            )
+        else:
+            raise Exception("获取章节信息失败，返回格式不符合预期")
+
+    def raise_chapter_failure(self, r):
+        """章节接口请求失败时，处理响应中的错误码并抛出异常"""
+        try:
+            data = r.json()
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and (data.get("errCode") or data.get("errcode")):
+            self.raise_chapter_error(data)
+        raise Exception(f"get chapter info failed {r.status_code} {r.text}")
+
+    @retry(**RETRY_OPTIONS)
     def get_chapter_info(self, bookId):
         """获取章节信息"""
+        cached = self.cache.get("chapter_info", dict(bookId=bookId))
+        if cached is not None:
+            return self.parse_chapter_update(cached)
         try:
-            # 1. 首先访问主页，确保会话有效
-            self.visit_homepage()
-
-            # 2. 获取笔记本列表，进一步初始化会话
-            self.get_notebooklist()
-
-            # 3. 添加随机延迟，模拟真实用户行为
-            import random
-            import time
-
-            delay = 1 + random.random() * 2  # 1-3秒随机延迟
-            time.sleep(delay)
-
-            # 4. 准备请求头 - 模拟浏览器行为
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36",
-                "Content-Type": "application/json;charset=UTF-8",
-                "Accept": "application/json, text/plain, */*",
-                "Origin": "https://weread.qq.com",
-                "Referer": f"https://weread.qq.com/web/reader/{bookId}",
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-origin",
-            }
+            headers = self.get_chapter_headers(bookId)
 
-            # 5. 使用正确的请求体格式
+            # 使用正确的请求体格式
             body = {"bookIds": [bookId]}
 
-            # 6. 发送请求
-            r = self.session.post(
-                WEREAD_CHAPTER_INFO, json=body, headers=headers, timeout=60
+            r = self.request(
+                "POST", WEREAD_CHAPTER_INFO, json=body, headers=headers, timeout=60
             )
 
             if r.ok:
                 data = r.json()
 
-                # 7. 处理结果 - 增加多种可能的响应格式处理
+                # 处理结果 - 增加多种可能的响应格式处理
                 update = None
 
                 # 格式1: {data: [{bookId: "xxx", updated: []}]}
@@ -415,35 +850,11 @@ class WeReadApi:
                     update = data
 
                 if update:
-                    # 添加点评章节
-                    update.append(
-                        {
-                            "chapterUid": 1000000,
-                            "chapterIdx": 1000000,
-                            "updateTime": 1683825006,
-                            "readAhead": 0,
-                            "title": "点评",
-                            "level": 1,
-                        }
-                    )
-
-                    # 确保chapterUid始终以字符串形式作为键
-                    result = {str(item["chapterUid"]): item for item in update}
-                    return result
-                elif data.get("errCode"):
-                    self.handle_errcode(data["errCode"])
-                    raise Exception(
-                        f"API返回错误: {data.get('errMsg', 'Unknown error')} (code: {data['errCode']})"
-                    )
-                elif data.get("errcode"):
-                    self.handle_errcode(data["errcode"])
-                    raise Exception(
-                        f"API返回错误: {data.get('errmsg', 'Unknown error')} (code: {data['errcode']})"
-                    )
-                else:
-                    raise Exception("获取章节信息失败，返回格式不符合预期")
+                    self.cache.set("chapter_info", dict(bookId=bookId), update)
+                    return self.parse_chapter_update(update)
+                self.raise_chapter_error(data)
             else:
-                raise Exception(f"get {bookId} chapter info failed {r.text}")
+                self.raise_chapter_failure(r)
 
         except Exception as error:
             print(f"获取章节信息失败: {error}")
@@ -451,6 +862,69 @@ class WeReadApi:
                 print(f"状态码: {error.response.status_code}")
             raise error
 
+    def get_chapter_batch_size(self):
+        """每次请求的书籍数量，可通过环境变量WEREAD_CHAPTER_BATCH_SIZE配置"""
+        chunk_size = os.getenv("WEREAD_CHAPTER_BATCH_SIZE") or DEFAULT_CHAPTER_BATCH_SIZE
+        return max(1, int(chunk_size))
+
+    def split_book_ids(self, bookIds, chunk_size=None):
+        """按chunk_size对书籍ID分组"""
+        if chunk_size is None:
+            chunk_size = self.get_chapter_batch_size()
+        bookIds = list(bookIds)
+        return [bookIds[i : i + chunk_size] for i in range(0, len(bookIds), chunk_size)]
+
+    @retry(**RETRY_OPTIONS)
+    def get_chapter_info_batch(self, bookIds):
+        """一次请求获取多本书的章节信息，返回 bookId -> {chapterUid: chapter}"""
+        bookIds = list(bookIds)
+        headers = self.get_chapter_headers(bookIds[0])
+        body = {"bookIds": bookIds}
+        r = self.request(
+            "POST", WEREAD_CHAPTER_INFO, json=body, headers=headers, timeout=60
+        )
+        if not r.ok:
+            self.raise_chapter_failure(r)
+        data = r.json()
+        # 格式: {data: [{bookId: "xxx", updated: []}, ...]}
+        items = data.get("data") if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            self.raise_chapter_error(data)
+        result = {}
+        for item in items:
+            bookId = str(item.get("bookId"))
+            if bookId in bookIds and item.get("updated"):
+                self.cache.set("chapter_info", dict(bookId=bookId), item["updated"])
+                result[bookId] = self.parse_chapter_update(item["updated"])
+        return result
+
+    def get_cached_chapter_infos(self, bookIds):
+        """从缓存中读取章节信息，返回命中的结果和未命中的书籍ID"""
+        result = {}
+        missing = []
+        for bookId in bookIds:
+            cached = self.cache.get("chapter_info", dict(bookId=bookId))
+            if cached is not None:
+                result[bookId] = self.parse_chapter_update(cached)
+            else:
+                missing.append(bookId)
+        return result, missing
+
+    def get_chapter_infos(self, bookIds, chunk_size=None):
+        """分批获取多本书的章节信息，返回 bookId -> {chapterUid: chapter}
+
+        接口没有返回的书籍不会出现在结果中，调用方可以再用get_chapter_info单独获取。
+        """
+        result, bookIds = self.get_cached_chapter_infos(bookIds)
+        for chunk in self.split_book_ids(bookIds, chunk_size):
+            try:
+                result.update(self.get_chapter_info_batch(chunk))
+            except CookieExpiredError:
+                raise
+            except Exception as error:
+                print(f"批量获取章节信息失败: {error}")
+        return result
+
     def transform_id(self, book_id):
         id_length = len(book_id)
         if re.match("^\\d*$", book_id):
@@ -492,3 +966,103 @@ class WeReadApi:
 
     def get_url(self, book_id):
         return f"https://weread.qq.com/web/reader/{self.calculate_book_str_id(book_id)}"
+
+
+class AsyncWeReadApi:
+    """WeReadApi的异步版本，多本书的请求可以并发执行
+
+    请求仍然由WeReadApi完成，返回结果的解析和错误处理保持一致，
+    并发数由concurrency或者环境变量WEREAD_CONCURRENCY控制。
+    """
+
+    def __init__(self, weread_api=None, concurrency=None):
+        self.api = weread_api if weread_api else WeReadApi()
+        if concurrency is None:
+            concurrency = int(os.getenv("WEREAD_CONCURRENCY") or DEFAULT_CONCURRENCY)
+        self.concurrency = max(1, concurrency)
+        self.api.mount_pool(self.concurrency)
+        self.api.limiter.max_concurrency = self.concurrency
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+    async def run(self, func, *args):
+        """在线程池中执行同步请求，Cookie过期熔断后不再提交新的请求"""
+        self.api.breaker.check()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def get_bookinfo(self, bookId):
+        return await self.run(self.api.get_bookinfo, bookId)
+
+    async def get_read_info(self, bookId):
+        return await self.run(self.api.get_read_info, bookId)
+
+    async def get_bookmark_list(self, bookId):
+        return await self.run(self.api.get_bookmark_list, bookId)
+
+    async def get_review_list(self, bookId):
+        return await self.run(self.api.get_review_list, bookId)
+
+    async def get_bookmark_changes(self, bookId):
+        return await self.run(self.api.get_bookmark_changes, bookId)
+
+    async def get_review_changes(self, bookId):
+        return await self.run(self.api.get_review_changes, bookId)
+
+    async def get_review_delta(self, bookId):
+        return await self.run(self.api.get_review_delta, bookId)
+
+    async def get_chapter_info(self, bookId):
+        return await self.run(self.api.get_chapter_info, bookId)
+
+    async def get_chapter_infos(self, bookIds, chunk_size=None):
+        """并发请求各批次的章节信息，返回 bookId -> {chapterUid: chapter}"""
+        chapters, bookIds = self.api.get_cached_chapter_infos(bookIds)
+        chunks = self.api.split_book_ids(bookIds, chunk_size)
+        results = await asyncio.gather(
+            *[self.run(self.api.get_chapter_info_batch, chunk) for chunk in chunks],
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, CookieExpiredError):
+                raise result
+            if isinstance(result, Exception):
+                print(f"批量获取章节信息失败: {result}")
+            else:
+                chapters.update(result)
+        return chapters
+
+    def get_chapter_infos_sync(self, bookIds, chunk_size=None):
+        """在同步代码中调用get_chapter_infos"""
+        return asyncio.run(self.get_chapter_infos(bookIds, chunk_size))
+
+    async def fetch_book(self, bookId, method_names):
+        """获取一本书的多项数据，出错的项返回异常对象"""
+        results = await asyncio.gather(
+            *[getattr(self, name)(bookId) for name in method_names],
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, CookieExpiredError):
+                raise result
+        return dict(zip(method_names, results))
+
+    async def fetch_books(self, bookIds, method_names):
+        """并发获取多本书的数据，返回 bookId -> {方法名: 结果}
+
+        Cookie过期时取消所有还没有开始的请求并抛出CookieExpiredError。
+        """
+        tasks = [
+            asyncio.ensure_future(self.fetch_book(bookId, method_names))
+            for bookId in bookIds
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        except CookieExpiredError:
+            for task in tasks:
+                task.cancel()
+            raise
+        return dict(zip(bookIds, results))
+
+    def fetch_books_sync(self, bookIds, method_names):
+        """在同步代码中调用fetch_books"""
+        return asyncio.run(self.fetch_books(bookIds, method_names))
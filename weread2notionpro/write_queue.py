@@ -0,0 +1,233 @@
+import collections
+import json
+import os
+import queue
+import sqlite3
+import threading
+
+from weread2notionpro.notion_mirror import normalize_id
+from weread2notionpro.utils import get_data_path
+
+DEFAULT_PROGRESS_INTERVAL = 50
+
+
+class WriteBehindQueue:
+    """划线、笔记和章节数据库记录的后台写入队列
+
+    记录先写入本地SQLite再由多个线程并发写入Notion，写入成功后删除，
+    进程中断时没有写入的记录会在下次运行时继续写入。
+    所有请求都经过NotionScheduler，优先级低于块的写入，
+    所以下一本书追加块不需要等待上一本书的记录写完。
+    """
+
+    def __init__(self, notion_helper, path=None, workers=None, on_written=None):
+        self.notion_helper = notion_helper
+        # 记录写入成功后的回调，参数为 (书籍页面ID, 记录)
+        self.on_written = on_written
+        self.path = path if path else get_data_path("write_queue.sqlite")
+        if workers is None:
+            workers = int(
+                os.getenv("NOTION_WRITE_WORKERS")
+                or notion_helper.scheduler.max_concurrency
+            )
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rows (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                page_id TEXT,
+                payload TEXT,
+                recovered INTEGER DEFAULT 0
+            )
+            """
+        )
+        # 上次运行没有写完的记录，写入前先检查是否已经存在
+        self.conn.execute("UPDATE rows SET recovered = 1")
+        self.conn.commit()
+        self.queue = queue.Queue()
+        self.stats = {"done": 0, "failed": 0, "total": 0}
+        # 每本书还没有写完的记录数、有记录写入失败的书籍和写完后的回调
+        self.pending = collections.Counter()
+        self.failed_pages = set()
+        self.callbacks = {}
+        for _ in range(max(1, workers)):
+            threading.Thread(target=self.run_worker, daemon=True).start()
+
+    def resume(self):
+        """继续写入上次运行没有写完的记录
+
+        进程被终止前这些记录可能已经写入Notion但是没有来得及从本地删除，
+        所以先从Notion刷新本地镜像，写入前再由find_row检查是否已经存在。
+        """
+        with self.lock:
+            pending = self.conn.execute(
+                "SELECT id FROM rows WHERE recovered = 1 ORDER BY id"
+            ).fetchall()
+        if not pending:
+            return
+        print(f"继续写入上次没有完成的{len(pending)}条记录")
+        with self.lock:
+            for (page_id,) in self.conn.execute(
+                "SELECT page_id FROM rows WHERE recovered = 1"
+            ):
+                self.pending[page_id] += 1
+        helper = self.notion_helper
+        if helper.mirror is not None:
+            for database_id in (
+                helper.bookmark_database_id,
+                helper.review_database_id,
+                helper.chapter_database_id,
+            ):
+                helper.refresh_mirror(database_id)
+        for (row_id,) in pending:
+            with self.lock:
+                self.stats["total"] += 1
+            self.queue.put(row_id)
+
+    def put(self, page_id, value):
+        """添加一条划线、笔记或者章节记录，page_id为书籍页面的ID"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO rows (page_id, payload) VALUES (?, ?)",
+                (page_id, json.dumps(value, ensure_ascii=False)),
+            )
+            self.conn.commit()
+            self.stats["total"] += 1
+            self.pending[page_id] += 1
+        self.queue.put(cursor.lastrowid)
+
+    def after_written(self, page_id, callback):
+        """这本书的记录全部写入后调用callback，有记录写入失败时不调用
+
+        没有等待写入的记录时立即调用。
+        """
+        with self.lock:
+            if self.pending[page_id] > 0:
+                self.callbacks.setdefault(page_id, []).append(callback)
+                return
+            if page_id in self.failed_pages:
+                return
+        callback()
+
+    def finish(self, page_id, ok):
+        """一条记录处理完成，这本书的记录全部处理完时调用回调"""
+        with self.lock:
+            if not ok:
+                self.failed_pages.add(page_id)
+            self.pending[page_id] -= 1
+            if self.pending[page_id] > 0:
+                return
+            del self.pending[page_id]
+            callbacks = self.callbacks.pop(page_id, [])
+            if page_id in self.failed_pages:
+                return
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as error:
+                print(f"记录写入后的处理失败: {error}")
+
+    def load(self, row_id):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT page_id, payload, recovered FROM rows WHERE id = ?", (row_id,)
+            ).fetchone()
+
+    def remove(self, row_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM rows WHERE id = ?", (row_id,))
+            self.conn.commit()
+
+    def get_target(self, value):
+        """返回 (数据库ID, 业务字段)"""
+        helper = self.notion_helper
+        if "bookmarkId" in value:
+            return helper.bookmark_database_id, "bookmarkId"
+        if "reviewId" in value:
+            return helper.review_database_id, "reviewId"
+        return helper.chapter_database_id, "chapterUid"
+
+    def find_row(self, page_id, value):
+        """查找已经写入Notion的记录，返回记录的页面ID
+
+        优先使用本地镜像，没有启用镜像时按业务字段查询Notion。
+        """
+        mirror = self.notion_helper.mirror
+        database_id, key = self.get_target(value)
+        if mirror is None:
+            type = "rich_text" if key != "chapterUid" else "number"
+            filter = {
+                "and": [
+                    {"property": key, type: {"equals": value.get(key)}},
+                    {"property": "书籍", "relation": {"contains": page_id}},
+                ]
+            }
+            results = self.notion_helper.query_database(database_id, filter, [key])
+            return results[0].get("id") if results else None
+        for result in mirror.get_by_key(database_id, key, value.get(key)):
+            relation = result.get("properties", {}).get("书籍", {}).get("relation", [])
+            if normalize_id(page_id) in [normalize_id(x.get("id")) for x in relation]:
+                return result.get("id")
+        return None
+
+    def write(self, page_id, value):
+        helper = self.notion_helper
+        if "bookmarkId" in value:
+            helper.insert_bookmark(page_id, value)
+        elif "reviewId" in value:
+            helper.insert_review(page_id, value)
+        else:
+            helper.insert_chapter(page_id, value)
+
+    def run_worker(self):
+        while True:
+            row_id = self.queue.get()
+            row = None
+            ok = False
+            try:
+                row = self.load(row_id)
+                if row is not None:
+                    page_id, payload, recovered = row
+                    value = json.loads(payload)
+                    row_page_id = None
+                    check_existing = any(
+                        value.get(x) for x in ("recreated", "changed", "resumed")
+                    )
+                    if recovered or check_existing:
+                        row_page_id = self.find_row(page_id, value)
+                    if row_page_id is None:
+                        self.write(page_id, value)
+                    elif value.get("recreated") or value.get("changed"):
+                        # 记录已经存在，块被重新插入或者内容被修改，更新记录
+                        self.notion_helper.update_note(row_page_id, page_id, value)
+                    if self.on_written:
+                        self.on_written(page_id, value)
+                    self.remove(row_id)
+                    ok = True
+                    self.report("done")
+            except Exception as error:
+                # 保留在本地，下次运行时重新写入
+                print(f"写入记录失败，下次运行时重试: {error}")
+                self.report("failed")
+            finally:
+                if row is not None:
+                    self.finish(row[0], ok)
+                self.queue.task_done()
+
+    def report(self, name):
+        with self.lock:
+            self.stats[name] += 1
+            finished = self.stats["done"] + self.stats["failed"]
+            if (
+                finished % DEFAULT_PROGRESS_INTERVAL == 0
+                or finished == self.stats["total"]
+            ):
+                print(
+                    f"已写入{self.stats['done']}条记录，失败{self.stats['failed']}条，"
+                    f"共{self.stats['total']}条"
+                )
+
+    def join(self):
+        """等待所有记录写入完成"""
+        self.queue.join()